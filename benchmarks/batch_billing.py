@@ -0,0 +1,102 @@
+"""
+Batch billing: set-based ``generate_bills`` against a per-appointment loop.
+
+Runs on a fresh, migrated and seeded database file in a temporary
+directory (the project's db.sqlite3 is never touched). All bills are
+removed, then every completed appointment is billed twice: once with one
+``Billing.objects.create`` per appointment, as a loop over the
+appointments would, and once with ``generate_bills``. Usage::
+
+    python benchmarks/batch_billing.py --patients 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+    from hospital_patient_management import settings
+
+    for alias in settings.DATABASES.values():
+        alias['NAME'] = path
+    import django
+    django.setup()
+
+
+def clear_bills():
+    from django.db import connection, transaction
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM patients_billing')
+
+
+def per_row():
+    """One query for the appointment, one for its tariff and one insert per bill."""
+    from datetime import timedelta
+
+    from patients.billing import unbilled
+    from patients.models import Billing, Tariff
+
+    count = 0
+    for appointment in unbilled().select_related('doctor'):
+        doctor = appointment.doctor
+        tariff = (
+            Tariff.objects.filter(department_id=doctor.department_id, specialization=doctor.specialization).first()
+            or Tariff.objects.filter(department_id=doctor.department_id, specialization='').first()
+            or Tariff.objects.filter(department=None, specialization=doctor.specialization).first()
+            or Tariff.objects.filter(department=None, specialization='').first()
+        )
+        Billing.objects.create(
+            patient_id=appointment.patient_id, appointment=appointment, amount=tariff.amount,
+            payment_status="Pending",
+            billing_date=appointment.date + timedelta(minutes=appointment.duration_minutes),
+        )
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(os.path.join(tmp, 'bench.sqlite3'))
+        from django.core.management import call_command
+
+        from patients import billing
+        from patients.models import Department, Tariff
+
+        call_command('migrate', verbosity=0)
+        call_command('seed_hospital', patients=args.patients, doctors=40, verbosity=0)
+        Tariff.objects.create(amount=1500)
+        Tariff.objects.bulk_create(
+            Tariff(department_id=pk, amount=2000 + 100 * index)
+            for index, pk in enumerate(Department.objects.values_list('pk', flat=True))
+        )
+
+        clear_bills()
+        started = time.perf_counter()
+        looped = per_row()
+        loop_seconds = time.perf_counter() - started
+
+        clear_bills()
+        started = time.perf_counter()
+        result = billing.generate_bills(chunk_size=args.chunk_size)
+        batch_seconds = time.perf_counter() - started
+
+    print(f"{'method':<16} {'bills':>8} {'seconds':>8} {'bills/s':>10}")
+    for label, count, seconds in (('per appointment', looped, loop_seconds),
+                                  ('generate_bills', result['billed'], batch_seconds)):
+        print(f"{label:<16} {count:>8} {seconds:>8.2f} {count / seconds:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
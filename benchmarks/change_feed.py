@@ -0,0 +1,91 @@
+"""
+Delta sync cost: /api/changes/ after a few writes, against a full download.
+
+Runs on a fresh, migrated and seeded database file in a temporary
+directory (the project's db.sqlite3 is never touched). A client first
+syncs everything from ``since=0``; then ``--writes`` patients are edited
+and one appointment deleted, and the delta sync is timed next to
+re-downloading every appointment and patient page by page. Usage::
+
+    python benchmarks/change_feed.py --patients 5000 --writes 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+    from hospital_patient_management import settings
+
+    for alias in settings.DATABASES.values():
+        alias['NAME'] = path
+    settings.MIDDLEWARE = []
+    import django
+    django.setup()
+
+
+def timed(client, urls):
+    """Seconds, response bytes and requests to fetch ``urls`` and every page they link to."""
+    started = time.perf_counter()
+    size = requests = 0
+    pending = list(urls)
+    while pending:
+        response = client.get(pending.pop())
+        assert response.status_code == 200, response.status_code
+        size += len(response.content)
+        requests += 1
+        data = response.json()
+        if data.get('next'):
+            pending.append(data['next'])
+        if data.get('more'):
+            pending.append(f"/api/changes/?since={data['through']}&limit=5000")
+    return time.perf_counter() - started, size, requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--writes', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(os.path.join(tmp, 'bench.sqlite3'))
+        from django.core.management import call_command
+        from django.test import Client
+
+        from patients import changes
+        from patients.management.commands.benchmark_api import host
+        from patients.models import Appointment, Patient
+
+        call_command('migrate', verbosity=0)
+        call_command('seed_hospital', patients=args.patients, doctors=40, verbosity=0)
+        client = Client(SERVER_NAME=host(), HTTP_ACCEPT='application/json')
+
+        full = timed(client, ['/api/changes/?since=0&limit=5000'])
+        since = changes.current()[0]
+        for patient in Patient.objects.order_by('?')[:args.writes]:
+            patient.address = 'Moved'
+            patient.save()
+        Appointment.objects.order_by('?').first().delete()
+
+        delta = timed(client, [f'/api/changes/?since={since}'])
+        lists = timed(client, ['/api/patients/?pagination=cursor&page_size=1000',
+                               '/api/appointments/?pagination=cursor&page_size=1000'])
+
+    print(f"{'sync':<28} {'requests':>9} {'KiB':>10} {'ms':>10}")
+    for label, (seconds, size, requests) in (
+        ('initial, since=0', full),
+        (f'delta after {args.writes + 1} changes', delta),
+        ('patients + appointments', lists),
+    ):
+        print(f"{label:<28} {requests:>9} {size / 1024:>10.1f} {seconds * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
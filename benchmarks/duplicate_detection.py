@@ -0,0 +1,96 @@
+"""
+Duplicate patient detection: blocked scoring against naive pairwise scoring.
+
+Runs on a fresh, migrated and seeded database file in a temporary
+directory (the project's db.sqlite3 is never touched). ``--duplicates``
+re-registrations of random patients (names swapped, phone reformatted,
+new email, typo in the address) are saved one by one, timing the
+incremental check each save runs; then every patient is re-keyed and
+re-scored as ``find_duplicate_patients --rebuild`` does. The naive cost
+is scoring a sample of all pairs, extrapolated to n(n-1)/2. Usage::
+
+    python benchmarks/duplicate_detection.py --patients 20000 --duplicates 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+    from hospital_patient_management import settings
+
+    for alias in settings.DATABASES.values():
+        alias['NAME'] = path
+    import django
+    django.setup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--duplicates', type=int, default=200)
+    parser.add_argument('--sample', type=int, default=50000, help="Pairs scored to estimate the naive cost.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(os.path.join(tmp, 'bench.sqlite3'))
+        from django.core.management import call_command
+
+        from patients import duplicates
+        from patients.models import Patient, SuspectedDuplicate
+
+        call_command('migrate', verbosity=0)
+        call_command('seed_hospital', patients=args.patients, doctors=40, verbosity=0)
+        rng = random.Random(7)
+        profiles = list(Patient.objects.values('id', *duplicates.FIELDS))
+
+        started = time.perf_counter()
+        for a, b in zip(rng.choices(profiles, k=args.sample), rng.choices(profiles, k=args.sample)):
+            duplicates.similarity(a, b)
+        per_pair = (time.perf_counter() - started) / args.sample
+        naive = per_pair * len(profiles) * (len(profiles) - 1) / 2
+
+        originals = rng.sample(profiles, args.duplicates)
+        latencies = []
+        for i, original in enumerate(originals):
+            patient = Patient(
+                first_name=original['last_name'], last_name=original['first_name'],
+                date_of_birth=original['date_of_birth'], email=f'again{i}@example.org',
+                phone_number='+254' + original['phone_number'][-9:],
+                address=original['address'].replace(' ', '  ', 1) + '.',
+            )
+            Patient.objects.bulk_create([patient])  # No post_save: only the check is timed.
+            started = time.perf_counter()
+            duplicates.refresh([patient])
+            latencies.append(time.perf_counter() - started)
+            original['copy'] = patient.pk
+        found = sum(
+            SuspectedDuplicate.objects.filter(patient_id=original['id'], other_id=original['copy']).exists()
+            for original in originals
+        )
+
+        started = time.perf_counter()
+        call_command('find_duplicate_patients', rebuild=True, verbosity=0, stdout=open(os.devnull, 'w'))
+        full = time.perf_counter() - started
+        pairs = SuspectedDuplicate.objects.count()
+
+    latencies.sort()
+    print(f"patients: {len(profiles) + args.duplicates}, re-registrations found: {found}/{args.duplicates}, "
+          f"suspected pairs: {pairs}")
+    print(f"incremental check per insert: p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"full blocked rebuild: {full:.1f} s")
+    print(f"naive pairwise scoring (estimated): {naive:.0f} s ({per_pair * 1e6:.1f} us x "
+          f"{len(profiles) * (len(profiles) - 1) // 2} pairs)")
+
+
+if __name__ == '__main__':
+    main()
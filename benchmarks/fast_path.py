@@ -0,0 +1,69 @@
+"""
+Per-endpoint speedup of the list serialization fast path
+(``patients.fastpath``) over DRF's serializers.
+
+Builds a temporary seeded database (db.sqlite3 is never touched), then
+times each list endpoint at ``--page-size`` with ``SERIALIZER_FAST_PATH``
+off and on and checks the two bodies are byte-identical. Usage::
+
+    python benchmarks/fast_path.py --page-size 500 --iterations 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ['departments', 'doctors', 'patients', 'appointments', 'medical-records', 'billings']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--patients', type=int, default=2000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+    from hospital_patient_management import settings
+
+    tmp = tempfile.TemporaryDirectory()
+    for alias in settings.DATABASES.values():
+        alias['NAME'] = os.path.join(tmp.name, 'bench.sqlite3')
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from django.test import Client, override_settings
+
+    call_command('migrate', verbosity=0)
+    call_command('seed_hospital', patients=args.patients, doctors=60, verbosity=0)
+    client = Client(SERVER_NAME='localhost', HTTP_ACCEPT='application/json')
+
+    def timed(url):
+        for _ in range(3):
+            body = client.get(url).content
+        samples = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            client.get(url)
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples) * 1000, body
+
+    print(f"{'endpoint':<18} {'drf ms':>9} {'fast ms':>9} {'speedup':>8}  identical")
+    for prefix in ENDPOINTS:
+        url = f'/api/{prefix}/?page_size={args.page_size}'
+        with override_settings(SERIALIZER_FAST_PATH=False):
+            slow, slow_body = timed(url)
+        with override_settings(SERIALIZER_FAST_PATH=True):
+            fast, fast_body = timed(url)
+        print(f"{prefix:<18} {slow:>9.2f} {fast:>9.2f} {slow / fast:>7.1f}x  {slow_body == fast_body}")
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Background job throughput, and API latency with and without workers busy.
+
+Runs on a fresh, migrated and seeded database file in a temporary
+directory (the project's db.sqlite3 is never touched) with the settings.py
+database configuration. API latency is first measured with no jobs
+running; then ``--jobs`` jobs (CSV exports of a month of billings and
+status updates of 50 appointments, alternating) are queued and
+``run_workers --burst`` drains them with ``--processes`` workers while
+the same requests are measured again. Usage::
+
+    python benchmarks/job_throughput.py --processes 4 --jobs 200
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(path, results_dir):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+    from hospital_patient_management import settings
+
+    for alias in settings.DATABASES.values():
+        alias['NAME'] = path
+    settings.MIDDLEWARE = []
+    settings.JOB_RESULTS_DIR = results_dir
+    import django
+    django.setup()
+
+
+def run_workers(processes):
+    from django.core.management import call_command
+    call_command('run_workers', processes=processes, burst=True, poll_interval=0.2, verbosity=0)
+
+
+def latencies(client, urls, seconds, until=None):
+    """Request ``urls`` round-robin for ``seconds`` (or until ``until()`` is false); per-request seconds."""
+    from django.db import close_old_connections
+
+    timings = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline if until is None else until():
+        for url in urls:
+            close_old_connections()
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, (url, response.status_code)
+    return sorted(timings)
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000 if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--baseline-seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(os.path.join(tmp, 'bench.sqlite3'), os.path.join(tmp, 'results'))
+        from datetime import timedelta
+
+        from django.core.management import call_command
+        from django.db import connections
+        from django.test import Client
+        from django.utils import timezone
+
+        from patients import jobs
+        from patients.management.commands.benchmark_api import host
+        from patients.models import Appointment, Job
+
+        call_command('migrate', verbosity=0)
+        call_command('seed_hospital', patients=args.patients, doctors=40, verbosity=0)
+        urls = ['/api/patients/?page_size=20', '/api/appointments/?pagination=cursor&page_size=50',
+                '/api/doctors/1/']
+        client = Client(SERVER_NAME=host(), HTTP_ACCEPT='application/json')
+        idle = latencies(client, urls, args.baseline_seconds)
+
+        rng = random.Random(0)
+        appointment_ids = list(Appointment.objects.values_list('pk', flat=True))
+        start = timezone.now() - timedelta(days=330)
+        for index in range(args.jobs):
+            if index % 2:
+                jobs.enqueue('appointment_status', {
+                    'status': rng.choice(['Scheduled', 'Cancelled']), 'ids': rng.sample(appointment_ids, 50),
+                })
+            else:
+                day = start + timedelta(days=rng.randrange(300))
+                jobs.enqueue('export', {'resource': 'billings', 'query': {
+                    'billing_date__gte': day.isoformat(), 'billing_date__lt': (day + timedelta(days=30)).isoformat(),
+                }})
+
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = context.Process(target=run_workers, args=(args.processes,))
+        started = time.monotonic()
+        workers.start()
+        busy = latencies(client, urls, 0, until=workers.is_alive)
+        workers.join()
+        elapsed = time.monotonic() - started
+
+        counts = {status: Job.objects.filter(status=status).count() for status in ('Succeeded', 'Failed', 'Queued')}
+
+    print(f"{args.jobs} jobs on {args.processes} processes in {elapsed:.1f}s: "
+          f"{counts['Succeeded'] / elapsed:.1f} jobs/s "
+          f"({counts['Succeeded']} succeeded, {counts['Failed']} failed, {counts['Queued']} left)")
+    print(f"{'API latency':<14} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, values in (('idle', idle), ('workers busy', busy)):
+        print(f"{label:<14} {len(values):>9} {percentile(values, 0.5):>8.2f} "
+              f"{percentile(values, 0.95):>8.2f} {percentile(values, 0.99):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Load generator comparing the sync (WSGI) list endpoints with the async
+read path (``/api/async/...``) under increasing concurrency.
+
+Start the two servers against the same database, e.g.::
+
+    gunicorn hospital_patient_management.wsgi -w 4 --threads 8 -b 127.0.0.1:8000
+    uvicorn hospital_patient_management.asgi:application --workers 4 --port 8001
+
+then run::
+
+    python benchmarks/read_path.py \\
+        --target sync=http://127.0.0.1:8000/api/patients/?pagination=cursor \\
+        --target async=http://127.0.0.1:8001/api/async/patients/ \\
+        --concurrency 50 200 1000 --duration 15
+
+Each concurrency level opens that many keep-alive connections and reports
+requests/sec, p50 and p99 latency and errors per target. 1000 connections
+need ``ulimit -n`` above 1000 on the client machine. Only the standard
+library is used, so the client itself never becomes a dependency.
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns ``(status, keep_alive)``."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    if lines[0].startswith('HTTP/1.0'):
+        return status, headers.get('connection') == 'keep-alive'
+    return status, headers.get('connection') != 'close'
+
+
+async def client(url, deadline, latencies, errors):
+    parts = urlsplit(url)
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = (
+        f'GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+        f'Accept: application/json\r\nConnection: keep-alive\r\n\r\n'
+    ).encode()
+    writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+            errors.append(type(exc).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(url, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    await asyncio.gather(*(client(url, deadline, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                        help="Endpoint to load, may be given more than once.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--duration', type=float, default=15, help="Seconds per run.")
+    parser.add_argument('--warmup', type=float, default=2, help="Seconds of warm-up per target.")
+    args = parser.parse_args()
+
+    targets = [item.partition('=')[::2] for item in args.target]
+    print(f"{'target':<10} {'conns':>6} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, url in targets:
+        asyncio.run(run(url, min(args.concurrency), args.warmup))
+        for concurrency in args.concurrency:
+            result = asyncio.run(run(url, concurrency, args.duration))
+            print(
+                f"{name:<10} {concurrency:>6} {result['requests']:>9} {result['rps']:>9.1f} "
+                f"{result['p50']:>8.1f} {result['p99']:>8.1f} {result['errors']:>7}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Mixed read/write throughput of the SQLite configuration in settings.py
+against Django's defaults.
+
+Each mode runs in its own process on a fresh, migrated and seeded database
+file in a temporary directory (the project's db.sqlite3 is never touched):
+
+* ``default``: rollback journal, DEFERRED transactions, a new connection per
+  request and no read routing, i.e. a stock ``django.db.backends.sqlite3``.
+* ``tuned``: the WAL/pragma, ``CONN_MAX_AGE``, ``BEGIN IMMEDIATE`` and
+  read-replica settings from ``settings.py``.
+
+Worker threads act as concurrent requests: each operation is a patient page
+read, or with probability ``--write-ratio`` an appointment booking plus a
+patient update in one transaction, with ``close_old_connections()`` at each
+request boundary as Django's handler does. Usage::
+
+    python benchmarks/sqlite_mixed.py --threads 16 --duration 10 --write-ratio 0.2
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(mode, path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+    from hospital_patient_management import settings
+
+    if mode == 'default':
+        settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}}
+        settings.DATABASE_ROUTERS = []
+    else:
+        for alias in settings.DATABASES.values():
+            alias['NAME'] = path
+    settings.MIDDLEWARE = []
+    import django
+    django.setup()
+
+
+def run(mode, threads, duration, write_ratio, patients):
+    from datetime import timedelta
+
+    from django.core.management import call_command
+    from django.db import OperationalError, close_old_connections, transaction
+    from django.utils import timezone
+
+    from patients.models import Appointment, Doctor, Patient
+
+    call_command('migrate', verbosity=0)
+    call_command('seed_hospital', patients=patients, doctors=40, appointments_per_patient=2, verbosity=0)
+    close_old_connections()
+    patient_ids = list(Patient.objects.values_list('pk', flat=True))
+    doctor_ids = list(Doctor.objects.values_list('pk', flat=True))
+
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    slot = iter(range(10 ** 9))
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            close_old_connections()
+            started = time.perf_counter()
+            kind = 'writes' if rng.random() < write_ratio else 'reads'
+            try:
+                if kind == 'reads':
+                    list(Patient.objects.filter(pk__gte=rng.choice(patient_ids)).order_by('pk')[:20])
+                else:
+                    with transaction.atomic():
+                        patient = Patient.objects.get(pk=rng.choice(patient_ids))
+                        patient.address = f"{rng.randrange(1, 999)} Moi Avenue"
+                        patient.save(update_fields=['address'])
+                        with lock:
+                            minute = next(slot)
+                        Appointment.objects.create(
+                            patient=patient, doctor_id=rng.choice(doctor_ids),
+                            date=timezone.now() + timedelta(days=400, minutes=minute * 31),
+                            reason="Benchmark",
+                        )
+            except OperationalError:
+                with lock:
+                    counts['locked'] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                counts[kind] += 1
+                latencies.append(elapsed)
+        close_old_connections()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.monotonic()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        'mode': mode,
+        'ops_per_second': (counts['reads'] + counts['writes']) / elapsed,
+        'reads': counts['reads'],
+        'writes': counts['writes'],
+        'locked_errors': counts['locked'],
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--mode', choices=['default', 'tuned'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        with tempfile.TemporaryDirectory() as tmp:
+            configure(args.mode, os.path.join(tmp, 'bench.sqlite3'))
+            result = run(args.mode, args.threads, args.duration, args.write_ratio, args.patients)
+        print(json.dumps(result))
+        return
+
+    print(f"{'mode':<8} {'ops/s':>9} {'reads':>8} {'writes':>8} {'locked':>7} {'p99 ms':>8}")
+    for mode in ('default', 'tuned'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--threads', str(args.threads),
+             '--duration', str(args.duration), '--write-ratio', str(args.write_ratio),
+             '--patients', str(args.patients)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        p99 = f"{result['p99_ms']:.1f}" if result['p99_ms'] is not None else '-'
+        print(
+            f"{mode:<8} {result['ops_per_second']:>9.1f} {result['reads']:>8} {result['writes']:>8} "
+            f"{result['locked_errors']:>7} {p99:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Utilization analytics: column arrays against a per-row loop over appointments.
+
+Runs on a fresh, migrated and seeded database file in a temporary
+directory (the project's db.sqlite3 is never touched). ``--appointments``
+rows spread over a year are written straight into the appointment table,
+then one year of analytics per doctor is computed three ways: the
+per-row loop over ``Appointment`` objects (timed on ``--loop-sample``
+rows and extrapolated), ``analytics.compute`` in pure Python and with
+NumPy when it is installed. Usage::
+
+    python benchmarks/utilization.py --appointments 10000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(path):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+    from hospital_patient_management import settings
+
+    for alias in settings.DATABASES.values():
+        alias['NAME'] = path
+    import django
+    django.setup()
+
+
+def fill(count, start, patients, doctors):
+    """Insert ``count`` appointments during the year from ``start`` with one executemany per chunk."""
+    from django.db import connection, transaction
+
+    rng = random.Random(3)
+    first = int(start.timestamp())
+    statuses = ['Completed'] * 7 + ['Cancelled', 'Scheduled']
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, count, 200000):
+            rows = []
+            for _ in range(min(200000, count - offset)):
+                moment = first + rng.randrange(365) * 86400 + rng.randrange(7 * 60, 18 * 60, 15) * 60
+                rows.append((
+                    rng.choice(patients), rng.choice(doctors),
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(moment)),
+                    rng.choice((15, 30, 30, 45, 60)), 'Consultation', rng.choice(statuses),
+                ))
+            cursor.executemany(
+                'INSERT INTO patients_appointment (change_seq, patient_id, doctor_id, date, duration_minutes, reason, '
+                'status) VALUES (0, %s, %s, %s, %s, %s, %s)', rows,
+            )
+
+
+def loop(queryset, now):
+    """The per-row version: what the view would do without ``analytics``."""
+    counts = defaultdict(lambda: defaultdict(int))
+    heatmap = defaultdict(lambda: [[0] * 24 for _ in range(7)])
+    days = defaultdict(list)
+    for appointment in queryset.select_related('doctor'):
+        status = appointment.status
+        if status == 'Scheduled' and appointment.date + timedelta(minutes=appointment.duration_minutes) <= now:
+            status = 'No-show'
+        counts[appointment.doctor_id][status] += 1
+        if status != 'Cancelled':
+            local = appointment.date.astimezone()
+            heatmap[appointment.doctor_id][local.weekday()][local.hour] += 1
+            days[appointment.doctor_id, local.date()].append(appointment)
+    gaps = defaultdict(list)
+    for (doctor_id, _), bookings in days.items():
+        bookings.sort(key=lambda appointment: appointment.date)
+        for before, after in zip(bookings, bookings[1:]):
+            end = before.date + timedelta(minutes=before.duration_minutes)
+            gaps[doctor_id].append(max((after.date - end).total_seconds() / 60, 0))
+    return {doctor_id: statistics.median(values) for doctor_id, values in gaps.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--appointments', type=int, default=10_000_000)
+    parser.add_argument('--loop-sample', type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(os.path.join(tmp, 'bench.sqlite3'))
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        from patients import analytics
+        from patients.models import Appointment, Doctor, Patient
+
+        call_command('migrate', verbosity=0)
+        call_command('seed_hospital', patients=1000, doctors=200, appointments_per_patient=0, verbosity=0)
+        last_day = timezone.localdate()
+        first_day = last_day - timedelta(days=364)
+        started = time.perf_counter()
+        fill(args.appointments, timezone.make_aware(datetime.combine(first_day, datetime.min.time())),
+             list(Patient.objects.values_list('pk', flat=True)), list(Doctor.objects.values_list('pk', flat=True)))
+        print(f"inserted {args.appointments:,} appointments in {time.perf_counter() - started:.0f}s")
+
+        timings = {}
+        sample = Appointment.objects.order_by()[:args.loop_sample]
+        started = time.perf_counter()
+        loop(sample, timezone.now())
+        timings['per-row loop (extrapolated)'] = (time.perf_counter() - started) * args.appointments / args.loop_sample
+
+        numpy = analytics.np
+        analytics.np = None
+        started = time.perf_counter()
+        expected = analytics.compute(first_day, last_day)
+        timings['analytics, pure Python'] = time.perf_counter() - started
+        analytics.np = numpy
+        if numpy is not None:
+            started = time.perf_counter()
+            result = analytics.compute(first_day, last_day)
+            timings['analytics, NumPy'] = time.perf_counter() - started
+            assert result == expected, "NumPy and pure Python results differ"
+        analytics.utilization(first_day, last_day)
+        started = time.perf_counter()
+        analytics.utilization(first_day, last_day)
+        timings['cached'] = time.perf_counter() - started
+
+    print(f"{'one year, per doctor':<30} {'seconds':>10}")
+    for label, seconds in timings.items():
+        print(f"{label:<30} {seconds:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
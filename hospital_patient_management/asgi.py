@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_patient_management.settings')
+# Read by settings: no persistent database connections under ASGI.
+os.environ.setdefault('HOSPITAL_ASGI', '1')
 
 application = get_asgi_application()
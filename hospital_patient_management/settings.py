@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'patients.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,13 +76,123 @@ WSGI_APPLICATION = 'hospital_patient_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer; synchronous=NORMAL is crash-safe in WAL mode and only
+# syncs at checkpoints; busy_timeout makes a blocked writer wait instead of
+# failing with "database is locked".
+SQLITE_PRAGMAS = ';'.join([
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 20000',
+    'PRAGMA cache_size = -65536',     # 64 MiB page cache
+    'PRAGMA mmap_size = 268435456',   # 256 MiB memory-mapped reads
+    'PRAGMA temp_store = MEMORY',
+])
+
+# Connections are kept open between requests under WSGI. Django advises
+# against persistent connections under ASGI: ORM calls run in
+# sync_to_async's thread pool, where they are not reliably closed at the end
+# of a request. asgi.py sets HOSPITAL_ASGI to turn them off there.
+CONN_MAX_AGE = 0 if os.environ.get('HOSPITAL_ASGI') else 600
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts rather than on
+            # its first write, so it waits on busy_timeout instead of failing
+            # mid-transaction.
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': SQLITE_PRAGMAS,
+        },
+    },
+    # Same file, opened read-only; see patients.routers.PrimaryReplicaRouter.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS + ';PRAGMA query_only = ON',
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+# Archived appointments and medical records go to a separate SQLite file
+# when HOSPITAL_ARCHIVE_DB names one (create its tables with
+# `migrate --database archive`); otherwise they share db.sqlite3.
+if os.environ.get('HOSPITAL_ARCHIVE_DB'):
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['HOSPITAL_ARCHIVE_DB'],
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': SQLITE_PRAGMAS,
+        },
+    }
+
+DATABASE_ROUTERS = ['patients.routers.ArchiveRouter', 'patients.routers.PrimaryReplicaRouter']
+
+# Background jobs (see patients.jobs): where result files are written,
+# the first retry delay (doubled on each further attempt), and how often a
+# worker marks its running job alive / after how long without that the job
+# is handed to another worker.
+JOB_RESULTS_DIR = BASE_DIR / 'job-results'
+JOB_RETRY_BACKOFF_SECONDS = 10
+JOB_HEARTBEAT_SECONDS = 15
+JOB_STALE_SECONDS = 120
+
+# /api/changes/: how often long-polls and event streams check for new
+# changes, how long one event stream stays open before the client
+# reconnects, and how long tombstones of deleted rows are kept
+# (manage.py prune_tombstones).
+CHANGES_POLL_SECONDS = 1.0
+CHANGES_STREAM_SECONDS = 300
+CHANGE_TOMBSTONE_RETENTION_DAYS = 90
+
+# Duplicate patient detection (patients.duplicates): pairs scoring at
+# least DUPLICATE_MIN_SCORE (0-1) are reported; blocking keys shared by
+# more than DUPLICATE_MAX_BLOCK_SIZE patients are too common to use.
+DUPLICATE_MIN_SCORE = 0.7
+DUPLICATE_MAX_BLOCK_SIZE = 200
+
+# /api/analytics/utilization/: results are cached per window for up to
+# ANALYTICS_CACHE_SECONDS, and served after rows changed for up to
+# ANALYTICS_MAX_STALENESS_SECONDS after they were computed.
+ANALYTICS_CACHE_SECONDS = 3600
+ANALYTICS_MAX_STALENESS_SECONDS = 300
+
+# archive_records moves rows older than this many days to the archive.
+ARCHIVE_RETENTION_DAYS = 730
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Seconds a rendered department/doctor response stays cached. Writes
+# invalidate it immediately regardless.
+RESPONSE_CACHE_TIMEOUT = 3600
+
+# Requests over either budget are logged by InstrumentationMiddleware with
+# their slowest SQL statements. Set to None to disable.
+REQUEST_QUERY_BUDGET = 50
+REQUEST_LATENCY_BUDGET_MS = 500
+REQUEST_SLOW_STATEMENTS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,9 +237,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'patients.fastpath.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',  # Enables browsable API
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'patients.pagination.StandardPagination',
     'PAGE_SIZE': 10,
 }
+
+# List endpoints read plain-column serializers with values_list() and
+# precompiled encoders; see patients.fastpath.
+SERIALIZER_FAST_PATH = True
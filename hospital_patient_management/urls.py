@@ -1,23 +1,34 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework import routers
+from patients.analytics import UtilizationView
+from patients.batch import BatchView
+from patients.bulk import BulkRouter
+from patients.changes import ChangesView
+from patients.instrumentation import metrics_view
 from patients.views import (
     DepartmentViewSet, DoctorViewSet, PatientViewSet,
-    AppointmentViewSet, MedicalRecordViewSet, BillingViewSet
+    AppointmentViewSet, MedicalRecordViewSet, BillingViewSet, JobViewSet, DuplicateViewSet
 )
 
 
-router = routers.DefaultRouter()
+router = BulkRouter()
 router.register(r'departments', DepartmentViewSet)
 router.register(r'doctors', DoctorViewSet)
 router.register(r'patients', PatientViewSet)
 router.register(r'appointments', AppointmentViewSet)
 router.register(r'medical-records', MedicalRecordViewSet)
 router.register(r'billings', BillingViewSet)
+router.register(r'jobs', JobViewSet)
+router.register(r'duplicates', DuplicateViewSet)
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/analytics/utilization/', UtilizationView.as_view(), name='analytics-utilization'),
+    path('api/batch/', BatchView.as_view(), name='batch'),
+    path('api/changes/', ChangesView.as_view(), name='changes'),
     path('api/', include(router.urls)),
+    path('api/async/', include('patients.async_views')),
+    path('metrics', metrics_view, name='metrics'),
     
 ]
@@ -1,9 +1,183 @@
-from django.contrib import admin
-from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing
+from datetime import datetime, timedelta
+
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, models
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing, Tariff
+from . import billing
+from .search import search
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the row count of an unfiltered changelist from the database's
+    table statistics instead of running ``COUNT(*)`` over the whole table.
+    Filtered lists, tables without statistics, and tables estimated at no
+    more than ``exact_count_limit`` rows are counted exactly.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, models.QuerySet) and not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+def estimated_count(model, using):
+    """
+    The planner's row count for ``model``'s table: ``pg_class.reltuples`` on
+    PostgreSQL, ``sqlite_stat1`` (written by ``ANALYZE``) on SQLite. ``None``
+    when the database has no statistics for it.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'sqlite':
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 exists only once ANALYZE has run.
+        return None
+    if row is None:
+        return None
+    # sqlite_stat1's stat column starts with the table's row count.
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class IndexedDatesQuerySet(models.QuerySet):
+    """
+    ``datetimes()`` as the admin's ``date_hierarchy`` calls it, one index
+    seek per year, month or day that has rows (the next value at or after
+    the end of the previous period), instead of truncating every row of
+    the table and taking the distinct periods.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite reads MIN or MAX from the end of an index only when it is
+        # the query's sole aggregate; date_hierarchy asks for both at once.
+        if not args and len(kwargs) > 1 and all(type(value) in (models.Min, models.Max) for value in kwargs.values()):
+            return {name: super(IndexedDatesQuerySet, self).aggregate(**{name: value})[name]
+                    for name, value in kwargs.items()}
+        return super().aggregate(*args, **kwargs)
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        tz = tzinfo or timezone.get_current_timezone()
+        periods, after = [], None
+        while True:
+            rows = self.filter(**{f'{field_name}__gte': after}) if after else self
+            value = rows.aggregate(next=models.Min(field_name))['next']
+            if value is None:
+                break
+            value = timezone.localtime(value, tz)
+            period = datetime(value.year, 1 if kind == 'year' else value.month, value.day if kind == 'day' else 1)
+            periods.append(timezone.make_aware(period, tz))
+            if kind == 'year':
+                following = period.replace(year=period.year + 1)
+            elif kind == 'month':
+                following = (period + timedelta(days=32)).replace(day=1)
+            else:
+                following = period + timedelta(days=1)
+            after = timezone.make_aware(following, tz)
+        return periods if order == 'ASC' else periods[::-1]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists that stay fast on tables of millions of rows: estimated
+    counts, no second count for "N total", related rows joined in the
+    page query, and date drill-down from the indexes. Subclasses list
+    columns explicitly, so a row's ``__str__`` is never called.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(queryset.model, queryset.query.chain(), queryset.db, queryset._hints)
+
+
+class IndexSearchMixin:
+    """Searches through the FTS index of ``patients.search`` rather than ``LIKE`` on every column."""
+
+    def get_search_results(self, request, queryset, search_term):
+        return search(queryset, search_term), False
+
+
+@admin.action(description="Bill selected completed appointments")
+def bill_appointments(modeladmin, request, queryset):
+    result = billing.generate_bills(appointment_ids=list(queryset.values_list('pk', flat=True)))
+    modeladmin.message_user(request, f"Billed {result['billed']} appointments for {result['amount']:.2f}.")
+    if result['unpriced']:
+        modeladmin.message_user(
+            request, f"{result['unpriced']} appointments have no matching tariff.", level=messages.WARNING
+        )
+
+
+class DoctorAdmin(admin.ModelAdmin):
+    list_display = ['id', 'first_name', 'last_name', 'specialization', 'department', 'email']
+    list_select_related = ['department']
+    list_filter = ['department', 'specialization']
+    search_fields = ['last_name', 'first_name', '=email']
+
+
+class PatientAdmin(IndexSearchMixin, LargeTableAdmin):
+    list_display = ['id', 'first_name', 'last_name', 'date_of_birth', 'phone_number', 'email']
+    search_fields = ['first_name', 'last_name', 'phone_number', 'email']
+    readonly_fields = ['appointment_count', 'last_visit', 'next_appointment', 'outstanding_balance']
+
+
+class AppointmentAdmin(LargeTableAdmin):
+    actions = [bill_appointments]
+    list_display = ['id', 'date', 'patient', 'doctor', 'duration_minutes', 'status']
+    list_select_related = ['patient', 'doctor']
+    list_filter = ['status']
+    date_hierarchy = 'date'
+    ordering = ['-date', '-id']
+    autocomplete_fields = ['patient', 'doctor']
+
+
+class MedicalRecordAdmin(IndexSearchMixin, LargeTableAdmin):
+    list_display = ['id', 'created_at', 'patient', 'doctor', 'diagnosis']
+    list_select_related = ['patient', 'doctor']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at', '-id']
+    search_fields = ['diagnosis', 'treatment']
+    autocomplete_fields = ['patient', 'doctor']
+
+
+class BillingAdmin(LargeTableAdmin):
+    list_display = ['id', 'billing_date', 'patient', 'amount', 'payment_status']
+    list_select_related = ['patient']
+    list_filter = ['payment_status']
+    date_hierarchy = 'billing_date'
+    ordering = ['-billing_date', '-id']
+    autocomplete_fields = ['patient']
+    raw_id_fields = ['appointment']
+
+
+class TariffAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'department', 'specialization', 'amount']
+
 
 admin.site.register(Department)
-admin.site.register(Doctor)
-admin.site.register(Patient)
-admin.site.register(Appointment)
-admin.site.register(MedicalRecord)
-admin.site.register(Billing)
+admin.site.register(Doctor, DoctorAdmin)
+admin.site.register(Patient, PatientAdmin)
+admin.site.register(Appointment, AppointmentAdmin)
+admin.site.register(MedicalRecord, MedicalRecordAdmin)
+admin.site.register(Billing, BillingAdmin)
+admin.site.register(Tariff, TariffAdmin)
@@ -0,0 +1,282 @@
+from array import array
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from statistics import median
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import BigIntegerField, Case, Func, IntegerField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import changes
+from .models import Appointment, ArchivedAppointment, Department, Doctor
+
+try:
+    import numpy as np
+except ImportError:  # optional; the same numbers are computed in pure Python, several times slower
+    np = None
+
+
+GROUP_BY = ('doctor', 'department', 'none')
+# Status codes of loaded rows. NO_SHOW is a Scheduled appointment that has already ended.
+SCHEDULED, COMPLETED, CANCELLED, NO_SHOW = range(4)
+STATUS_NAMES = ('scheduled', 'completed', 'cancelled', 'no_show')
+HOURS_PER_WEEK = 7 * 24
+CHUNK_SIZE = 50000
+KEY_PREFIX = 'analytics:utilization'
+
+
+class EpochSeconds(Func):
+    """Seconds since 1970-01-01 UTC of a datetime column, computed by the database."""
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS BIGINT)'
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+                           **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def load(start, end):
+    """
+    Chunks of ``(doctor_id, starts, duration_minutes, status_code)`` rows
+    for the live and archived appointments starting in ``[start, end)``.
+    Start times arrive as epoch seconds and statuses as codes, and the
+    query runs on a plain cursor, so no datetime, model instance or
+    converter call is made per row.
+    """
+    code = Case(
+        When(status="Completed", then=Value(COMPLETED)),
+        When(status="Cancelled", then=Value(CANCELLED)),
+        default=Value(SCHEDULED),
+        output_field=IntegerField(),
+    )
+    for model in (Appointment, ArchivedAppointment):
+        queryset = (
+            model.objects.filter(date__gte=start, date__lt=end).order_by()
+            .annotate(starts=EpochSeconds('date'), code=code)
+            .values_list('doctor_id', 'starts', 'duration_minutes', 'code')
+        )
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            while chunk := cursor.fetchmany(CHUNK_SIZE):
+                yield chunk
+
+
+def hour_offsets(first_hour, last_hour, tz):
+    """UTC offset in seconds of ``tz`` at each hour since the epoch from ``first_hour`` to ``last_hour``."""
+    return [
+        int(datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds())
+        for hour in range(first_hour, last_hour + 1)
+    ]
+
+
+def aggregate(chunks, group_of, tz, now):
+    """
+    ``{group: {'counts', 'booked_minutes', 'heatmap', 'median_gap'}}`` for
+    appointment rows from ``load``. ``group_of`` maps a doctor id to its
+    group key. ``heatmap`` counts appointments that were not cancelled by
+    local hour of the week, Monday 00:00 first. ``median_gap`` is the
+    median idle time in minutes between a doctor's consecutive bookings
+    on the same local day.
+    """
+    if np is not None:
+        return _aggregate_numpy(chunks, group_of, tz, now)
+    return _aggregate_python(chunks, group_of, tz, now)
+
+
+def _aggregate_numpy(chunks, group_of, tz, now):
+    columns = [np.array(chunk, dtype=np.int64) for chunk in chunks]
+    if not columns:
+        return {}
+    doctor, starts, minutes, code = np.concatenate(columns).T
+    first_hour = int(starts.min()) // 3600
+    offsets = np.array(hour_offsets(first_hour, int(starts.max()) // 3600, tz), dtype=np.int64)
+    local = starts + offsets[starts // 3600 - first_hour]
+    code = np.where((code == SCHEDULED) & (starts + minutes * 60 <= now), NO_SHOW, code)
+
+    # Group keys are small ids: number them through a lookup table rather than sorting.
+    lookup = np.zeros(int(doctor.max()) + 1, dtype=np.int64)
+    for doctor_id in np.flatnonzero(np.bincount(doctor)):
+        lookup[doctor_id] = group_of(int(doctor_id))
+    keys = lookup[doctor]
+    present = np.flatnonzero(np.bincount(keys))
+    number = np.zeros(int(keys.max()) + 1, dtype=np.int64)
+    number[present] = np.arange(len(present))
+    group, size = number[keys], len(present)
+
+    counts = np.bincount(group * len(STATUS_NAMES) + code, minlength=size * len(STATUS_NAMES))
+    booked = code != CANCELLED
+    group, doctor, starts, minutes, local = group[booked], doctor[booked], starts[booked], minutes[booked], local[booked]
+    hour_of_week = (local // 86400 + 3) % 7 * 24 + local % 86400 // 3600  # 1970-01-01 was a Thursday
+    heatmap = np.bincount(group * HOURS_PER_WEEK + hour_of_week, minlength=size * HOURS_PER_WEEK)
+    booked_minutes = np.bincount(group, weights=minutes, minlength=size)
+
+    order = np.lexsort((minutes, starts, doctor))
+    group, doctor, starts, minutes, day = group[order], doctor[order], starts[order], minutes[order], local[order] // 86400
+    same_day = (doctor[1:] == doctor[:-1]) & (day[1:] == day[:-1])
+    gaps = np.maximum(starts[1:] - starts[:-1] - minutes[:-1] * 60, 0)[same_day] / 60
+    gap_group = group[1:][same_day]
+    gaps = gaps[np.lexsort((gaps, gap_group))]
+    sizes = np.bincount(gap_group, minlength=size)
+    begins = np.cumsum(sizes) - sizes
+    middle = (gaps[np.minimum(begins + (sizes - 1) // 2, len(gaps) - 1)] +
+              gaps[np.minimum(begins + sizes // 2, len(gaps) - 1)]) / 2 if len(gaps) else np.zeros(size)
+
+    counts = counts.reshape(size, len(STATUS_NAMES)).tolist()
+    heatmap = heatmap.reshape(size, 7, 24).tolist()
+    return {
+        int(key): {
+            'counts': counts[i],
+            'booked_minutes': int(booked_minutes[i]),
+            'heatmap': heatmap[i],
+            'median_gap': float(middle[i]) if sizes[i] else None,
+        }
+        for i, key in enumerate(present)
+    }
+
+
+def _aggregate_python(chunks, group_of, tz, now):
+    doctor, starts, minutes, code = (array('q') for _ in range(4))
+    for chunk in chunks:
+        for column, values in zip((doctor, starts, minutes, code), zip(*chunk)):
+            column.extend(values)
+    if not starts:
+        return {}
+    first_hour = min(starts) // 3600
+    offsets = hour_offsets(first_hour, max(starts) // 3600, tz)
+    groups = {doctor_id: group_of(doctor_id) for doctor_id in set(doctor)}
+
+    result = defaultdict(lambda: {'counts': [0] * len(STATUS_NAMES), 'booked_minutes': 0,
+                                  'heatmap': [0] * HOURS_PER_WEEK, 'gaps': []})
+    bookings = defaultdict(list)
+    for doctor_id, start, length, status in zip(doctor, starts, minutes, code):
+        if status == SCHEDULED and start + length * 60 <= now:
+            status = NO_SHOW
+        entry = result[groups[doctor_id]]
+        entry['counts'][status] += 1
+        if status == CANCELLED:
+            continue
+        local = start + offsets[start // 3600 - first_hour]
+        entry['booked_minutes'] += length
+        entry['heatmap'][(local // 86400 + 3) % 7 * 24 + local % 86400 // 3600] += 1
+        bookings[doctor_id].append((start, length, local // 86400))
+
+    for doctor_id, rows in bookings.items():
+        rows.sort()
+        gaps = result[groups[doctor_id]]['gaps']
+        for (start, length, day), (next_start, _, next_day) in zip(rows, rows[1:]):
+            if day == next_day:
+                gaps.append(max(next_start - start - length * 60, 0) / 60)
+
+    for entry in result.values():
+        gaps = entry.pop('gaps')
+        entry['median_gap'] = median(gaps) if gaps else None
+        entry['heatmap'] = [entry['heatmap'][day * 24:day * 24 + 24] for day in range(7)]
+    return dict(result)
+
+
+def compute(first_day, last_day, group_by='doctor'):
+    """Utilization and demand per ``group_by`` for appointments on local days ``first_day`` to ``last_day``."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_day, time()), tz)
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time()), tz)
+    departments = dict(Doctor.objects.values_list('pk', 'department_id'))
+    group_of = {
+        'doctor': lambda doctor_id: doctor_id,
+        'department': lambda doctor_id: departments.get(doctor_id) or 0,
+        'none': lambda doctor_id: 0,
+    }[group_by]
+    stats = aggregate(load(start, end), group_of, tz, int(timezone.now().timestamp()))
+
+    names = {}
+    if group_by == 'doctor':
+        names = {
+            pk: f"Dr. {first} {last}" for pk, first, last in
+            Doctor.objects.filter(pk__in=stats).values_list('pk', 'first_name', 'last_name')
+        }
+    elif group_by == 'department':
+        names = dict(Department.objects.filter(pk__in=stats).values_list('pk', 'name'))
+
+    results = []
+    for key in sorted(stats):
+        entry = stats[key]
+        item = {}
+        if group_by != 'none':
+            item[group_by] = key or None
+            item[f'{group_by}_name'] = names.get(key)
+        counts = dict(zip(STATUS_NAMES, entry['counts']))
+        due = counts['completed'] + counts['no_show']
+        total = sum(counts.values())
+        item.update(
+            appointments=total,
+            **counts,
+            cancellation_rate=round(counts['cancelled'] / total, 4),
+            no_show_rate=round(counts['no_show'] / due, 4) if due else None,
+            booked_minutes=entry['booked_minutes'],
+            median_gap_minutes=entry['median_gap'],
+            heatmap=entry['heatmap'],
+        )
+        results.append(item)
+    return {'from': first_day, 'to': last_day, 'timezone': str(tz), 'group_by': group_by, 'results': results}
+
+
+def utilization(first_day, last_day, group_by='doctor'):
+    """
+    ``compute``, cached per window and grouping. A cached result is served
+    while no tracked row has changed since it was computed (the change
+    sequence, see ``changes``), and for up to
+    ``ANALYTICS_MAX_STALENESS_SECONDS`` after that.
+    """
+    key = f'{KEY_PREFIX}:{group_by}:{first_day}:{last_day}:{timezone.get_current_timezone_name()}'
+    through = changes.current()[0]
+    cached = cache.get(key)
+    if cached is not None and (
+        cached['through'] == through
+        or timezone.now() - cached['computed_at'] < timedelta(seconds=settings.ANALYTICS_MAX_STALENESS_SECONDS)
+    ):
+        return cached
+
+    computed_at = timezone.now()
+    result = {**compute(first_day, last_day, group_by), 'through': through, 'computed_at': computed_at}
+    cache.set(key, result, settings.ANALYTICS_CACHE_SECONDS)
+    return result
+
+
+class UtilizationView(APIView):
+    """
+    ``GET /api/analytics/utilization/?from=2025-01-01&to=2025-01-31&group_by=doctor``:
+    appointments per group with status counts, cancellation and no-show
+    rates, booked minutes, the median idle gap between bookings and a
+    7x24 heatmap of load by local hour of the week (Monday first). The
+    window defaults to the last 28 days and includes archived appointments.
+    """
+
+    def get(self, request):
+        group_by = request.query_params.get('group_by', 'doctor')
+        if group_by not in GROUP_BY:
+            raise ValidationError({'group_by': [f"Choose one of: {', '.join(GROUP_BY)}."]})
+        last_day = self.parse_day(request, 'to', timezone.localdate())
+        first_day = self.parse_day(request, 'from', last_day - timedelta(days=27))
+        if first_day > last_day:
+            raise ValidationError({'from': ["Must not be after 'to'."]})
+        return Response(utilization(first_day, last_day, group_by))
+
+    def parse_day(self, request, name, default):
+        if not request.query_params.get(name):
+            return default
+        try:
+            day = parse_date(request.query_params[name])
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: ["Enter a valid date."]})
+        return day
@@ -6,3 +6,5 @@ class PatientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patients'
 
+    def ready(self):
+        from . import instrumentation, signals, tasks  # noqa: F401
@@ -0,0 +1,250 @@
+import heapq
+from collections import namedtuple
+from functools import cmp_to_key
+from itertools import islice
+from operator import attrgetter, itemgetter
+
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+from django.db.models import prefetch_related_objects
+from django.http import Http404
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import SAFE_METHODS
+
+from . import changes
+from .models import Appointment, MedicalRecord, ArchivedAppointment, ArchivedMedicalRecord
+
+
+ARCHIVES = {
+    Appointment: ArchivedAppointment,
+    MedicalRecord: ArchivedMedicalRecord,
+}
+DATE_FIELDS = {
+    Appointment: 'date',
+    MedicalRecord: 'created_at',
+}
+
+
+def archivable(model, cutoff):
+    """Live rows older than ``cutoff`` that can move to the archive."""
+    queryset = model.objects.filter(**{f'{DATE_FIELDS[model]}__lt': cutoff})
+    if model is Appointment:
+        # A bill points at its appointment and feeds revenue rollups and
+        # balances; billed appointments stay live.
+        queryset = queryset.filter(billing__isnull=True)
+    return queryset
+
+
+def archive_rows(model, cutoff, batch_size=1000):
+    """
+    Move ``archivable`` rows to the archive, oldest first, one batch per
+    transaction. Each batch is written to the archive before it is deleted
+    from the live table, so an interrupted run loses nothing and can simply
+    be run again. Returns the number of rows moved.
+    """
+    archive_model = ARCHIVES[model]
+    archive_alias = router.db_for_write(archive_model)
+    fields = [field.attname for field in model._meta.concrete_fields]
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                archivable(model, cutoff).order_by(DATE_FIELDS[model], 'pk').values(*fields)[:batch_size]
+            )
+            if not batch:
+                return moved
+            with transaction.atomic(using=archive_alias):
+                archive_model.objects.bulk_create(
+                    [archive_model(**row) for row in batch], ignore_conflicts=True
+                )
+            # A regular delete, so the search index and patient summaries
+            # are updated by their signal handlers. The rows are still
+            # served from the archive, so the change feed gets no tombstones.
+            with changes.archiving():
+                model.objects.filter(pk__in=[row['id'] for row in batch]).delete()
+        moved += len(batch)
+
+
+def cascade_delete(field, pk):
+    """
+    Apply the live foreign keys' ``on_delete`` rule for a deleted patient or
+    doctor to the archived rows pointing at it. With a separate archive
+    database this happens once the deletion commits.
+    """
+    def apply():
+        for live_model, archive_model in ARCHIVES.items():
+            rows = archive_model.objects.filter(**{f'{field}_id': pk})
+            on_delete = live_model._meta.get_field(field).remote_field.on_delete
+            if on_delete is models.CASCADE:
+                rows.delete()
+            elif on_delete is models.SET_NULL:
+                rows.update(**{field: None})
+
+    if router.db_for_write(ArchivedAppointment) == DEFAULT_DB_ALIAS:
+        apply()
+    else:
+        transaction.on_commit(apply)
+
+
+class ReadThrough:
+    """
+    Read-only merge of a live queryset and the matching archive queryset in
+    one ordering, for the parts of the queryset API that list pagination,
+    ``FastListMixin`` and exports use: ``filter``, ``order_by``,
+    ``values_list``, ``count``, slicing and ``iterator``. A slice ``[a:b]``
+    reads at most ``b`` rows from each side. Archived model instances come
+    out as unsaved live instances (see ``ArchivedRow.to_live``).
+    """
+    ordered = True
+
+    def __init__(self, live, archived, ordering, row_fields=None, named=False):
+        self.model = live.model
+        self.ordering = list(ordering)
+        if not any(name.lstrip('-') in ('id', 'pk') for name in self.ordering):
+            self.ordering.append('id')
+        self.live = live.order_by(*self.ordering)
+        self.archived = archived.order_by(*self.ordering)
+        self.row_fields = row_fields
+        self.named = named
+
+    def _clone(self, live, archived, ordering=None, **kwargs):
+        kwargs.setdefault('row_fields', self.row_fields)
+        kwargs.setdefault('named', self.named)
+        return ReadThrough(live, archived, ordering or self.ordering, **kwargs)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self.live.filter(*args, **kwargs), self.archived.filter(*args, **kwargs))
+
+    def order_by(self, *ordering):
+        return self._clone(self.live, self.archived, ordering)
+
+    def values_list(self, *fields, named=False):
+        attnames = [self._attname(name) for name in self.ordering]
+        columns = list(fields) + [name for name in attnames if name not in fields]
+        return self._clone(
+            self.live.values_list(*columns, named=named),
+            self.archived.values_list(*columns, named=named),
+            row_fields=list(fields), named=named,
+        )
+
+    def count(self):
+        return self.live.count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def exists(self):
+        return self.live.exists() or self.archived.exists()
+
+    def __iter__(self):
+        return self.iterator()
+
+    def iterator(self, chunk_size=2000):
+        return self._merge(self.live.iterator(chunk_size=chunk_size),
+                           self.archived.iterator(chunk_size=chunk_size))
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            return self[k:k + 1][0]
+        if k.step is not None or k.stop is None:
+            raise TypeError("ReadThrough only supports bounded slices without a step")
+        return list(islice(self._merge(self.live[:k.stop], self.archived[:k.stop]), k.start, k.stop))
+
+    def _attname(self, name):
+        name = name.lstrip('-')
+        return self.model._meta.pk.attname if name == 'pk' else self.model._meta.get_field(name).attname
+
+    def _merge(self, live, archived):
+        if self.row_fields is None:
+            archived = (obj.to_live() for obj in archived)
+        merged = heapq.merge(live, archived, key=self._sort_key())
+        if self.row_fields is None:
+            return merged
+        return self._trim(merged)
+
+    def _trim(self, rows):
+        width = len(self.row_fields)
+        if not self.named:
+            return (row[:width] for row in rows)
+        Row = namedtuple('Row', self.row_fields)
+        return (Row(*row[:width]) for row in rows)
+
+    def _sort_key(self):
+        attnames = [self._attname(name) for name in self.ordering]
+        if self.row_fields is not None and not self.named:
+            columns = self.row_fields + [name for name in attnames if name not in self.row_fields]
+            get = itemgetter(*[columns.index(name) for name in attnames])
+        else:
+            get = attrgetter(*attnames)
+        if len(attnames) == 1:
+            single = get
+            get = lambda row: (single(row),)  # noqa: E731
+        descending = [name.startswith('-') for name in self.ordering]
+
+        def compare(a, b):
+            for x, y, desc in zip(get(a), get(b), descending):
+                if x != y:
+                    return (-1 if x < y else 1) * (-1 if desc else 1)
+            return 0
+        return cmp_to_key(compare)
+
+
+class ArchiveReadThroughMixin:
+    """
+    Adds ``?include_archived=true`` to reads: list, export and detail
+    requests then also see rows that ``archive_records`` moved to the
+    archive, in the same shape and order as live rows. Writes and the
+    default reads only touch the live table. Full-text ``?search=`` only
+    covers live rows.
+    """
+    include_archived_query_param = 'include_archived'
+
+    def include_archived(self):
+        request = getattr(self, 'request', None)
+        return (
+            request is not None and request.method in SAFE_METHODS
+            and request.query_params.get(self.include_archived_query_param, '').lower() in ('1', 'true', 'yes')
+        )
+
+    def get_archive_queryset(self):
+        return ARCHIVES[self.queryset.model].objects.all()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'export') or not self.include_archived():
+            return queryset
+        archived = super().filter_queryset(self.get_archive_queryset())
+        if self.request.query_params.get('search'):
+            archived = archived.none()
+        ordering = queryset.query.order_by or self.cursor_ordering
+        return ReadThrough(queryset, archived, ordering)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if isinstance(queryset, ReadThrough) and page is not None:
+            # The live side was select_related for ?expand=; load the same
+            # relations for the archived rows on the page.
+            lookups = _flatten(queryset.live.query.select_related)
+            archived = [obj for obj in page if getattr(obj, 'archived', False)]
+            if lookups and archived:
+                prefetch_related_objects(archived, *lookups)
+        return page
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if not self.include_archived():
+                raise
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = get_object_or_404(self.get_archive_queryset(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return obj.to_live()
+
+
+def _flatten(select_related, prefix=''):
+    if not isinstance(select_related, dict):
+        return []
+    paths = []
+    for name, nested in select_related.items():
+        paths.append(prefix + name)
+        paths.extend(_flatten(nested, f'{prefix}{name}__'))
+    return paths
@@ -0,0 +1,133 @@
+import json
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import path
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .filters import FieldFilterBackend
+from .models import Doctor, Patient, Appointment, MedicalRecord
+from .pagination import KeysetPagination
+from .search import search
+from .serializers import DoctorSerializer, PatientSerializer, AppointmentSerializer, MedicalRecordSerializer
+from .views import PatientViewSet, DoctorViewSet, AppointmentViewSet, MedicalRecordViewSet
+
+
+def dumps(data):
+    return json.dumps(data, cls=JSONEncoder, separators=(',', ':')).encode()
+
+
+class AsyncReadView(View):
+    """
+    Read-only list/detail endpoint served natively under ASGI.
+
+    Rows are fetched with the async ORM (``aiterator``/``aget``) and the list
+    body is streamed out row by row, so a slow database never ties up a
+    worker thread. Lists are keyset paginated on ``cursor_ordering`` with
+    the same cursors as the DRF endpoints' ``?pagination=cursor`` mode, and
+    take the same ``filterset_fields`` filters and ``?fields=``. Writes and
+    ``?expand=`` stay on the sync DRF viewsets.
+    """
+    http_method_names = ['get', 'head', 'options']
+    model = None
+    serializer_class = None
+    cursor_ordering = ('id',)
+    filterset_fields = {}
+    searchable = False
+    chunk_size = 200
+
+    async def get(self, request, pk=None):
+        request = Request(request)
+        serializer = self.serializer_class(context={
+            'request': request, 'fields': request.query_params.get('fields') or None, 'expand': None,
+        })
+        try:
+            if pk is not None:
+                return await self.retrieve(request, serializer, pk)
+            return self.list(request, serializer)
+        except APIException as exc:
+            return JsonResponse(_error_body(exc), status=exc.status_code)
+
+    async def retrieve(self, request, serializer, pk):
+        try:
+            obj = await self.model.objects.aget(pk=pk)
+        except (self.model.DoesNotExist, ValueError):
+            return JsonResponse(
+                {'detail': f'No {self.model._meta.object_name} matches the given query.'}, status=404
+            )
+        return JsonResponse(serializer.to_representation(obj), encoder=JSONEncoder)
+
+    def get_queryset(self, request):
+        queryset = FieldFilterBackend().filter_queryset(request, self.model.objects.all(), self)
+        if self.searchable:
+            queryset = search(queryset, request.query_params.get('search'))
+        return queryset
+
+    def list(self, request, serializer):
+        paginator = KeysetPagination()
+        queryset = paginator.get_page_queryset(self.get_queryset(request), request, self)
+        return StreamingHttpResponse(
+            self.stream(paginator, queryset, serializer), content_type='application/json'
+        )
+
+    async def stream(self, paginator, queryset, serializer):
+        yield b'{"results":['
+        rows = []
+        async for obj in queryset.aiterator(chunk_size=self.chunk_size):
+            rows.append(obj)
+            # Backward pages arrive in reverse; they are flipped and sent below.
+            if paginator.reverse or len(rows) > paginator.page_size:
+                continue
+            yield (b',' if len(rows) > 1 else b'') + dumps(serializer.to_representation(obj))
+        page = paginator.set_page(rows)
+        if paginator.reverse:
+            yield b','.join(dumps(serializer.to_representation(obj)) for obj in page)
+        yield b'],"next":' + dumps(paginator.get_next_link()) + b',"previous":' + dumps(paginator.get_previous_link()) + b'}'
+
+
+def _error_body(exc):
+    detail = exc.detail
+    return detail if isinstance(detail, (dict, list)) else {'detail': detail}
+
+
+class AsyncPatientView(AsyncReadView):
+    model = Patient
+    serializer_class = PatientSerializer
+    filterset_fields = PatientViewSet.filterset_fields
+    searchable = True
+
+
+class AsyncDoctorView(AsyncReadView):
+    model = Doctor
+    serializer_class = DoctorSerializer
+    filterset_fields = DoctorViewSet.filterset_fields
+
+
+class AsyncAppointmentView(AsyncReadView):
+    model = Appointment
+    serializer_class = AppointmentSerializer
+    cursor_ordering = AppointmentViewSet.cursor_ordering
+    filterset_fields = AppointmentViewSet.filterset_fields
+
+
+class AsyncMedicalRecordView(AsyncReadView):
+    model = MedicalRecord
+    serializer_class = MedicalRecordSerializer
+    cursor_ordering = MedicalRecordViewSet.cursor_ordering
+    filterset_fields = MedicalRecordViewSet.filterset_fields
+    searchable = True
+
+
+urlpatterns = []
+for prefix, view in (
+    ('patients', AsyncPatientView),
+    ('doctors', AsyncDoctorView),
+    ('appointments', AsyncAppointmentView),
+    ('medical-records', AsyncMedicalRecordView),
+):
+    urlpatterns += [
+        path(f'{prefix}/', view.as_view(), name=f'async-{view.model._meta.model_name}-list'),
+        path(f'{prefix}/<int:pk>/', view.as_view(), name=f'async-{view.model._meta.model_name}-detail'),
+    ]
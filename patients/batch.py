@@ -0,0 +1,165 @@
+import io
+import json
+import re
+from urllib.parse import urlsplit
+
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import status, viewsets
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+
+PLACEHOLDER = re.compile(r'\{([A-Za-z_]\w*(?:\.\w+)+)\}')
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+class _Rollback(Exception):
+    pass
+
+
+class BatchView(APIView):
+    """
+    ``POST`` ``{"operations": [...]}`` runs several router requests in order,
+    in one transaction on one database connection, and returns every
+    result in one response. Each operation is
+    ``{"method": "POST", "path": "/api/patients/", "body": {...}, "ref": "patient"}``
+    (``body`` and ``ref`` are optional). Later operations can use results of
+    earlier ones: ``{patient.id}`` in a path, or ``{"$ref": "patient.id"}``
+    as a body value.
+
+    Operations go through the same views, serializers and validation as
+    separate requests. If one fails (a 4xx response) the batch stops, every
+    earlier write is rolled back and the response is ``400`` with the results
+    up to and including the failed operation.
+    """
+    max_operations = 50
+
+    def post(self, request):
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        errors = self.check_operations(operations)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        results, refs = [], {}
+        try:
+            with transaction.atomic():
+                for operation in operations:
+                    result = self.run_operation(request, operation, refs)
+                    results.append(result)
+                    if result['status'] >= 400:
+                        raise _Rollback
+                    if operation.get('ref'):
+                        refs[operation['ref']] = result['body']
+        except _Rollback:
+            return Response({'failed': len(results) - 1, 'results': results}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results})
+
+    def check_operations(self, operations):
+        if not isinstance(operations, list) or not operations:
+            return {'operations': ['Expected a non-empty list of operations.']}
+        if len(operations) > self.max_operations:
+            return {'operations': [f'Ensure this list has at most {self.max_operations} elements.']}
+        errors = [{} for _ in operations]
+        refs = set()
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: ['Expected an object.']}
+                continue
+            if operation.get('method', 'GET') not in METHODS:
+                errors[index]['method'] = [f"Choose one of: {', '.join(METHODS)}."]
+            if not isinstance(operation.get('path'), str):
+                errors[index]['path'] = ['This field is required.']
+            ref = operation.get('ref')
+            if ref is not None:
+                if not isinstance(ref, str) or not re.fullmatch(r'[A-Za-z_]\w*', ref):
+                    errors[index]['ref'] = ['Use letters, digits and underscores, starting with a letter.']
+                elif ref in refs:
+                    errors[index]['ref'] = ['Duplicate ref in batch.']
+                refs.add(ref)
+        return {'operations': errors} if any(errors) else None
+
+    def run_operation(self, request, operation, refs):
+        method = operation.get('method', 'GET')
+        try:
+            path = PLACEHOLDER.sub(lambda match: str(lookup(refs, match.group(1))), operation['path'])
+            body = substitute(operation.get('body'), refs)
+        except UnresolvedReference as exc:
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'detail': str(exc)}}
+        url = urlsplit(path)
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            match = None
+        view_class = getattr(match.func, 'cls', None) if match else None
+        if view_class is None or not issubclass(view_class, viewsets.ViewSetMixin):
+            return {'status': status.HTTP_404_NOT_FOUND, 'body': {'detail': f'No API resource at {url.path}.'}}
+
+        response = match.func(subrequest(request, method, url, body), *match.args, **match.kwargs)
+        if getattr(response, 'streaming', False):
+            return {'status': status.HTTP_400_BAD_REQUEST,
+                    'body': {'detail': 'Streaming responses are not supported in a batch.'}}
+        if hasattr(response, 'data'):
+            data = response.data
+        else:
+            data = json.loads(response.content) if response.content else None
+        return {'status': response.status_code, 'body': data}
+
+
+def lookup(refs, name):
+    """``refs`` value at a dotted ``ref.field...`` path."""
+    ref, *fields = name.split('.')
+    if ref not in refs:
+        raise UnresolvedReference(f'Unknown ref "{ref}"; refs must name an earlier operation.')
+    value = refs[ref]
+    for field in fields:
+        if not isinstance(value, dict) or field not in value:
+            raise UnresolvedReference(f'The result of "{ref}" has no "{name.split(".", 1)[1]}".')
+        value = value[field]
+    return value
+
+
+def substitute(value, refs):
+    if isinstance(value, dict):
+        if set(value) == {'$ref'} and isinstance(value['$ref'], str):
+            return lookup(refs, value['$ref'])
+        return {key: substitute(item, refs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, refs) for item in value]
+    return value
+
+
+def subrequest(request, method, url, body):
+    """A request for one operation, with the batch request's user and headers."""
+    outer = request._request
+    sub = HttpRequest()
+    sub.method = method
+    sub.path = sub.path_info = url.path
+    sub.META = {
+        key: value for key, value in outer.META.items()
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH', 'QUERY_STRING', 'PATH_INFO', 'REQUEST_METHOD')
+    }
+    sub.META.update(REQUEST_METHOD=method, PATH_INFO=url.path, QUERY_STRING=url.query,
+                    HTTP_ACCEPT='application/json')
+    sub.GET = QueryDict(url.query)
+    sub.COOKIES = outer.COOKIES
+    data = b'' if body is None else json.dumps(body, cls=JSONEncoder).encode()
+    if data:
+        sub.META.update(CONTENT_TYPE='application/json', CONTENT_LENGTH=str(len(data)))
+    sub._stream = io.BytesIO(data)
+    sub._read_started = False
+    for name in ('user', 'session'):
+        if hasattr(outer, name):
+            setattr(sub, name, getattr(outer, name))
+    # The batch request itself passed the CSRF check.
+    sub._dont_enforce_csrf_checks = True
+    # Keeps uncommitted rows out of the response cache (see CachedResponseMixin).
+    sub.in_batch = True
+    return sub
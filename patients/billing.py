@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+
+from .models import Appointment, Billing, Tariff
+from .signals import post_bulk_save
+
+
+class TariffTable:
+    """All tariffs in memory, resolved most specific first (see ``Tariff``)."""
+
+    def __init__(self, tariffs=None):
+        if tariffs is None:
+            tariffs = Tariff.objects.values_list('department_id', 'specialization', 'amount')
+        self.prices = {(department_id, specialization): amount for department_id, specialization, amount in tariffs}
+
+    def price(self, department_id, specialization):
+        for key in ((department_id, specialization), (department_id, ''), (None, specialization), (None, '')):
+            if key in self.prices:
+                return self.prices[key]
+        return None
+
+
+def unbilled(until=None, appointment_ids=None):
+    """Completed appointments without a bill: one anti-join on ``billing``."""
+    queryset = Appointment.objects.filter(status="Completed", billing__isnull=True)
+    if until is not None:
+        queryset = queryset.filter(date__lt=until)
+    if appointment_ids is not None:
+        queryset = queryset.filter(pk__in=appointment_ids)
+    return queryset
+
+
+def generate_bills(until=None, appointment_ids=None, chunk_size=5000, dry_run=False, progress=None):
+    """
+    Create a ``Pending`` bill, priced from the tariff table and dated at the
+    end of the visit, for every completed appointment without one.
+
+    Appointments are taken in primary key order, one chunk per transaction.
+    Each chunk is re-read inside its transaction (rows locked with SKIP
+    LOCKED where the database supports it; SQLite's ``BEGIN IMMEDIATE``
+    serializes writers), so concurrent runs never bill an appointment twice
+    and a rerun only bills what is still missing. Appointments without a
+    matching tariff are left unbilled and counted as ``unpriced``.
+
+    Returns ``{'billed': n, 'amount': total, 'unpriced': n}``.
+    """
+    tariffs = TariffTable()
+    summary = {'billed': 0, 'amount': 0, 'unpriced': 0}
+    last_pk = 0
+    conflicts = 0
+    while True:
+        try:
+            with transaction.atomic():
+                rows = list(
+                    unbilled(until, appointment_ids)
+                    .filter(pk__gt=last_pk)
+                    .select_for_update(skip_locked=True, of=('self',))
+                    .order_by('pk')
+                    .values_list('pk', 'patient_id', 'doctor__department_id', 'doctor__specialization',
+                                 'date', 'duration_minutes')[:chunk_size]
+                )
+                if not rows:
+                    break
+                bills, unpriced = [], 0
+                for pk, patient_id, department_id, specialization, date, minutes in rows:
+                    amount = tariffs.price(department_id, specialization)
+                    if amount is None:
+                        unpriced += 1
+                        continue
+                    bills.append(Billing(
+                        patient_id=patient_id, appointment_id=pk, amount=amount, payment_status="Pending",
+                        billing_date=date + timedelta(minutes=minutes),
+                    ))
+                if not dry_run:
+                    Billing.objects.bulk_create(bills)
+                    # Revenue rollups, patient balances and the like.
+                    post_bulk_save.send(sender=Billing, created=bills, updated=[])
+        except IntegrityError:
+            # Another run billed some of this chunk after it was read; read
+            # it again without those.
+            conflicts += 1
+            if conflicts > 3:
+                raise
+            continue
+        conflicts = 0
+        last_pk = rows[-1][0]
+        summary['billed'] += len(bills)
+        summary['unpriced'] += unpriced
+        summary['amount'] += sum(bill.amount for bill in bills)
+        if progress is not None:
+            progress(summary['billed'], message=f"{summary['billed']} appointments billed")
+    return summary
+
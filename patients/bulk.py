@@ -0,0 +1,270 @@
+from collections import Counter
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import routers, serializers, status
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+
+from .signals import post_bulk_save
+
+
+class BulkRouter(routers.DefaultRouter):
+    """
+    DefaultRouter that also routes ``PATCH`` on the list URL to a viewset's
+    ``bulk_update`` action, when the viewset has one.
+    """
+    routes = [
+        routers.Route(
+            url=route.url,
+            mapping={**route.mapping, 'patch': 'bulk_update'},
+            name=route.name,
+            detail=route.detail,
+            initkwargs=route.initkwargs,
+        ) if isinstance(route, routers.Route) and route.mapping.get('get') == 'list' else route
+        for route in routers.DefaultRouter.routes
+    ]
+
+
+class PrefetchedRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that resolves ids from a dict fetched up front with a
+    single ``IN (...)`` query, instead of one ``.get()`` per row.
+    """
+
+    def __init__(self, objects, **kwargs):
+        self.objects = objects
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            obj = self.objects.get(_coerce_pk(self.queryset.model, data))
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+def _coerce_pk(model, value):
+    return model._meta.pk.to_python(value)
+
+
+class BulkModelMixin:
+    """
+    Adds list-body writes to a ``ModelViewSet``.
+
+    ``POST`` with a JSON list creates every row, ``PATCH`` on the list URL
+    with a list of ``{"id": ..., ...}`` objects partially updates them, and
+    ``POST ?upsert=true`` updates rows whose ``bulk_upsert_key`` already
+    exists; viewsets whose model has no natural key set ``bulk_upsert_key``
+    to ``None`` and reject upserts. The batch is validated as a set (one query per foreign key and
+    per unique field, plus in-batch duplicate detection) and written with
+    ``bulk_create``/``bulk_update`` in one transaction. If any row is
+    invalid nothing is written and the response lists per-row errors.
+    """
+    bulk_max_rows = 10000
+    bulk_batch_size = 500
+    bulk_upsert_key = 'email'
+
+    def create(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return self.bulk_create(request, *args, **kwargs)
+        return super().create(request, *args, **kwargs)
+
+    def bulk_create(self, request, *args, **kwargs):
+        rows = request.data
+        error = self._check_batch(rows)
+        if error:
+            return error
+
+        instances = [None] * len(rows)
+        upsert = request.query_params.get('upsert') in ('1', 'true', 'True')
+        if upsert and not self.bulk_upsert_key:
+            return Response(
+                {api_settings.NON_FIELD_ERRORS_KEY: ['Upsert is not supported on this endpoint.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if upsert:
+            key = self.bulk_upsert_key
+            values = {str(row[key]).strip() for row in rows if isinstance(row, dict) and row.get(key)}
+            existing = {
+                getattr(obj, key): obj
+                for obj in self.get_queryset().model._default_manager.filter(**{f'{key}__in': values})
+            }
+            instances = [
+                existing.get(str(row.get(key, '')).strip()) if isinstance(row, dict) else None
+                for row in rows
+            ]
+
+        return self._bulk_write(rows, instances, partial=False, success_status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {api_settings.NON_FIELD_ERRORS_KEY: ['Expected a list of objects.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        error = self._check_batch(rows)
+        if error:
+            return error
+
+        model = self.get_queryset().model
+        pks = []
+        for row in rows:
+            try:
+                pks.append(_coerce_pk(model, row.get('id')) if isinstance(row, dict) else None)
+            except (TypeError, ValueError, DjangoValidationError):
+                pks.append(None)
+        existing = self.get_queryset().in_bulk([pk for pk in pks if pk is not None])
+        instances = [existing.get(pk) for pk in pks]
+
+        errors = [{} for _ in rows]
+        seen = Counter(pk for pk in pks if pk is not None)
+        for index, (row, pk, instance) in enumerate(zip(rows, pks, instances)):
+            if not isinstance(row, dict):
+                continue
+            if pk is None:
+                errors[index] = {'id': ['This field is required.']}
+            elif instance is None:
+                errors[index] = {'id': [f'Invalid pk "{row.get("id")}" - object does not exist.']}
+            elif seen[pk] > 1:
+                errors[index] = {'id': ['Duplicate id in batch.']}
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return self._bulk_write(rows, instances, partial=True, success_status=status.HTTP_200_OK)
+
+    def _check_batch(self, rows):
+        if not rows:
+            return Response(
+                {api_settings.NON_FIELD_ERRORS_KEY: ['This list may not be empty.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(rows) > self.bulk_max_rows:
+            return Response(
+                {api_settings.NON_FIELD_ERRORS_KEY: [f'Ensure this list has at most {self.bulk_max_rows} elements.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return None
+
+    def get_bulk_serializer(self, rows, partial):
+        """
+        A single child serializer reused for every row, with per-row
+        ``UniqueValidator`` and related-object queries replaced by the
+        set-based lookups done in ``_bulk_write``.
+        """
+        serializer = self.get_serializer(partial=partial)
+        serializer.context['defer_conflict_check'] = True
+        for name, field in list(serializer.fields.items()):
+            if field.read_only:
+                continue
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                queryset = field.get_queryset()
+                pks = set()
+                for row in rows:
+                    if isinstance(row, dict) and row.get(name) not in (None, ''):
+                        try:
+                            pks.add(_coerce_pk(queryset.model, row[name]))
+                        except (TypeError, ValueError, DjangoValidationError):
+                            pass
+                serializer.fields[name] = PrefetchedRelatedField(
+                    objects=queryset.in_bulk(pks),
+                    queryset=queryset,
+                    required=field.required,
+                    allow_null=field.allow_null,
+                )
+            else:
+                field.validators = [
+                    validator for validator in field.validators
+                    if not isinstance(validator, UniqueValidator)
+                ]
+        return serializer
+
+    def get_unique_fields(self):
+        """Map of field name to the message of its ``UniqueValidator``."""
+        unique = {}
+        for name, field in self.get_serializer().fields.items():
+            if field.read_only:
+                continue
+            for validator in field.validators:
+                if isinstance(validator, UniqueValidator):
+                    unique[name] = str(validator.message)
+        return unique
+
+    def _bulk_write(self, rows, instances, partial, success_status):
+        serializer = self.get_bulk_serializer(rows, partial)
+        model = self.get_queryset().model
+
+        errors = [{} for _ in rows]
+        validated = [None] * len(rows)
+        for index, (row, instance) in enumerate(zip(rows, instances)):
+            if not isinstance(row, dict):
+                errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: ['Invalid data. Expected a dictionary.']}
+                continue
+            serializer.instance = instance
+            try:
+                validated[index] = serializer.run_validation(row)
+            except serializers.ValidationError as exc:
+                errors[index] = exc.detail
+        serializer.instance = None
+
+        for name, message in self.get_unique_fields().items():
+            self._check_unique(name, message, validated, instances, errors)
+        self.validate_batch(serializer, validated, instances, errors)
+
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        created, updated, update_fields = [], [], set()
+        for data, instance in zip(validated, instances):
+            if instance is None:
+                created.append(model(**data))
+            else:
+                for attr, value in data.items():
+                    setattr(instance, attr, value)
+                update_fields.update(data)
+                updated.append(instance)
+
+        with transaction.atomic():
+            if created:
+                model._default_manager.bulk_create(created, batch_size=self.bulk_batch_size)
+            if updated and update_fields:
+                model._default_manager.bulk_update(updated, sorted(update_fields), batch_size=self.bulk_batch_size)
+            post_bulk_save.send(sender=model, created=created, updated=updated)
+
+        new_objects = iter(created)
+        results = [instance if instance is not None else next(new_objects) for instance in instances]
+        return Response(self.get_serializer(results, many=True).data, status=success_status)
+
+    def validate_batch(self, serializer, validated, instances, errors):
+        """
+        Hook for cross-row checks. ``validated`` holds each row's validated
+        data (``None`` for rows that already failed); add messages to
+        ``errors`` in place.
+        """
+
+    def _check_unique(self, name, unique_message, validated, instances, errors):
+        values = [data.get(name) if data is not None else None for data in validated]
+        counts = Counter(value for value in values if value is not None)
+        model = self.get_queryset().model
+        taken = dict(
+            model._default_manager
+            .filter(**{f'{name}__in': list(counts)})
+            .values_list(name, 'pk')
+        )
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            own_pk = instances[index].pk if instances[index] is not None else None
+            if counts[value] > 1:
+                message = f'Duplicate {name} in batch.'
+            elif value in taken and taken[value] != own_pk:
+                message = unique_message
+            else:
+                continue
+            errors[index] = {**errors[index], name: [message]}
@@ -0,0 +1,136 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+
+KEY_PREFIX = 'respcache'
+
+
+def version_key(model):
+    return f'{KEY_PREFIX}:version:{model._meta.label_lower}'
+
+
+def get_versions(models):
+    """
+    Current version number of each model. Missing versions are seeded from
+    the clock rather than 1, so an evicted counter can never come back at a
+    value an older cached response was stored under.
+    """
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(model):
+    def bump():
+        try:
+            cache.incr(version_key(model))
+        except ValueError:
+            cache.set(version_key(model), time.time_ns(), timeout=None)
+
+    # Bump now so this transaction's own reads miss, and again after commit
+    # in case another request cached pre-commit data in between.
+    bump()
+    transaction.on_commit(bump)
+
+
+def record(basename, outcome):
+    key = f'{KEY_PREFIX}:stats:{basename}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # A cache that stores nothing (DummyCache); there are no stats to keep.
+            pass
+
+
+def get_stats(basename):
+    keys = {outcome: f'{KEY_PREFIX}:stats:{basename}:{outcome}' for outcome in ('hit', 'miss', 'not_modified')}
+    values = cache.get_many(keys.values())
+    return {outcome: values.get(key, 0) for outcome, key in keys.items()}
+
+
+class CachedResponseMixin:
+    """
+    Caches rendered JSON ``list``/``retrieve`` responses in Django's cache.
+
+    Keys include a version number for the viewset's model and each model in
+    ``cache_depends_on``. ``bump_version`` runs from ``post_save`` and
+    ``post_delete`` (see ``signals.py``), so a write invalidates every cached
+    page at once without scanning keys. The same versions give a strong
+    ``ETag``, so a matching ``If-None-Match`` gets ``304 Not Modified``
+    before any query or serialization runs.
+    """
+    cache_depends_on = ()
+    cache_formats = ('json',)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_timeout(self):
+        return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 3600)
+
+    def get_cache_identity(self, request):
+        models = (self.get_queryset().model,) + tuple(self.cache_depends_on)
+        identity = '|'.join([
+            self.basename,
+            self.action,
+            request.build_absolute_uri(),
+            request.accepted_media_type,
+            ','.join(str(version) for version in get_versions(models)),
+        ])
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def cached_response(self, view, request, *args, **kwargs):
+        if request.accepted_renderer.format not in self.cache_formats or getattr(request, 'in_batch', False):
+            # Batch operations read inside a transaction that may roll back.
+            return view(request, *args, **kwargs)
+
+        digest = self.get_cache_identity(request)
+        etag = f'"{digest}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            record(self.basename, 'not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        key = f'{KEY_PREFIX}:body:{digest}'
+        cached = cache.get(key)
+        if cached is not None:
+            record(self.basename, 'hit')
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            response['X-Cache'] = 'HIT'
+            return response
+
+        record(self.basename, 'miss')
+        response = view(request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        response = self.finalize_response(request, response, *args, **kwargs)
+        response.render()
+        cache.set(key, (response.content, response['Content-Type']), self.get_cache_timeout())
+        response['ETag'] = etag
+        response['X-Cache'] = 'MISS'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        return Response(get_stats(self.basename))
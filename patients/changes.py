@@ -0,0 +1,331 @@
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, router, transaction
+from django.db.models import F, Max, SET_NULL
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import renderers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from .fastpath import RowEncoder
+from .models import (
+    ChangeSequence, Department, Doctor, Patient, Appointment, MedicalRecord, Billing, Tombstone
+)
+from .serializers import (
+    DepartmentSerializer, DoctorSerializer, PatientSerializer,
+    AppointmentSerializer, MedicalRecordSerializer, BillingSerializer
+)
+
+
+FEEDS = {
+    'departments': (Department, DepartmentSerializer),
+    'doctors': (Doctor, DoctorSerializer),
+    'patients': (Patient, PatientSerializer),
+    'appointments': (Appointment, AppointmentSerializer),
+    'medical-records': (MedicalRecord, MedicalRecordSerializer),
+    'billings': (Billing, BillingSerializer),
+}
+TRACKED = tuple(model for model, _ in FEEDS.values())
+# Set while archive.archive_rows moves rows out of the live tables.
+_archiving = ContextVar('archiving', default=False)
+
+
+def reserve(count):
+    """
+    Take the next ``count`` change sequence numbers. The counter row stays
+    locked until the caller's transaction commits, so changes commit in
+    sequence order and a reader never sees a number before all lower ones.
+    """
+    with transaction.atomic(using=router.db_for_write(ChangeSequence), savepoint=False):
+        if not ChangeSequence.objects.filter(pk=1).update(value=F('value') + count):
+            ChangeSequence.objects.get_or_create(pk=1)
+            ChangeSequence.objects.filter(pk=1).update(value=F('value') + count)
+        last = ChangeSequence.objects.values_list('value', flat=True).get(pk=1)
+    return range(last - count + 1, last + 1)
+
+
+def stamp(model, objs_or_pks):
+    """Give rows (instances or primary keys) new change sequence numbers, in the current transaction."""
+    objs = [obj for obj in objs_or_pks if obj is not None]
+    if not objs:
+        return
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using, savepoint=False):
+        seqs = reserve(len(objs))
+        pks = [getattr(obj, 'pk', obj) for obj in objs]
+        if len(pks) == 1:
+            model.objects.filter(pk=pks[0]).update(change_seq=seqs[0])
+        else:
+            connection = connections[using]
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    'UPDATE {} SET {} = %s WHERE {} = %s'.format(
+                        quote(model._meta.db_table), quote('change_seq'), quote(model._meta.pk.column)
+                    ),
+                    list(zip(seqs, pks)),
+                )
+    for obj, seq in zip(objs, seqs):
+        if isinstance(obj, model):
+            obj.change_seq = seq
+
+
+def nulled_references(instance):
+    """``[(model, pks)]`` of tracked rows whose ``SET_NULL`` keys point at ``instance``."""
+    references = []
+    for relation in instance._meta.related_objects:
+        if relation.on_delete is SET_NULL and relation.related_model in TRACKED:
+            pks = list(
+                relation.related_model._base_manager
+                .filter(**{relation.field.name: instance.pk})
+                .values_list('pk', flat=True)
+            )
+            if pks:
+                references.append((relation.related_model, pks))
+    return references
+
+
+@contextmanager
+def archiving():
+    """
+    Deletions inside this block are moves to the archive, which the
+    read-through endpoints still serve: they leave no tombstones.
+    """
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def record_delete(instance, nulled=()):
+    if _archiving.get():
+        return
+    Tombstone.objects.create(
+        seq=reserve(1)[0], model=instance._meta.label_lower, object_id=instance.pk,
+    )
+    for model, pks in nulled:
+        # Deleting the row nulled these keys with a plain UPDATE.
+        stamp(model, pks)
+
+
+def prune_tombstones(days):
+    """
+    Delete tombstones older than ``days``. Clients that last synced before
+    the newest pruned one must sync again from 0. Returns the number pruned.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    with transaction.atomic(using=router.db_for_write(Tombstone)):
+        old = Tombstone.objects.filter(deleted_at__lt=cutoff)
+        through = old.aggregate(through=Max('seq'))['through']
+        if through is None:
+            return 0
+        ChangeSequence.objects.get_or_create(pk=1)
+        ChangeSequence.objects.filter(pk=1, pruned_through__lt=through).update(pruned_through=through)
+        return Tombstone.objects.filter(seq__lte=through).delete()[0]
+
+
+def current():
+    """``(value, pruned_through)`` of the change sequence; ``(0, 0)`` before any change."""
+    return ChangeSequence.objects.filter(pk=1).values_list('value', 'pruned_through').first() or (0, 0)
+
+
+def changes_since(since, feeds, limit, latest=None):
+    """
+    Rows of ``feeds`` changed after sequence number ``since``, each once at
+    its latest change, and the deleted ids, for at most ``limit`` changes.
+    Every query reads the ``change_seq``/``seq`` index from ``since`` on, so
+    the cost follows the number of changes, not the table sizes.
+    ``latest`` is the sequence value, when the caller just read it.
+    """
+    if latest is None:
+        latest = current()[0]
+    labels = {FEEDS[name][0]._meta.label_lower: name for name in feeds}
+    pages = {name: _changed(*FEEDS[name], since, limit + 1) for name in feeds}
+    tombstones = list(
+        Tombstone.objects.filter(seq__gt=since, model__in=labels).order_by('seq')
+        .values_list('seq', 'model', 'object_id')[:limit + 1]
+    )
+
+    seqs = sorted(chain((seq for seq, *_ in tombstones),
+                        *([seq for seq, _ in rows] for _, rows in pages.values())))
+    more = len(seqs) > limit
+    # Everything up to ``latest`` had committed before these reads; a
+    # change committed during them may have a number below one they saw,
+    # so later numbers wait for the next call.
+    through = max(min(seqs[limit - 1] if more else latest, latest), since)
+
+    changes = {}
+    for name, (encode, rows) in pages.items():
+        rows = [row for seq, row in rows if seq <= through]
+        if rows:
+            changes.setdefault(name, {'updated': [], 'deleted': []})['updated'] = encode(rows)
+    for seq, label, object_id in tombstones:
+        if seq <= through:
+            changes.setdefault(labels[label], {'updated': [], 'deleted': []})['deleted'].append(object_id)
+    return {'since': since, 'through': through, 'more': more, 'changes': changes}
+
+
+def _changed(model, serializer_class, since, count):
+    """``(encode, [(seq, row), ...])`` for the first ``count`` rows changed after ``since``."""
+    queryset = model.objects.filter(change_seq__gt=since).order_by('change_seq')
+    try:
+        encoder = RowEncoder(model, serializer_class(), ['change_seq'])
+    except ValueError:
+        return (lambda objs: serializer_class(objs, many=True).data,
+                [(obj.change_seq, obj) for obj in queryset[:count]])
+    seq = encoder.columns.index('change_seq')
+    return encoder.encode, [(row[seq], row) for row in queryset.values_list(*encoder.columns)[:count]]
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only errors are rendered; the stream itself is a StreamingHttpResponse.
+        return f'event: error\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n'.encode()
+
+
+class ChangesView(APIView):
+    """
+    Delta sync: ``GET /api/changes/?since=<seq>&models=patients,appointments``
+    returns the rows created or changed after change ``since`` (each at
+    its latest version, in the list endpoints' shape) and the ids deleted
+    since then, at most ``limit`` changes at a time. Start with ``since=0``
+    and pass the returned ``through`` as the next ``since``; ``more`` says
+    another page is ready. A ``since`` older than pruned tombstones gets
+    ``410 Gone``: sync again from 0.
+
+    ``?wait=<seconds>`` long-polls until there is a change. With
+    ``Accept: text/event-stream`` (``EventSource``) the response is a
+    Server-Sent Events stream of ``changes`` events whose ids are sequence
+    numbers, so a reconnecting client resumes from ``Last-Event-ID``.
+    Under ASGI both wait on the event loop rather than in a worker thread:
+    a long-poll's headers go out at once and its body when there is a
+    change.
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+    default_limit = 500
+    max_limit = 5000
+    max_wait = 60
+
+    def get(self, request):
+        since, feeds, limit = self.parse(request)
+        latest, pruned_through = current()
+        if since and since < pruned_through:
+            return Response(
+                {'detail': 'Changes before this point were pruned; sync again from since=0.'},
+                status=status.HTTP_410_GONE,
+            )
+        # Django buffers a sync iterator whole under ASGI before sending it.
+        asgi = isinstance(request._request, ASGIRequest)
+        if request.accepted_renderer.format == 'sse':
+            events = self.async_stream if asgi else self.stream
+            response = StreamingHttpResponse(events(since, feeds, limit), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        wait = self.parse_number(request, 'wait', 0, self.max_wait)
+        deadline = time.monotonic() + wait
+        result = changes_since(since, feeds, limit, latest)
+        if asgi and not result['changes'] and wait:
+            return StreamingHttpResponse(self.async_wait(result, feeds, limit, deadline),
+                                         content_type='application/json')
+        while not result['changes'] and time.monotonic() < deadline:
+            time.sleep(settings.CHANGES_POLL_SECONDS)
+            result = self.poll(result, feeds, limit)
+        return Response(result)
+
+    def poll(self, result, feeds, limit):
+        """``result`` again, or the changes after it once the sequence has moved past its ``through``."""
+        latest = current()[0]
+        if latest > result['through']:
+            return {**changes_since(result['through'], feeds, limit, latest), 'since': result['since']}
+        return result
+
+    async def async_wait(self, result, feeds, limit, deadline):
+        while not result['changes'] and time.monotonic() < deadline:
+            await asyncio.sleep(settings.CHANGES_POLL_SECONDS)
+            result = await sync_to_async(self.poll)(result, feeds, limit)
+        yield renderers.JSONRenderer().render(result)
+
+    def events(self, since, feeds, limit):
+        """The SSE stream's events; an empty string marks a wait of ``CHANGES_POLL_SECONDS``."""
+        deadline = time.monotonic() + settings.CHANGES_STREAM_SECONDS
+        idle = 0.0
+        yield f'retry: {int(settings.CHANGES_POLL_SECONDS * 1000)}\n\n'
+        while True:
+            latest = current()[0]
+            if latest > since:
+                result = changes_since(since, feeds, limit, latest)
+                since = result['through']
+                if result['changes']:
+                    idle = 0.0
+                    yield f"id: {since}\nevent: changes\ndata: {json.dumps(result, cls=JSONEncoder)}\n\n"
+                if result['more']:
+                    continue
+            if time.monotonic() >= deadline:
+                return
+            yield ''
+            idle += settings.CHANGES_POLL_SECONDS
+            if idle >= 15:
+                # Keeps proxies from closing an idle connection.
+                idle = 0.0
+                yield ': keepalive\n\n'
+
+    def stream(self, since, feeds, limit):
+        for event in self.events(since, feeds, limit):
+            if event:
+                yield event
+            else:
+                time.sleep(settings.CHANGES_POLL_SECONDS)
+
+    async def async_stream(self, since, feeds, limit):
+        events = self.events(since, feeds, limit)
+        # Each step queries the database, so it runs in the sync thread.
+        step = sync_to_async(next)
+        while (event := await step(events, None)) is not None:
+            if event:
+                yield event
+            else:
+                await asyncio.sleep(settings.CHANGES_POLL_SECONDS)
+
+    def parse(self, request):
+        # An EventSource reconnects to the same URL and sends the last id it saw.
+        since = request.headers.get('Last-Event-ID') or request.query_params.get('since', '0')
+        if not since.isdigit():
+            raise ValidationError({'since': ['Enter a change sequence number (0 for a full sync).']})
+        feeds = [name for name in request.query_params.get('models', '').split(',') if name] or list(FEEDS)
+        unknown = [name for name in feeds if name not in FEEDS]
+        if unknown:
+            raise ValidationError({'models': [f"Choose from: {', '.join(FEEDS)}."]})
+        limit = self.parse_number(request, 'limit', self.default_limit, self.max_limit, int)
+        return int(since), feeds, max(limit, 1)
+
+    def parse_number(self, request, name, default, maximum, cast=float):
+        value = request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = cast(value)
+        except ValueError:
+            raise ValidationError({name: ['Enter a number.']})
+        if value != value:
+            raise ValidationError({name: ['Enter a number.']})
+        return min(max(value, 0), maximum)
@@ -0,0 +1,252 @@
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from . import summaries
+from .models import (
+    Appointment, ArchivedAppointment, ArchivedMedicalRecord, Billing, MedicalRecord, Patient,
+    PatientBlockKey, SuspectedDuplicate,
+)
+
+
+FIELDS = ['first_name', 'last_name', 'date_of_birth', 'phone_number', 'email', 'address']
+# How much each field's similarity counts towards a pair's score.
+WEIGHTS = {
+    'name': 0.4,
+    'date_of_birth': 0.25,
+    'phone_number': 0.2,
+    'address': 0.1,
+    'email': 0.05,
+}
+# Candidates that share no phone or birth date key must share this many
+# name trigrams, and at least this fraction of the patient's: a shared
+# first name alone is not enough.
+MIN_SHARED_TRIGRAMS = 3
+MIN_TRIGRAM_OVERLAP = 0.5
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+
+def fold(text):
+    """Lowercase ASCII letters, digits and single spaces."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def name_tokens(first_name, last_name):
+    # Sorted, so swapped first and last names compare equal.
+    return sorted(re.findall(r'[a-z]+', fold(f'{first_name} {last_name}')))
+
+
+def trigrams(tokens):
+    return {f'#{token}#'[i:i + 3] for token in tokens for i in range(len(token))}
+
+
+def soundex(word):
+    letters = re.sub(r'[^a-z]', '', fold(word))
+    if not letters:
+        return ''
+    code, previous = letters[0].upper(), SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit and digit != previous:
+            code += digit
+        if letter not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def phone_key(phone_number):
+    # The last nine digits: 0712 345678, +254 712 345678 and 712345678 match.
+    digits = re.sub(r'\D', '', phone_number or '')
+    return digits[-9:] if len(digits) >= 7 else None
+
+
+def block_keys(patient):
+    """Blocking keys of a patient: phone, birth date with each name's Soundex code, and name trigrams."""
+    keys = set()
+    phone = phone_key(patient.phone_number)
+    if phone:
+        keys.add(f'phone:{phone}')
+    if patient.date_of_birth:
+        born = str(patient.date_of_birth)[:10]
+        keys.update(f'dob:{born}:{soundex(name)}' for name in (patient.first_name, patient.last_name) if soundex(name))
+    keys.update(f'tri:{gram}' for gram in trigrams(name_tokens(patient.first_name, patient.last_name)))
+    return keys
+
+
+def index(patients):
+    """Replace the blocking keys of ``patients`` (saved ``Patient`` instances)."""
+    patients = [patient for patient in patients if patient.pk is not None]
+    if not patients:
+        return
+    with transaction.atomic(savepoint=False):
+        PatientBlockKey.objects.filter(patient_id__in=[patient.pk for patient in patients]).delete()
+        PatientBlockKey.objects.bulk_create(
+            [PatientBlockKey(patient_id=patient.pk, key=key) for patient in patients for key in block_keys(patient)],
+            batch_size=2000,
+        )
+
+
+def candidates(patient_ids):
+    """
+    Pairs ``(low_id, high_id)`` of a patient in ``patient_ids`` and any
+    patient sharing a phone or birth date key, or enough name trigrams
+    (see ``MIN_TRIGRAM_OVERLAP``), with it. Keys shared by more than
+    ``DUPLICATE_MAX_BLOCK_SIZE`` patients (a clinic's switchboard number,
+    a trigram like "son") say too little and are skipped. Three indexed
+    queries, whatever the number of patients.
+    """
+    patient_ids = set(patient_ids)
+    own = defaultdict(set)
+    for patient_id, key in PatientBlockKey.objects.filter(patient_id__in=patient_ids).values_list('patient_id', 'key'):
+        own[patient_id].add(key)
+    keys = set().union(*own.values())
+    if not keys:
+        return set()
+    sizes = (
+        PatientBlockKey.objects.filter(key__in=keys).values('key').annotate(size=Count('id'))
+        .values_list('key', 'size').order_by()
+    )
+    blocks = {key for key, size in sizes if 1 < size <= settings.DUPLICATE_MAX_BLOCK_SIZE}
+    members = defaultdict(list)
+    for key, patient_id in PatientBlockKey.objects.filter(key__in=blocks).values_list('key', 'patient_id'):
+        members[key].append(patient_id)
+
+    strong, shared_trigrams, needed = set(), defaultdict(int), {}
+    for patient_id, patient_keys in own.items():
+        needed[patient_id] = max(
+            MIN_SHARED_TRIGRAMS, MIN_TRIGRAM_OVERLAP * sum(key.startswith('tri:') for key in patient_keys)
+        )
+        for key in patient_keys & blocks:
+            for other_id in members[key]:
+                # Pairs of two listed patients are counted from the lower id.
+                if other_id == patient_id or (other_id in patient_ids and other_id < patient_id):
+                    continue
+                pair = (min(patient_id, other_id), max(patient_id, other_id))
+                if key.startswith('tri:'):
+                    shared_trigrams[patient_id, other_id] += 1
+                else:
+                    strong.add(pair)
+    return strong | {
+        (min(pair), max(pair)) for pair, count in shared_trigrams.items() if count >= needed[pair[0]]
+    }
+
+
+def similarity(a, b, min_score=0.0):
+    """
+    ``(score, reasons)`` for two patients' ``FIELDS`` dicts; ``reasons``
+    lists the fields that match. Birth date, phone and email are compared
+    first: when even identical names and addresses could not lift the
+    score to ``min_score``, the fuzzy comparisons are skipped and the
+    result is ``(0.0, [])``.
+    """
+    def ratio(x, y):
+        return SequenceMatcher(None, x, y).ratio() if x and y else 0.0
+
+    born_a, born_b = a['date_of_birth'], b['date_of_birth']
+    if born_a == born_b:
+        born = 1.0
+    elif (born_a.day, born_a.month) == (born_b.month, born_b.day) and born_a.year == born_b.year:
+        born = 0.5  # Day and month swapped
+    else:
+        born = 0.5 if sum(x == y for x, y in zip(born_a.timetuple()[:3], born_b.timetuple()[:3])) == 2 else 0.0
+    phone_a = phone_key(a['phone_number'])
+    local_a = fold(a['email'].split('@')[0])
+    scores = {
+        'date_of_birth': born,
+        'phone_number': 1.0 if phone_a and phone_a == phone_key(b['phone_number']) else 0.0,
+        'email': 1.0 if local_a and local_a == fold(b['email'].split('@')[0]) else 0.0,
+    }
+    if sum(WEIGHTS[name] * value for name, value in scores.items()) + WEIGHTS['name'] + WEIGHTS['address'] < min_score:
+        return 0.0, []
+    scores['name'] = ratio(' '.join(name_tokens(a['first_name'], a['last_name'])),
+                           ' '.join(name_tokens(b['first_name'], b['last_name'])))
+    scores['address'] = ratio(fold(a['address']), fold(b['address']))
+    score = sum(WEIGHTS[name] * value for name, value in scores.items())
+    return round(score, 3), [name for name in WEIGHTS if scores[name] >= 0.85]
+
+
+def detect(patient_ids, min_score=None):
+    """
+    Score the candidate pairs of ``patient_ids`` and store those scoring at
+    least ``min_score`` (default ``DUPLICATE_MIN_SCORE``) as suspected
+    duplicates. Dismissed pairs stay dismissed; open pairs of these
+    patients that no longer score high enough are removed. Returns the
+    set of ``(lower id, higher id)`` pairs found.
+    """
+    min_score = settings.DUPLICATE_MIN_SCORE if min_score is None else min_score
+    patient_ids = set(patient_ids)
+    pairs = candidates(patient_ids)
+    profiles = {
+        row['id']: row for row in
+        Patient.objects.filter(pk__in={pk for pair in pairs for pk in pair}).values('id', *FIELDS)
+    }
+    found = {}
+    for pair in pairs:
+        score, reasons = similarity(profiles[pair[0]], profiles[pair[1]], min_score)
+        if score >= min_score:
+            found[pair] = (score, reasons)
+    with transaction.atomic(savepoint=False):
+        stale = (
+            SuspectedDuplicate.objects.filter(status="Open")
+            .filter(Q(patient_id__in=patient_ids) | Q(other_id__in=patient_ids))
+            .values_list('pk', 'patient_id', 'other_id')
+        )
+        SuspectedDuplicate.objects.filter(pk__in=[pk for pk, *pair in stale if tuple(pair) not in found]).delete()
+        SuspectedDuplicate.objects.bulk_create(
+            [
+                SuspectedDuplicate(patient_id=low, other_id=high, score=score, reasons=reasons)
+                for (low, high), (score, reasons) in found.items()
+            ],
+            update_conflicts=True, unique_fields=['patient', 'other'], update_fields=['score', 'reasons'],
+            batch_size=1000,
+        )
+    return set(found)
+
+
+def refresh(patients):
+    """Re-key saved patients and check them against their blocks; called on every patient write."""
+    patients = [patient for patient in patients if patient.pk is not None]
+    index(patients)
+    detect(patient.pk for patient in patients)
+
+
+def merge(keep, duplicate):
+    """
+    Move ``duplicate``'s appointments, medical records and bills, live and
+    archived, to ``keep`` and delete ``duplicate``. Returns the number of
+    rows moved per model.
+    """
+    # signals imports this module for its patient handlers.
+    from .signals import post_bulk_save
+
+    if keep.pk == duplicate.pk:
+        raise ValueError("A patient cannot be merged into itself")
+    moved = {}
+    with transaction.atomic():
+        for model in (Appointment, MedicalRecord, Billing):
+            rows = list(model.objects.filter(patient_id=duplicate.pk))
+            for row in rows:
+                row.patient_id = keep.pk
+            model.objects.bulk_update(rows, ['patient'], batch_size=1000)
+            # Summaries, rollups, search and change tracking follow the rows.
+            post_bulk_save.send(sender=model, created=[], updated=rows)
+            moved[model._meta.model_name] = len(rows)
+        for model in (ArchivedAppointment, ArchivedMedicalRecord):
+            moved[model._meta.model_name] = model.objects.filter(patient_id=duplicate.pk).update(patient_id=keep.pk)
+        duplicate.delete()
+        summaries.refresh([keep.pk])
+    detect([keep.pk])
+    return moved
+
+
+def ranked(status="Open"):
+    return SuspectedDuplicate.objects.filter(status=status).select_related('patient', 'other').order_by('-score', 'id')
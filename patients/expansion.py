@@ -0,0 +1,163 @@
+from importlib import import_module
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from .instrumentation import measure
+
+
+def parse_paths(value):
+    """``"a,b.c"`` -> ``{"a": set(), "b": {"c"}}``; nested names are joined with dots."""
+    tree = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        head, _, rest = item.partition('.')
+        tree.setdefault(head, set())
+        if rest:
+            tree[head].add(rest)
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer support for sparse fieldsets and expansion.
+
+    ``fields`` limits the output to the given names. ``expand`` replaces
+    primary key fields with the nested serializer named in
+    ``Meta.expandable_fields``. Both accept dotted paths, which are passed
+    down to the nested serializer, e.g. ``expand=doctor.department`` or
+    ``fields=id,patient.first_name``. The root serializer takes them from
+    the ``fields``/``expand`` context keys set by ``ShapedQuerysetMixin``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._only_fields = kwargs.pop('only_fields', None)
+        self._expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def is_root(self):
+        return self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+        )
+
+    def to_representation(self, instance):
+        if not self.is_root:
+            return super().to_representation(instance)
+        with measure('serialize'):
+            return super().to_representation(instance)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        is_root = self.is_root
+        only = self._only_fields
+        expand = self._expand
+        if is_root:
+            only = self.context.get('fields') if only is None else only
+            expand = self.context.get('expand') if expand is None else expand
+        only = parse_paths(only) if isinstance(only, str) else (only or {})
+        expand = parse_paths(expand) if isinstance(expand, str) else (expand or {})
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name, nested in expand.items():
+            if name not in expandable:
+                continue
+            serializer_class = expandable[name]
+            if isinstance(serializer_class, str):
+                serializer_class = getattr(import_module(self.__class__.__module__), serializer_class)
+            fields[name] = serializer_class(
+                read_only=True,
+                allow_null=True,
+                only_fields=_join(only.get(name)),
+                expand=_join(nested),
+            )
+
+        if only:
+            fields = {name: field for name, field in fields.items() if name in only}
+        return fields
+
+
+def _join(paths):
+    return ','.join(sorted(paths)) if paths else None
+
+
+class ShapedQuerysetMixin:
+    """
+    Viewset side of ``DynamicFieldsMixin``: reads ``?fields=`` and
+    ``?expand=`` on reads, hands them to the serializer and derives
+    ``select_related``/``prefetch_related``/``only()`` from the serializer
+    that results, so any shape costs a fixed number of queries per page.
+    """
+    expand_actions = ('list', 'retrieve')
+    fields_actions = ('list', 'retrieve', 'export')
+
+    def get_requested_shape(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None, None
+        params = request.query_params
+        fields = params.get('fields') if self.action in self.fields_actions else None
+        expand = params.get('expand') if self.action in self.expand_actions else None
+        return fields or None, expand or None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fields, expand = self.get_requested_shape()
+        context.update(fields=fields, expand=expand)
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields, expand = self.get_requested_shape()
+        if not fields and not expand:
+            return queryset
+
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        select, prefetch, columns = [], [], set()
+        complete = _plan(queryset.model, serializer, '', select, prefetch, columns)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if complete and not prefetch:
+            columns.update(name.lstrip('-') for name in getattr(self, 'cursor_ordering', ()))
+            queryset = queryset.only(*columns)
+        return queryset
+
+
+def _plan(model, serializer, prefix, select, prefetch, columns):
+    """
+    Walk ``serializer``'s fields collecting relations to join and columns to
+    load. Returns False if some field reads something other than a model
+    column, in which case ``only()`` is not safe to apply.
+    """
+    complete = True
+    columns.add(prefix + model._meta.pk.name)
+    for field in serializer.fields.values():
+        if field.source == '*' or '.' in field.source:
+            complete = False
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            complete = False
+            continue
+        path = prefix + field.source
+        if isinstance(field, serializers.BaseSerializer):
+            if model_field.many_to_many or model_field.one_to_many:
+                prefetch.append(path)
+                continue
+            select.append(path)
+            if model_field.concrete:
+                columns.add(path)
+            complete &= _plan(
+                model_field.related_model, field, path + '__', select, prefetch, columns
+            )
+        elif model_field.concrete:
+            columns.add(path)
+        else:
+            complete = False
+    return complete
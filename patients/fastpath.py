@@ -0,0 +1,171 @@
+import json
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .instrumentation import measure
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib C encoder is used instead
+    orjson = None
+
+
+def _identity(value):
+    return value
+
+
+def _datetime_encoder(field):
+    """Same output as ``DateTimeField.to_representation`` for aware datetimes, without the per-call lookups."""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != 'iso-8601' or tz is None:
+        return field.to_representation
+
+    def encode(value):
+        if not value:
+            return None
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return encode
+
+
+def _date_encoder(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != 'iso-8601':
+        return field.to_representation
+    return lambda value: value.isoformat() if value else None
+
+
+def column_encoder(field):
+    """
+    A function turning the raw ``values_list()`` value of ``field``'s column
+    into exactly what ``field.to_representation`` gives for the model
+    attribute, or ``None`` if the field cannot be read from a single column.
+    """
+    if isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField,
+                          serializers.SerializerMethodField, serializers.HiddenField)):
+        return None
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return _identity if field.pk_field is None else None
+    if isinstance(field, serializers.RelatedField):
+        return None
+    if isinstance(field, (serializers.ChoiceField, serializers.CharField, serializers.IntegerField)):
+        # Database values are already str/int; to_representation would only
+        # re-coerce them.
+        return _identity
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_encoder(field)
+    if isinstance(field, serializers.DateField):
+        return _date_encoder(field)
+    return field.to_representation
+
+
+class RowEncoder:
+    """
+    Precompiled conversion of ``values_list()`` rows into the dicts
+    ``serializer`` would produce for the same model instances.
+    """
+
+    def __init__(self, model, serializer, extra_columns=()):
+        self.spec = []
+        columns = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            encoder = column_encoder(field)
+            if encoder is None or field.source == '*' or '.' in field.source:
+                raise ValueError(f"{name} cannot be read from a column")
+            model_field = model._meta.get_field(field.source)
+            if not model_field.concrete or model_field.many_to_many:
+                raise ValueError(f"{name} is not a column")
+            if model_field.attname not in columns:
+                columns.append(model_field.attname)
+            self.spec.append((name, columns.index(model_field.attname), None if encoder is _identity else encoder))
+        for attname in extra_columns:
+            if attname not in columns:
+                columns.append(attname)
+        self.columns = columns
+
+    def encode(self, rows):
+        spec = self.spec
+        result = []
+        for row in rows:
+            item = {}
+            for name, index, encoder in spec:
+                value = row[index]
+                item[name] = value if encoder is None or value is None else encoder(value)
+            result.append(item)
+        return result
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that hands responses built by ``FastListMixin`` (plain
+    str/int/None data) straight to ``orjson`` when it is installed, or to the
+    C json encoder without DRF's encoder class. Output is byte-identical;
+    everything else goes through ``JSONRenderer``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get('response')
+        if (
+            data is None
+            or not getattr(response, 'plain_data', False)
+            or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if orjson is not None:
+            ret = orjson.dumps(data)
+            return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        ret = json.dumps(data, ensure_ascii=False, allow_nan=not self.strict, separators=(',', ':'))
+        return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+class FastListMixin:
+    """
+    Read-only fast path for ``list``: rows are fetched with
+    ``values_list()`` and converted by a ``RowEncoder`` instead of building
+    model instances and running each field's ``to_representation``.
+
+    Used whenever the serializer's fields are all plain columns (no
+    ``?expand=``) and ``SERIALIZER_FAST_PATH`` is on; otherwise ``list``
+    runs as usual. Pagination, filters and search are unchanged.
+    """
+
+    def get_row_encoder(self):
+        if not getattr(settings, 'SERIALIZER_FAST_PATH', True):
+            return None
+        if self.get_serializer_context().get('expand'):
+            return None
+        queryset_model = self.get_serializer_class().Meta.model
+        extra = [queryset_model._meta.get_field(name.lstrip('-')).attname
+                 for name in getattr(self, 'cursor_ordering', ())]
+        try:
+            return RowEncoder(queryset_model, self.get_serializer(), extra)
+        except ValueError:
+            return None
+
+    def list(self, request, *args, **kwargs):
+        encoder = self.get_row_encoder()
+        if encoder is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*encoder.columns, named=True)
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        with measure('serialize'):
+            data = encoder.encode(rows)
+        if page is not None:
+            response = self.get_paginated_response(data)
+        else:
+            response = Response(data)
+        response.plain_data = True
+        return response
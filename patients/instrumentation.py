@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings collected while one request is handled."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.timings = defaultdict(float)
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def sql_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def slowest(self, count):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:count]
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to the current request's ``name`` timing."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - started
+
+
+def record_sql(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries.append((sql, time.perf_counter() - started))
+
+
+@receiver(connection_created)
+def install_sql_timer(sender, connection, **kwargs):
+    # Installed on every connection rather than around each request, so
+    # queries the async views run through sync_to_async threads are seen
+    # too. The request is found through a context variable, which asgiref
+    # carries into those threads.
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_sql)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class Registry:
+    """Per-process histograms keyed by ``(metric, view)``."""
+
+    metrics = {
+        'http_request_duration_seconds': ('Request latency.', LATENCY_BUCKETS),
+        'http_request_db_queries': ('SQL queries per request.', QUERY_BUCKETS),
+        'http_request_db_seconds': ('Time spent in SQL per request.', LATENCY_BUCKETS),
+        'http_request_serialize_seconds': ('Time spent serializing and rendering per request.', LATENCY_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.histograms = {}
+
+    def observe(self, view, values):
+        with self.lock:
+            for name, value in values.items():
+                histogram = self.histograms.get((name, view))
+                if histogram is None:
+                    histogram = self.histograms[(name, view)] = Histogram(self.metrics[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in self.metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, view), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    label = view.replace('\\', '\\\\').replace('"', '\\"')
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{view="{label}"}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{view="{label}"}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class InstrumentationMiddleware:
+    """
+    Records view name, total time, SQL query count and time, and
+    serialization time for every request.
+
+    The numbers are sent back in a ``Server-Timing`` header, added to the
+    histograms served by ``metrics_view``, and any request over
+    ``REQUEST_QUERY_BUDGET`` queries or ``REQUEST_LATENCY_BUDGET_MS`` is
+    logged with its slowest statements. Streamed bodies are produced after
+    this middleware returns, so their time is not included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that too.
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.timings['serialize'] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else '<unresolved>'
+        sql_time = metrics.sql_time
+        serialize = metrics.timings['serialize']
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total * 1000:.2f}',
+            f'db;dur={sql_time * 1000:.2f};desc="{metrics.query_count} queries"',
+            f'serialize;dur={serialize * 1000:.2f}',
+        ])
+        registry.observe(view, {
+            'http_request_duration_seconds': total,
+            'http_request_db_queries': metrics.query_count,
+            'http_request_db_seconds': sql_time,
+            'http_request_serialize_seconds': serialize,
+        })
+
+        query_budget = getattr(settings, 'REQUEST_QUERY_BUDGET', None)
+        latency_budget = getattr(settings, 'REQUEST_LATENCY_BUDGET_MS', None)
+        over_queries = query_budget is not None and metrics.query_count > query_budget
+        over_latency = latency_budget is not None and total * 1000 > latency_budget
+        if over_queries or over_latency:
+            statements = ''.join(
+                f'\n  {duration * 1000:.2f}ms {sql}'
+                for sql, duration in metrics.slowest(getattr(settings, 'REQUEST_SLOW_STATEMENTS', 5))
+            )
+            logger.warning(
+                '%s %s (%s) took %.1fms with %d queries (%.1fms SQL)%s',
+                request.method, request.get_full_path(), view, total * 1000,
+                metrics.query_count, sql_time * 1000, statements,
+            )
+        return response
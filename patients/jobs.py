@@ -0,0 +1,213 @@
+import logging
+import random
+import threading
+import time
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class Task:
+    def __init__(self, name, func, max_attempts, validate):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.validate = validate
+
+
+def task(name, max_attempts=3, validate=None):
+    """
+    Register ``func(progress, **params)`` as the job kind ``name``. Its
+    return value (JSON-serializable) becomes ``Job.result``; an exception
+    fails the attempt. ``validate(params)`` may raise ``ValueError`` to
+    reject a job before it is queued.
+    """
+    def register(func):
+        TASKS[name] = Task(name, func, max_attempts, validate)
+        return func
+    return register
+
+
+def enqueue(kind, params=None, run_after=None):
+    """Queue a job; raises ``ValueError`` for unknown kinds or invalid params."""
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    params = params or {}
+    if TASKS[kind].validate is not None:
+        TASKS[kind].validate(params)
+    return Job.objects.create(
+        kind=kind, params=params, max_attempts=TASKS[kind].max_attempts,
+        run_after=run_after or timezone.now(),
+    )
+
+
+class Progress:
+    """
+    Passed to running tasks to report progress and name their result file.
+    Progress is written at most once a ``interval`` seconds.
+    """
+    interval = 1.0
+
+    def __init__(self, job):
+        self.job = job
+        self.done = 0
+        self.total = None
+        self.message = ''
+        self.result_file = ''
+        self._written = 0.0
+
+    def __call__(self, done, total=None, message=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message[:255]
+        if time.monotonic() - self._written >= self.interval:
+            self._written = time.monotonic()
+            Job.objects.filter(pk=self.job.pk).update(
+                progress_done=self.done, progress_total=self.total, message=self.message,
+                heartbeat_at=timezone.now(),
+            )
+
+    def result_path(self, filename):
+        """Where to write the downloadable result; ``filename`` is what clients see."""
+        directory = Path(settings.JOB_RESULTS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{self.job.pk}-{filename}'
+        self.result_file = str(path)
+        return path
+
+
+class Heartbeat:
+    """Touches ``Job.heartbeat_at`` from a thread while the job runs, so stalled workers can be told apart."""
+
+    def __init__(self, job_id, interval):
+        self.job_id = job_id
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, daemon=True)
+
+    def beat(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    Job.objects.filter(pk=self.job_id, status="Running").update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.warning("Could not record heartbeat of job %s", self.job_id, exc_info=True)
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def claim(worker):
+    """Atomically take the next job that is due, or return ``None``."""
+    now = timezone.now()
+    with transaction.atomic():
+        # BEGIN IMMEDIATE on SQLite, SKIP LOCKED elsewhere: no two workers
+        # can take the same row.
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status="Queued", run_after__lte=now)
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        Job.objects.filter(pk=job.pk).update(
+            status="Running", attempts=F('attempts') + 1, worker=worker,
+            started_at=now, heartbeat_at=now, finished_at=None,
+        )
+    job.refresh_from_db()
+    return job
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts``: exponential, capped at an hour, with 10% jitter."""
+    delay = min(settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), 3600)
+    return timedelta(seconds=delay * random.uniform(1, 1.1))
+
+
+def run(job):
+    """Run a claimed job and record its outcome, scheduling a retry if attempts remain."""
+    registered = TASKS.get(job.kind)
+    progress = Progress(job)
+    started = time.monotonic()
+    try:
+        if registered is None:
+            raise LookupError(f"Unknown job kind: {job.kind}")
+        with Heartbeat(job.pk, settings.JOB_HEARTBEAT_SECONDS):
+            result = registered.func(progress, **job.params)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        fields = {'error': error, 'heartbeat_at': now, 'message': progress.message}
+        if registered is not None and job.attempts < job.max_attempts:
+            fields.update(status="Queued", run_after=now + backoff(job.attempts))
+            logger.warning("Job %s (%s) failed attempt %d, retrying", job.pk, job.kind, job.attempts)
+        else:
+            fields.update(status="Failed", finished_at=now)
+            logger.error("Job %s (%s) failed after %d attempts\n%s", job.pk, job.kind, job.attempts, error)
+        Job.objects.filter(pk=job.pk).update(**fields)
+        return False
+    now = timezone.now()
+    Job.objects.filter(pk=job.pk).update(
+        status="Succeeded", result=result, result_file=progress.result_file, error='',
+        progress_done=progress.done, progress_total=progress.total, message=progress.message,
+        heartbeat_at=now, finished_at=now,
+    )
+    logger.info("Job %s (%s) succeeded in %.1fs", job.pk, job.kind, time.monotonic() - started)
+    return True
+
+
+def requeue_stale():
+    """
+    Put back running jobs whose worker stopped sending heartbeats, or fail
+    them if that was their last attempt. Returns the number of jobs touched.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    stale = Job.objects.filter(status="Running", heartbeat_at__lt=cutoff)
+    lost = "Worker stopped responding"
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status="Failed", error=lost, finished_at=timezone.now()
+    )
+    return failed + stale.update(status="Queued", error=lost, run_after=timezone.now())
+
+
+def work(worker, stop, poll_interval=1.0, burst=False, max_jobs=None):
+    """
+    Claim and run jobs until ``stop`` (a ``threading``/``multiprocessing``
+    Event) is set, ``max_jobs`` have run, or, with ``burst``, no job is due.
+    Returns the number of jobs run.
+    """
+    count = 0
+    while not stop.is_set() and (max_jobs is None or count < max_jobs):
+        close_old_connections()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        run(job)
+        count += 1
+    close_old_connections()
+    return count
@@ -0,0 +1,52 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from patients import archive
+from patients.models import Appointment, MedicalRecord
+
+
+MODELS = {
+    'appointments': Appointment,
+    'medical-records': MedicalRecord,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointments and medical records older than the retention window into the "
+        "archive tables, in batches. Billed appointments stay live. Archived rows are "
+        "still served with ?include_archived=true and in patient timelines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_RETENTION_DAYS,
+                            help="Keep rows from the last DAYS days live (default: ARCHIVE_RETENTION_DAYS).")
+        parser.add_argument('--before', help="Archive rows dated before this day (YYYY-MM-DD) instead.")
+        parser.add_argument('--only', choices=sorted(MODELS), action='append',
+                            help="Archive only this kind of row; may be repeated.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Count the rows that would move.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0 or options['days'] < 0:
+            raise CommandError("--batch-size must be positive and --days not negative")
+        if options['before']:
+            day = parse_date(options['before'])
+            if day is None:
+                raise CommandError(f"Invalid date: {options['before']}")
+            cutoff = timezone.make_aware(datetime.combine(day, time()))
+        else:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+
+        for name in options['only'] or MODELS:
+            model = MODELS[name]
+            if options['dry_run']:
+                count = archive.archivable(model, cutoff).count()
+                self.stdout.write(f"{count} {name} would be archived")
+                continue
+            count = archive.archive_rows(model, cutoff, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} {name} dated before {cutoff:%Y-%m-%d}"))
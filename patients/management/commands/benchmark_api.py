@@ -0,0 +1,154 @@
+import json
+import platform
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from hospital_patient_management.urls import router
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def host():
+    # The test client's requests still go through ALLOWED_HOSTS validation.
+    for name in settings.ALLOWED_HOSTS:
+        if name != '*':
+            return name.lstrip('.')
+    return 'localhost'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run on every database alias, not just ``default``, where reads are not routed."""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every router endpoint in-process against the current database "
+        "(seed it first with seed_hospital). Records p50/p95/p99 latency, throughput "
+        "and SQL queries per request for each list and detail endpoint, writes the "
+        "results as JSON, and exits non-zero if any endpoint regressed past --threshold "
+        "against --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests per endpoint.")
+        parser.add_argument('--endpoint', action='append', dest='endpoints', metavar='NAME',
+                            help="Only run these endpoints, e.g. patient-list (repeatable).")
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--baseline', help="Results file to compare against.")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed fractional increase in p95 latency before failing.")
+        parser.add_argument('--save-baseline', metavar='PATH', help="Also write the results here as the new baseline.")
+
+    def get_endpoints(self):
+        """``[(name, url), ...]`` for the list and first-row detail URL of each registered viewset."""
+        endpoints = []
+        for prefix, viewset, basename in router.registry:
+            endpoints.append((f'{basename}-list', f'/api/{prefix}/'))
+            pk = viewset.queryset.model.objects.order_by('pk').values_list('pk', flat=True).first()
+            if pk is not None:
+                endpoints.append((f'{basename}-detail', f'/api/{prefix}/{pk}/'))
+        return endpoints
+
+    def handle(self, *args, **options):
+        if options['iterations'] <= 0:
+            raise CommandError("--iterations must be positive")
+        endpoints = self.get_endpoints()
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - {name for name, _ in endpoints}
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = [(name, url) for name, url in endpoints if name in options['endpoints']]
+
+        client = Client(SERVER_NAME=host(), HTTP_ACCEPT='application/json')
+        results = {}
+        self.stdout.write(f"{'endpoint':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>8}")
+        for name, url in endpoints:
+            results[name] = self.measure(client, url, options)
+            row = results[name]
+            self.stdout.write(
+                f"{name:<24} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                f"{row['requests_per_second']:>8.0f} {row['queries']:>8}"
+            )
+
+        report = {
+            'created': datetime.now(dt_timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'endpoints': results,
+        }
+        for path in filter(None, (options['output'], options['save_baseline'])):
+            with open(path, 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['threshold'])
+
+    def measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            client.get(url)
+        latencies = []
+        with count_queries() as queries:
+            started = time.perf_counter()
+            for _ in range(options['iterations']):
+                before = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - before)
+                if response.status_code != 200:
+                    raise CommandError(f"GET {url} returned {response.status_code}")
+            elapsed = time.perf_counter() - started
+        return {
+            'url': url,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'requests_per_second': options['iterations'] / elapsed,
+            'queries': round(queries.count / options['iterations'], 2),
+        }
+
+    def compare(self, results, path, threshold):
+        """Fail on a p95 latency increase beyond ``threshold`` or any extra query per request."""
+        try:
+            with open(path) as handle:
+                baseline = json.load(handle)['endpoints']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Cannot read baseline {path}: {exc}")
+        regressions = []
+        for name, row in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            limit = before['p95_ms'] * (1 + threshold)
+            if row['p95_ms'] > limit:
+                regressions.append(f"{name}: p95 {row['p95_ms']:.2f}ms > {limit:.2f}ms")
+            if row['queries'] > before['queries']:
+                regressions.append(f"{name}: {row['queries']} queries per request > {before['queries']}")
+        if regressions:
+            raise CommandError("Performance regressed against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}"))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from patients import duplicates
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Score every patient against the patients sharing a blocking key and record suspected "
+        "duplicates. New and edited patients are checked as they are saved; run this with "
+        "--rebuild after an import that bypassed signals or a change to the matching rules."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Recompute every patient's blocking keys first.")
+        parser.add_argument('--min-score', type=float, help="Report pairs scoring at least this (default: DUPLICATE_MIN_SCORE).")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--top', type=int, default=0, help="Print the N best-scoring open pairs.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size must be positive")
+        if options['min_score'] is not None and not 0 <= options['min_score'] <= 1:
+            raise CommandError("--min-score must be between 0 and 1")
+
+        if options['rebuild']:
+            for chunk in self.chunks(options['batch_size'], fields=['id', *duplicates.FIELDS]):
+                duplicates.index(chunk)
+        found = set()
+        for chunk in self.chunks(options['batch_size'], fields=['id']):
+            # A pair split across two chunks is found from both sides.
+            found |= duplicates.detect([patient.pk for patient in chunk], options['min_score'])
+        self.stdout.write(self.style.SUCCESS(f"Found {len(found)} suspected duplicate pairs"))
+
+        for pair in duplicates.ranked()[:options['top']]:
+            self.stdout.write(
+                f"{pair.score:.3f}  #{pair.patient_id} {pair.patient.first_name} {pair.patient.last_name}"
+                f"  ~  #{pair.other_id} {pair.other.first_name} {pair.other.last_name}"
+                f"  ({', '.join(pair.reasons)})"
+            )
+
+    def chunks(self, size, fields):
+        last = 0
+        while True:
+            chunk = list(Patient.objects.filter(pk__gt=last).order_by('pk').only(*fields)[:size])
+            if not chunk:
+                return
+            yield chunk
+            last = chunk[-1].pk
@@ -0,0 +1,39 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from patients import billing
+
+
+class Command(BaseCommand):
+    help = (
+        "Bill every completed appointment that has no bill yet, priced from the tariff table. "
+        "Safe to run repeatedly and concurrently; each appointment is billed once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help="Only appointments dated on or before this day (YYYY-MM-DD).")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help="Count and price without creating bills.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be positive")
+        until = None
+        if options['through']:
+            day = parse_date(options['through'])
+            if day is None:
+                raise CommandError(f"Invalid date: {options['through']}")
+            until = timezone.make_aware(datetime.combine(day + timedelta(days=1), time()))
+
+        result = billing.generate_bills(until, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        verb = "Would bill" if options['dry_run'] else "Billed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['billed']} appointments for {result['amount']:.2f} in total"
+        ))
+        if result['unpriced']:
+            self.stdout.write(self.style.WARNING(
+                f"{result['unpriced']} completed appointments have no matching tariff and were not billed"
+            ))
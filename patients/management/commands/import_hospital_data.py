@@ -0,0 +1,377 @@
+import csv
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from patients.models import (
+    Department, Doctor, Patient, Appointment, MedicalRecord, Billing, ImportCheckpoint
+)
+from patients.signals import post_bulk_save
+
+
+def read_rows(path, file_format):
+    if file_format == 'auto':
+        file_format = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def required(row, name):
+    value = row.get(name)
+    if value is None or str(value).strip() == '':
+        raise ValueError(f"missing {name}")
+    return str(value).strip()
+
+
+def parse_when(row, name, default=None):
+    value = row.get(name)
+    if not value:
+        if default is not None:
+            return default
+        raise ValueError(f"missing {name}")
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        day = parse_date(str(value))
+        if day is None:
+            raise ValueError(f"invalid {name}: {value!r}")
+        parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def bounded_int(row, name, default, minimum, maximum):
+    value = row.get(name)
+    if value is None or str(value).strip() == '':
+        return default
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"invalid {name}: {value!r}")
+    if not minimum <= number <= maximum:
+        raise ValueError(f"{name} must be between {minimum} and {maximum}: {number}")
+    return number
+
+
+def choice(row, name, choices, default):
+    value = row.get(name) or default
+    if value not in dict(choices):
+        raise ValueError(f"invalid {name}: {value!r}")
+    return value
+
+
+class Lookups:
+    """
+    In-memory natural key -> primary key maps, loaded from the database the
+    first time each is needed and extended as new rows are inserted.
+    """
+
+    def __init__(self):
+        self._maps = {}
+
+    def loaded(self, name):
+        return name in self._maps
+
+    def get(self, name):
+        if name not in self._maps:
+            self._maps[name] = getattr(self, f'load_{name}')()
+        return self._maps[name]
+
+    def load_departments(self):
+        return dict(Department.objects.values_list('name', 'id').iterator(chunk_size=10000))
+
+    def load_doctors(self):
+        return dict(Doctor.objects.values_list('email', 'id').iterator(chunk_size=10000))
+
+    def load_patients(self):
+        return dict(Patient.objects.values_list('email', 'id').iterator(chunk_size=10000))
+
+    def load_appointments(self):
+        return {
+            (patient_id, doctor_id, date): pk
+            for pk, patient_id, doctor_id, date in
+            Appointment.objects.values_list('id', 'patient_id', 'doctor_id', 'date').iterator(chunk_size=10000)
+        }
+
+    def load_billed(self):
+        return set(Billing.objects.values_list('appointment_id', flat=True).iterator(chunk_size=10000))
+
+
+class Loader:
+    model = None
+    key_map = None
+
+    def __init__(self, lookups):
+        self.lookups = lookups
+        self.pending_keys = set()
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def key(self, obj):
+        return None
+
+    def check_unique(self, obj):
+        key = self.key(obj)
+        if key is None:
+            return
+        if key in self.lookups.get(self.key_map) or key in self.pending_keys:
+            raise ValueError(f"duplicate {self.model._meta.verbose_name} {key!r}")
+        self.pending_keys.add(key)
+
+    def inserted(self, objects):
+        # Maps that were never loaded will pick the new rows up from the
+        # database when they are first needed.
+        if self.key_map and self.lookups.loaded(self.key_map):
+            lookup = self.lookups.get(self.key_map)
+            for obj in objects:
+                lookup[self.key(obj)] = obj.pk
+        self.pending_keys.clear()
+
+
+class DepartmentLoader(Loader):
+    model = Department
+    key_map = 'departments'
+
+    def build(self, row):
+        return Department(name=required(row, 'name'), description=row.get('description') or '')
+
+    def key(self, obj):
+        return obj.name
+
+
+class DoctorLoader(Loader):
+    model = Doctor
+    key_map = 'doctors'
+
+    def build(self, row):
+        department_id = None
+        if row.get('department'):
+            department_id = self.lookups.get('departments').get(row['department'].strip())
+            if department_id is None:
+                raise ValueError(f"unknown department {row['department']!r}")
+        return Doctor(
+            first_name=required(row, 'first_name'),
+            last_name=required(row, 'last_name'),
+            specialization=required(row, 'specialization'),
+            phone_number=required(row, 'phone_number'),
+            email=required(row, 'email'),
+            department_id=department_id,
+        )
+
+    def key(self, obj):
+        return obj.email
+
+
+class PatientLoader(Loader):
+    model = Patient
+    key_map = 'patients'
+
+    def build(self, row):
+        date_of_birth = parse_date(required(row, 'date_of_birth'))
+        if date_of_birth is None:
+            raise ValueError(f"invalid date_of_birth {row['date_of_birth']!r}")
+        return Patient(
+            first_name=required(row, 'first_name'),
+            last_name=required(row, 'last_name'),
+            date_of_birth=date_of_birth,
+            phone_number=required(row, 'phone_number'),
+            email=required(row, 'email'),
+            address=row.get('address') or '',
+        )
+
+    def key(self, obj):
+        return obj.email
+
+
+def resolve(lookups, name, row, column, optional=False):
+    value = (row.get(column) or '').strip()
+    if not value and optional:
+        return None
+    pk = lookups.get(name).get(value)
+    if pk is None:
+        raise ValueError(f"unknown {column} {value!r}")
+    return pk
+
+
+class AppointmentLoader(Loader):
+    model = Appointment
+    key_map = 'appointments'
+
+    def build(self, row):
+        return Appointment(
+            patient_id=resolve(self.lookups, 'patients', row, 'patient_email'),
+            doctor_id=resolve(self.lookups, 'doctors', row, 'doctor_email'),
+            date=parse_when(row, 'date'),
+            duration_minutes=bounded_int(row, 'duration_minutes', 30, 1, Appointment.MAX_DURATION_MINUTES),
+            reason=row.get('reason') or '',
+            status=choice(row, 'status', Appointment.STATUS_CHOICES, 'Scheduled'),
+        )
+
+    def key(self, obj):
+        return (obj.patient_id, obj.doctor_id, obj.date)
+
+    def check_unique(self, obj):
+        # Legacy systems do double-book; keep every row.
+        pass
+
+
+class MedicalRecordLoader(Loader):
+    model = MedicalRecord
+
+    def build(self, row):
+        return MedicalRecord(
+            patient_id=resolve(self.lookups, 'patients', row, 'patient_email'),
+            doctor_id=resolve(self.lookups, 'doctors', row, 'doctor_email', optional=True),
+            diagnosis=required(row, 'diagnosis'),
+            treatment=row.get('treatment') or '',
+            created_at=parse_when(row, 'created_at', default=timezone.now()),
+        )
+
+
+class BillingLoader(Loader):
+    model = Billing
+    key_map = 'billed'
+
+    def build(self, row):
+        patient_id = resolve(self.lookups, 'patients', row, 'patient_email')
+        doctor_id = resolve(self.lookups, 'doctors', row, 'doctor_email')
+        appointment_id = self.lookups.get('appointments').get(
+            (patient_id, doctor_id, parse_when(row, 'appointment_date'))
+        )
+        if appointment_id is None:
+            raise ValueError("no matching appointment")
+        try:
+            amount = Decimal(required(row, 'amount'))
+        except InvalidOperation:
+            raise ValueError(f"invalid amount {row['amount']!r}")
+        if amount < 0:
+            raise ValueError("amount cannot be negative")
+        return Billing(
+            patient_id=patient_id,
+            appointment_id=appointment_id,
+            amount=amount,
+            payment_status=choice(row, 'payment_status', Billing.PAYMENT_STATUS_CHOICES, 'Pending'),
+            billing_date=parse_when(row, 'billing_date', default=timezone.now()),
+        )
+
+    def key(self, obj):
+        return obj.appointment_id
+
+    def inserted(self, objects):
+        if self.lookups.loaded('billed'):
+            self.lookups.get('billed').update(obj.appointment_id for obj in objects)
+        self.pending_keys.clear()
+
+
+# Dependency order: each file may reference rows from the files before it.
+LOADERS = [
+    ('departments', DepartmentLoader),
+    ('doctors', DoctorLoader),
+    ('patients', PatientLoader),
+    ('appointments', AppointmentLoader),
+    ('medical_records', MedicalRecordLoader),
+    ('billings', BillingLoader),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Import legacy hospital data from CSV or NDJSON files in chunked transactions. "
+        "Foreign keys are given by natural key: department by name, patient and doctor by email, "
+        "and a bill's appointment by patient_email + doctor_email + appointment_date. "
+        "Progress is checkpointed with each chunk, so re-running after a crash resumes "
+        "where the last committed chunk ended."
+    )
+
+    def add_arguments(self, parser):
+        for name, _ in LOADERS:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, metavar='PATH')
+        parser.add_argument('--format', choices=['auto', 'csv', 'ndjson'], default='auto')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--max-errors', type=int, default=1000,
+                            help="Abort after this many rejected rows.")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore saved checkpoints and start every file from the top.")
+
+    def handle(self, *args, **options):
+        jobs = [(name, loader, options[name]) for name, loader in LOADERS if options[name]]
+        if not jobs:
+            raise CommandError("Nothing to import; pass at least one of "
+                               + ", ".join(f"--{name.replace('_', '-')}" for name, _ in LOADERS))
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be positive")
+
+        self.errors = 0
+        self.max_errors = options['max_errors']
+        lookups = Lookups()
+        for name, loader_class, path in jobs:
+            if not os.path.exists(path):
+                raise CommandError(f"{path} does not exist")
+            self.import_file(name, loader_class(lookups), path, options)
+
+    def import_file(self, name, loader, path, options):
+        source = f"{name}:{os.path.abspath(path)}"
+        if options['restart']:
+            ImportCheckpoint.objects.filter(source=source).delete()
+        checkpoint = ImportCheckpoint.objects.filter(source=source).first()
+        resume_from = checkpoint.rows_done if checkpoint else 0
+        if resume_from:
+            self.stdout.write(f"{name}: resuming after row {resume_from}")
+
+        chunk_size = options['chunk_size']
+        started = time.monotonic()
+        batch, position, flushed = [], resume_from, resume_from
+        for number, row in enumerate(read_rows(path, options['format']), 1):
+            if number <= resume_from:
+                continue
+            position = number
+            try:
+                obj = loader.build(row)
+                loader.check_unique(obj)
+                batch.append(obj)
+            except (ValueError, TypeError, AttributeError) as exc:
+                self.reject(name, number, exc)
+            if position - flushed >= chunk_size:
+                self.flush(loader, source, batch, position)
+                batch, flushed = [], position
+                self.progress(name, position - resume_from, started)
+
+        self.flush(loader, source, batch, position)
+        rows = position - resume_from
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"{name}: done, {rows} rows in {timedelta(seconds=round(elapsed))} ({rows / elapsed:,.0f} rows/s)"
+        ))
+
+    def flush(self, loader, source, batch, position):
+        # The checkpoint is written in the same transaction as the rows, so a
+        # crash can never leave a chunk committed but unrecorded.
+        with transaction.atomic():
+            if batch:
+                loader.model.objects.bulk_create(batch)
+                post_bulk_save.send(sender=loader.model, created=batch, updated=[])
+            ImportCheckpoint.objects.update_or_create(source=source, defaults={'rows_done': position})
+        loader.inserted(batch)
+
+    def progress(self, name, rows, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f"{name}: {rows} rows ({rows / elapsed:,.0f} rows/s)")
+
+    def reject(self, name, number, exc):
+        self.errors += 1
+        self.stderr.write(f"{name} row {number}: {exc}")
+        if self.errors > self.max_errors:
+            raise CommandError(f"Aborting after {self.errors} rejected rows")
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from patients import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete tombstones of rows deleted more than --days ago. Sync clients that last "
+        "called /api/changes/ before them get 410 Gone and sync again from 0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGE_TOMBSTONE_RETENTION_DAYS,
+                            help="Keep tombstones this many days (default: CHANGE_TOMBSTONE_RETENTION_DAYS).")
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError("--days must not be negative")
+        pruned = changes.prune_tombstones(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} tombstones"))
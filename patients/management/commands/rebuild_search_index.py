@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from patients.search import SEARCH_INDEXES
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search tables for patients and medical records."
+
+    def handle(self, *args, **options):
+        for model, index in SEARCH_INDEXES.items():
+            with transaction.atomic():
+                count = index.rebuild()
+            self.stdout.write(f"{model._meta.verbose_name_plural}: indexed {count} rows")
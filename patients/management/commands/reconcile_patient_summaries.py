@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from patients import summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute patient summary columns from appointments and bills and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        drifted = summaries.reconcile(dry_run=options['dry_run'])
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Patient summaries are up to date"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{drifted} patient summaries have drifted"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {drifted} patient summaries"))
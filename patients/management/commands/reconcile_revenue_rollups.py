@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from patients import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute revenue rollups from billing rows and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help="First day to check (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='end', help="Last day to check (YYYY-MM-DD).")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                bounds[name] = parse_date(options[name])
+                if bounds[name] is None:
+                    raise CommandError(f"Invalid date: {options[name]}")
+        drifted = rollups.reconcile(dry_run=options['dry_run'], **bounds)
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Revenue rollups are up to date"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{drifted} rollup rows have drifted"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {drifted} rollup rows"))
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from patients import jobs
+
+
+_stop = None
+
+
+def _init_worker(stop, niceness):
+    global _stop
+    _stop = stop
+    if niceness and hasattr(os, 'nice'):
+        # Leave the CPU to the web server processes on the same host.
+        os.nice(niceness)
+    # The parent handles Ctrl-C and SIGTERM by setting the stop event.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    import django
+    django.setup()
+
+
+def _work(name, poll_interval, burst, max_jobs):
+    return jobs.work(name, _stop, poll_interval=poll_interval, burst=burst, max_jobs=max_jobs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (see /api/jobs/) in a pool of worker processes. "
+        "Failed jobs are retried with exponential backoff; jobs of workers that died are "
+        "handed to another worker. Stops cleanly on Ctrl-C or SIGTERM after the running jobs finish."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes; 0 runs jobs in this process.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking for jobs again.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is due.")
+        parser.add_argument('--max-jobs', type=int, help="Jobs each worker runs before exiting.")
+        parser.add_argument('--nice', type=int, default=10,
+                            help="Scheduling priority decrease for worker processes (default: 10).")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 0 or options['poll_interval'] <= 0:
+            raise CommandError("--processes must not be negative and --poll-interval must be positive")
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Recovered {requeued} jobs of stopped workers"))
+        name = f'{socket.gethostname()}:{os.getpid()}'
+        work_options = (options['poll_interval'], options['burst'], options['max_jobs'])
+
+        if options['processes'] == 0:
+            count = jobs.work(name, threading.Event(), *work_options)
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs"))
+            return
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        stop = context.Event()
+        previous = {sig: signal.signal(sig, lambda *_: stop.set()) for sig in (signal.SIGINT, signal.SIGTERM)}
+        # Forked workers must open their own database connections.
+        connections.close_all()
+        try:
+            with ProcessPoolExecutor(options['processes'], mp_context=context,
+                                     initializer=_init_worker, initargs=(stop, options['nice'])) as pool:
+                futures = [
+                    pool.submit(_work, f'{name}/{index}', *work_options)
+                    for index in range(options['processes'])
+                ]
+                self.stdout.write(f"Started {len(futures)} workers")
+                pending = futures
+                while pending:
+                    _, pending = wait(pending, timeout=options['poll_interval'] * 10, return_when=FIRST_EXCEPTION)
+                    close_old_connections()
+                    jobs.requeue_stale()
+                    if any(future.done() and future.exception() for future in futures):
+                        stop.set()
+                count = sum(future.result() for future in futures)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs"))
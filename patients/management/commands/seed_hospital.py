@@ -0,0 +1,207 @@
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from patients.models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing
+from patients.signals import post_bulk_save
+
+
+FIRST_NAMES = [
+    "Amina", "Brian", "Cynthia", "David", "Esther", "Felix", "Grace", "Hassan", "Irene", "James",
+    "Joy", "Kevin", "Lucy", "Mark", "Naomi", "Otieno", "Peter", "Faith", "Samuel", "Wanjiru",
+    "Aisha", "Daniel", "Mercy", "Moses", "Sarah", "Tom", "Victor", "Winnie", "Yusuf", "Zawadi",
+]
+LAST_NAMES = [
+    "Achieng", "Baraka", "Chebet", "Kamau", "Kariuki", "Kiprono", "Koech", "Langat", "Maina", "Mwangi",
+    "Njoroge", "Ochieng", "Odhiambo", "Omondi", "Otieno", "Wafula", "Wambui", "Wanjala", "Mutua", "Njeri",
+]
+DEPARTMENTS = {
+    "Cardiology": "Cardiologist",
+    "Dermatology": "Dermatologist",
+    "Emergency": "Emergency Physician",
+    "Gynaecology": "Gynaecologist",
+    "Neurology": "Neurologist",
+    "Oncology": "Oncologist",
+    "Orthopaedics": "Orthopaedic Surgeon",
+    "Paediatrics": "Paediatrician",
+    "Psychiatry": "Psychiatrist",
+    "Radiology": "Radiologist",
+    "General Medicine": "General Practitioner",
+    "Ophthalmology": "Ophthalmologist",
+}
+STREETS = ["Moi Avenue", "Kenyatta Avenue", "Ngong Road", "Waiyaki Way", "Mombasa Road", "Thika Road"]
+TOWNS = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Thika"]
+REASONS = ["Regular checkup", "Follow-up visit", "Chest pain", "Persistent cough", "Headache",
+           "Skin rash", "Back pain", "Vaccination", "Lab results review", "Prenatal visit"]
+DIAGNOSES = ["Hypertension", "Type 2 diabetes", "Upper respiratory infection", "Migraine",
+             "Malaria", "Asthma", "Lower back strain", "Eczema", "Gastritis", "Healthy"]
+TREATMENTS = ["Rest and fluids", "Prescribed antibiotics", "Lifestyle changes advised",
+              "Physiotherapy referral", "Prescribed analgesics", "Follow-up in two weeks", "None"]
+DURATIONS = [15, 30, 30, 30, 45, 60]
+WORK_STARTS, WORK_ENDS = 8, 17
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a reproducible synthetic hospital: departments, doctors, "
+        "patients, appointments, medical records and bills. The same --seed always "
+        "produces the same rows. Appointments never overlap for a doctor; past ones are "
+        "mostly completed and come with a medical record and a bill."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--departments', type=int, default=len(DEPARTMENTS),
+                            help=f"At most {len(DEPARTMENTS)}.")
+        parser.add_argument('--appointments-per-patient', type=float, default=5,
+                            help="Average number of appointments per patient.")
+        parser.add_argument('--days', type=int, default=365,
+                            help="Appointments are spread over this many days up to --future-days from today.")
+        parser.add_argument('--future-days', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--today', help="Pin the calendar to this date (YYYY-MM-DD) for byte-identical reruns.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not 0 < options['departments'] <= len(DEPARTMENTS):
+            raise CommandError(f"--departments must be between 1 and {len(DEPARTMENTS)}")
+        if options['doctors'] <= 0 or options['patients'] < 0 or options['chunk_size'] <= 0:
+            raise CommandError("--doctors and --chunk-size must be positive, --patients not negative")
+        if Department.objects.filter(name__in=list(DEPARTMENTS)[:options['departments']]).exists():
+            raise CommandError("This database already has seeded departments; seed into an empty database")
+
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.now = timezone.now()
+        if options['today']:
+            day = parse_date(options['today'])
+            if day is None:
+                raise CommandError(f"Invalid date: {options['today']}")
+            self.now = timezone.make_aware(datetime.combine(day, dtime(12)))
+        self.today = timezone.localdate(self.now)
+        started = time.monotonic()
+
+        departments = self.create(Department, [
+            Department(name=name, description=f"{name} department")
+            for name in list(DEPARTMENTS)[:options['departments']]
+        ])
+        doctors = self.create(Doctor, self.doctors(departments, options['doctors']))
+        patients = self.create(Patient, self.patients(options['patients']))
+
+        appointments = self.create(Appointment, self.appointments(doctors, patients, options))
+        completed = [a for a in appointments if a.status == "Completed"]
+        self.create(MedicalRecord, [self.record(a) for a in completed])
+        self.create(Billing, [self.bill(a) for a in completed])
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        rows = len(departments) + len(doctors) + len(patients) + len(appointments) + 2 * len(completed)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(departments)} departments, {len(doctors)} doctors, {len(patients)} patients, "
+            f"{len(appointments)} appointments, {len(completed)} medical records and bills "
+            f"in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"
+        ))
+
+    def create(self, model, objects):
+        # post_bulk_save keeps the search index, revenue rollups and response
+        # cache in step, exactly as for API bulk writes.
+        objects = list(objects)
+        for start in range(0, len(objects), self.chunk_size):
+            chunk = objects[start:start + self.chunk_size]
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+                post_bulk_save.send(sender=model, created=chunk, updated=[])
+        return objects
+
+    def person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def phone(self):
+        return "+2547" + "".join(str(self.rng.randrange(10)) for _ in range(8))
+
+    def doctors(self, departments, count):
+        for i in range(count):
+            department = departments[i % len(departments)]
+            first, last = self.person()
+            yield Doctor(
+                first_name=first,
+                last_name=last,
+                specialization=DEPARTMENTS[department.name],
+                phone_number=self.phone(),
+                email=f"dr.{first}.{last}.{i}@hospital.example".lower(),
+                department=department,
+            )
+
+    def patients(self, count):
+        for i in range(count):
+            first, last = self.person()
+            yield Patient(
+                first_name=first,
+                last_name=last,
+                date_of_birth=date(1930, 1, 1) + timedelta(days=self.rng.randrange(365 * 90)),
+                phone_number=self.phone(),
+                email=f"{first}.{last}.{i}@mail.example".lower(),
+                address=f"{self.rng.randrange(1, 999)} {self.rng.choice(STREETS)}, {self.rng.choice(TOWNS)}",
+            )
+
+    def appointments(self, doctors, patients, options):
+        """
+        Each doctor's bookings are a random sample of the quarter-hour slots
+        in working hours across the window, pushed back where the previous
+        booking runs over, so a doctor is never double-booked.
+        """
+        if not patients:
+            return
+        total = round(len(patients) * options['appointments_per_patient'])
+        first_day = self.today - timedelta(days=options['days'] - options['future_days'])
+        slots_per_day = (WORK_ENDS - WORK_STARTS) * 4
+        window = options['days'] * slots_per_day
+        for position, doctor in enumerate(doctors):
+            count = min(total // len(doctors) + (position < total % len(doctors)), window)
+            free_from = None
+            for slot in sorted(self.rng.sample(range(window), count)):
+                day, quarter = divmod(slot, slots_per_day)
+                start = timezone.make_aware(datetime.combine(
+                    first_day + timedelta(days=day), dtime(WORK_STARTS)
+                )) + timedelta(minutes=15 * quarter)
+                if free_from is not None and start < free_from:
+                    start = free_from
+                minutes = self.rng.choice(DURATIONS)
+                free_from = start + timedelta(minutes=minutes)
+                if start < self.now:
+                    state = self.rng.choices(["Completed", "Cancelled"], weights=[9, 1])[0]
+                else:
+                    state = self.rng.choices(["Scheduled", "Cancelled"], weights=[19, 1])[0]
+                yield Appointment(
+                    patient=self.rng.choice(patients),
+                    doctor=doctor,
+                    date=start,
+                    duration_minutes=minutes,
+                    reason=self.rng.choice(REASONS),
+                    status=state,
+                )
+
+    def record(self, appointment):
+        return MedicalRecord(
+            patient_id=appointment.patient_id,
+            doctor_id=appointment.doctor_id,
+            diagnosis=self.rng.choice(DIAGNOSES),
+            treatment=self.rng.choice(TREATMENTS),
+            created_at=appointment.date + timedelta(minutes=appointment.duration_minutes),
+        )
+
+    def bill(self, appointment):
+        amount = Decimal(self.rng.randrange(500, 50000, 50))
+        return Billing(
+            patient_id=appointment.patient_id,
+            appointment_id=appointment.pk,
+            amount=amount,
+            payment_status=self.rng.choices(["Paid", "Pending", "Cancelled"], weights=[7, 2, 1])[0],
+            billing_date=appointment.date + timedelta(minutes=appointment.duration_minutes),
+        )
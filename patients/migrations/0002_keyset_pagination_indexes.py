@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='doctors', to='patients.department'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'id'], name='appointment_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['billing_date', 'id'], name='billing_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['created_at', 'id'], name='record_created_id_idx'),
+        ),
+    ]
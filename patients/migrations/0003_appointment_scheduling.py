@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:51
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=30, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(480)]),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date'], name='appointment_doctor_date_idx'),
+        ),
+    ]
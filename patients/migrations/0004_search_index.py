@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+PATIENT_FTS = (
+    "CREATE VIRTUAL TABLE patients_patient_fts "
+    "USING fts5(first_name, last_name, phone_number, email, tokenize='trigram')"
+)
+RECORD_FTS = (
+    "CREATE VIRTUAL TABLE patients_medicalrecord_fts "
+    "USING fts5(diagnosis, treatment, tokenize='porter unicode61 remove_diacritics 2')"
+)
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(PATIENT_FTS)
+    schema_editor.execute(
+        "INSERT INTO patients_patient_fts (rowid, first_name, last_name, phone_number, email) "
+        "SELECT id, first_name, last_name, phone_number, email FROM patients_patient"
+    )
+    schema_editor.execute(RECORD_FTS)
+    schema_editor.execute(
+        "INSERT INTO patients_medicalrecord_fts (rowid, diagnosis, treatment) "
+        "SELECT id, diagnosis, treatment FROM patients_medicalrecord"
+    )
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS patients_patient_fts")
+    schema_editor.execute("DROP TABLE IF EXISTS patients_medicalrecord_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_appointment_scheduling'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
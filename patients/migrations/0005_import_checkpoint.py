@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500, unique=True)),
+                ('rows_done', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:56
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Billing = apps.get_model('patients', 'Billing')
+    RevenueRollup = apps.get_model('patients', 'RevenueRollup')
+    rows = (
+        Billing.objects
+        .annotate(
+            day=TruncDate('billing_date'),
+            department_key=Coalesce('appointment__doctor__department_id', Value(0)),
+        )
+        .values('day', 'department_key', 'appointment__doctor_id', 'payment_status')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+    )
+    RevenueRollup.objects.bulk_create([
+        RevenueRollup(
+            day=row['day'],
+            department_id=row['department_key'],
+            doctor_id=row['appointment__doctor_id'],
+            payment_status=row['payment_status'],
+            count=row['count'],
+            total=row['total'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('department_id', models.BigIntegerField(default=0)),
+                ('doctor_id', models.BigIntegerField()),
+                ('payment_status', models.CharField(choices=[('Pending', 'Pending'), ('Paid', 'Paid'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'department_id', 'doctor_id', 'payment_status'), name='revenue_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
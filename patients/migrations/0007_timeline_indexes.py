@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'date'], name='appointment_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['patient', 'billing_date'], name='billing_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', 'created_at'], name='record_patient_created_idx'),
+        ),
+    ]
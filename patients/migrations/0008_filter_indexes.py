@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'date'], name='appointment_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['payment_status', 'billing_date'], name='billing_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billing',
+            index=models.Index(fields=['amount'], name='billing_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialization'], name='doctor_specialization_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['doctor', 'created_at'], name='record_doctor_created_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:16
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, IntegerField, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def backfill_summaries(apps, schema_editor):
+    Patient = apps.get_model('patients', 'Patient')
+    Appointment = apps.get_model('patients', 'Appointment')
+    Billing = apps.get_model('patients', 'Billing')
+
+    def per_patient(queryset, aggregate):
+        return Subquery(
+            queryset.filter(patient_id=OuterRef('pk'))
+            .values('patient_id').annotate(value=aggregate).values('value').order_by()
+        )
+
+    Patient.objects.update(
+        appointment_count=Coalesce(
+            per_patient(Appointment.objects.all(), Count('id')), Value(0), output_field=IntegerField()
+        ),
+        last_visit=per_patient(Appointment.objects.filter(status='Completed'), Max('date')),
+        next_appointment=per_patient(
+            Appointment.objects.filter(status='Scheduled', date__gte=timezone.now()), Min('date')
+        ),
+        outstanding_balance=Coalesce(
+            per_patient(Billing.objects.filter(payment_status='Pending'), Sum('amount')),
+            Value(0), output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='appointment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='last_visit',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='next_appointment',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='outstanding_balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['outstanding_balance'], name='patient_balance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['next_appointment'], name='patient_next_appt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_visit'], name='patient_last_visit_idx'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
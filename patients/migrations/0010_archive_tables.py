@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:21
+
+import django.db.models.deletion
+import django.utils.timezone
+import patients.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0009_patient_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date', models.DateTimeField()),
+                ('duration_minutes', models.PositiveIntegerField(default=30)),
+                ('reason', patients.models.CompressedTextField()),
+                ('status', models.CharField(choices=[('Scheduled', 'Scheduled'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')], default='Scheduled', max_length=20)),
+                ('doctor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='patients.doctor')),
+                ('patient', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'id'], name='archived_appt_date_id_idx'), models.Index(fields=['doctor', 'date'], name='archived_appt_doctor_date_idx'), models.Index(fields=['patient', 'date'], name='archived_appt_patient_date_idx'), models.Index(fields=['status', 'date'], name='archived_appt_status_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedMedicalRecord',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('diagnosis', patients.models.CompressedTextField()),
+                ('treatment', patients.models.CompressedTextField()),
+                ('created_at', models.DateTimeField()),
+                ('doctor', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='patients.doctor')),
+                ('patient', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'id'], name='archived_rec_created_id_idx'), models.Index(fields=['patient', 'created_at'], name='archived_rec_patient_idx'), models.Index(fields=['doctor', 'created_at'], name='archived_rec_doctor_idx')],
+            },
+        ),
+    ]
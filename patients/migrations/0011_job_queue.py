@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0010_archive_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=100)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('Queued', 'Queued'), ('Running', 'Running'), ('Succeeded', 'Succeeded'), ('Failed', 'Failed')], default='Queued', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('progress_done', models.BigIntegerField(default=0)),
+                ('progress_total', models.BigIntegerField(blank=True, null=True)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('result_file', models.CharField(blank=True, max_length=500)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:30
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0011_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specialization', models.CharField(blank=True, max_length=100)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tariffs', to='patients.department')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('department', 'specialization'), name='tariff_department_key'), models.UniqueConstraint(condition=models.Q(('department__isnull', True)), fields=('specialization',), name='tariff_default_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:40
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_rows(apps, schema_editor):
+    # Distinct sequence numbers for every existing row, model after model,
+    # so a first sync from 0 sees all of them.
+    offset = 0
+    for name in ('Department', 'Doctor', 'Patient', 'Appointment', 'MedicalRecord', 'Billing'):
+        model = apps.get_model('patients', name)
+        model.objects.update(change_seq=F('id') + offset)
+        offset += model.objects.aggregate(last=Max('id'))['last'] or 0
+    apps.get_model('patients', 'ChangeSequence').objects.create(pk=1, value=offset)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0012_tariffs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+                ('pruned_through', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='archivedappointment',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivedmedicalrecord',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='billing',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(unique=True)),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx')],
+            },
+        ),
+        migrations.RunPython(number_existing_rows, migrations.RunPython.noop),
+    ]
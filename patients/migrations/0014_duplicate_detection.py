@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0013_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientBlockKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'patient'], name='block_key_patient_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SuspectedDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('reasons', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('Open', 'Open'), ('Dismissed', 'Dismissed')], default='Open', max_length=20)),
+                ('detected_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patients.patient')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', '-score'], name='duplicate_status_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('patient', 'other'), name='suspected_duplicate_pair_key')],
+            },
+        ),
+    ]
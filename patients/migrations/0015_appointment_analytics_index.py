@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0014_duplicate_detection'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'doctor', 'duration_minutes', 'status'], name='appointment_analytics_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['date', 'doctor', 'duration_minutes', 'status'], name='archived_appt_analytics_idx'),
+        ),
+    ]
@@ -1,8 +1,23 @@
-from django.db import models
-from django.core.validators import MinValueValidator
+import zlib
+
+from django.db import models, transaction
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
-class Department(models.Model):
+
+class ChangeTracked(models.Model):
+    """
+    Rows carry the sequence number of their latest change, stamped by the
+    signal handlers in ``changes``; ``/api/changes/`` reads rows past a
+    client's sequence number through this column's index.
+    """
+    change_seq = models.BigIntegerField(default=0, db_index=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+
+class Department(ChangeTracked):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
 
@@ -10,7 +25,7 @@ class Department(models.Model):
         return self.name
 
 
-class Doctor(models.Model):
+class Doctor(ChangeTracked):
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     specialization = models.CharField(max_length=100)
@@ -18,11 +33,16 @@ class Doctor(models.Model):
     email = models.EmailField(unique=True)
     department = models.ForeignKey(Department,  on_delete=models.SET_NULL, null=True, blank=True, related_name="doctors")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["specialization"], name="doctor_specialization_idx"),
+        ]
+
     def __str__(self):
         return f"Dr. {self.first_name} {self.last_name}"
 
 
-class Patient(models.Model):
+class Patient(ChangeTracked):
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     date_of_birth = models.DateField()
@@ -30,39 +50,111 @@ class Patient(models.Model):
     email = models.EmailField(unique=True)
     address = models.TextField()
 
+    # Denormalized from appointments and bills by summaries.refresh(); never
+    # written through the API.
+    appointment_count = models.PositiveIntegerField(default=0)
+    last_visit = models.DateTimeField(null=True, blank=True)
+    next_appointment = models.DateTimeField(null=True, blank=True)
+    outstanding_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    SUMMARY_FIELDS = ["appointment_count", "last_visit", "next_appointment", "outstanding_balance"]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["outstanding_balance"], name="patient_balance_idx"),
+            models.Index(fields=["next_appointment"], name="patient_next_appt_idx"),
+            models.Index(fields=["last_visit"], name="patient_last_visit_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # A plain save of a loaded patient would write back summary values
+        # read before a concurrent appointment or bill changed them.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.SUMMARY_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
 
-class Appointment(models.Model):
+class PatientSummarySource:
+    """
+    Remembers the ``patient_id`` a row was loaded with, so moving it to
+    another patient refreshes both patients' summaries, and saves in one
+    transaction with the summary update made by the post_save handler.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_patient_id = instance.__dict__.get('patient_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class Appointment(PatientSummarySource, ChangeTracked):
     STATUS_CHOICES = [
         ("Scheduled", "Scheduled"),
         ("Completed", "Completed"),
         ("Cancelled", "Cancelled"),
     ]
+    MAX_DURATION_MINUTES = 8 * 60
 
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="appointments")
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name="appointments")
     date = models.DateTimeField()
+    duration_minutes = models.PositiveIntegerField(
+        default=30, validators=[MinValueValidator(1), MaxValueValidator(MAX_DURATION_MINUTES)]
+    )
     reason = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="Scheduled")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="appointment_date_id_idx"),
+            models.Index(fields=["doctor", "date"], name="appointment_doctor_date_idx"),
+            models.Index(fields=["patient", "date"], name="appointment_patient_date_idx"),
+            models.Index(fields=["status", "date"], name="appointment_status_date_idx"),
+            # Covers every column analytics.load reads, so a window is one index range scan.
+            models.Index(fields=["date", "doctor", "duration_minutes", "status"], name="appointment_analytics_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Moving a billed appointment to another doctor moves its revenue rollup.
+        instance._loaded_doctor_id = instance.__dict__.get("doctor_id")
+        return instance
+
     def __str__(self):
         return f"{self.patient} - {self.doctor} on {self.date}"
 
 
-class MedicalRecord(models.Model):
+class MedicalRecord(ChangeTracked):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="medical_records")
     doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, related_name="medical_records")
     diagnosis = models.TextField()
     treatment = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="record_created_id_idx"),
+            models.Index(fields=["patient", "created_at"], name="record_patient_created_idx"),
+            models.Index(fields=["doctor", "created_at"], name="record_doctor_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.patient} - {self.created_at.date()}"
 
 
-class Billing(models.Model):
+class Billing(PatientSummarySource, ChangeTracked):
     PAYMENT_STATUS_CHOICES = [
         ("Pending", "Pending"),
         ("Paid", "Paid"),
@@ -75,5 +167,270 @@ class Billing(models.Model):
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default="Pending")
     billing_date = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["billing_date", "id"], name="billing_date_id_idx"),
+            models.Index(fields=["patient", "billing_date"], name="billing_patient_date_idx"),
+            models.Index(fields=["payment_status", "billing_date"], name="billing_status_date_idx"),
+            models.Index(fields=["amount"], name="billing_amount_idx"),
+        ]
+
     def __str__(self):
         return f"{self.patient} - {self.amount} ({self.payment_status})"
+
+
+class CompressedTextField(models.BinaryField):
+    """Text stored zlib-compressed in a BLOB column; reads back as ``str``."""
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = zlib.compress(value.encode("utf-8"))
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return zlib.decompress(bytes(value)).decode("utf-8")
+
+    def to_python(self, value):
+        return value
+
+
+class ArchivedRow(models.Model):
+    """
+    Base for rows moved out of a live table by ``archive_records``. The
+    primary key is the live row's, and foreign keys carry no database
+    constraint so the archive can live in another database; the live keys'
+    ``on_delete`` rules are applied by ``archive.cascade_delete``.
+    """
+    live_model = None
+
+    id = models.BigIntegerField(primary_key=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+    change_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def to_live(self):
+        """An unsaved live-model instance with this row's values, for serializers."""
+        obj = self.live_model(**{
+            field.attname: getattr(self, field.attname) for field in self.live_model._meta.concrete_fields
+        })
+        obj._state.adding = False
+        obj.archived = True
+        return obj
+
+
+class ArchivedAppointment(ArchivedRow):
+    live_model = Appointment
+
+    patient = models.ForeignKey(Patient, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    doctor = models.ForeignKey(Doctor, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    date = models.DateTimeField()
+    duration_minutes = models.PositiveIntegerField(default=30)
+    reason = CompressedTextField()
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES, default="Scheduled")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="archived_appt_date_id_idx"),
+            models.Index(fields=["doctor", "date"], name="archived_appt_doctor_date_idx"),
+            models.Index(fields=["patient", "date"], name="archived_appt_patient_date_idx"),
+            models.Index(fields=["status", "date"], name="archived_appt_status_date_idx"),
+            models.Index(fields=["date", "doctor", "duration_minutes", "status"], name="archived_appt_analytics_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived appointment {self.pk} on {self.date}"
+
+
+class ArchivedMedicalRecord(ArchivedRow):
+    live_model = MedicalRecord
+
+    patient = models.ForeignKey(Patient, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    doctor = models.ForeignKey(
+        Doctor, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+"
+    )
+    diagnosis = CompressedTextField()
+    treatment = CompressedTextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="archived_rec_created_id_idx"),
+            models.Index(fields=["patient", "created_at"], name="archived_rec_patient_idx"),
+            models.Index(fields=["doctor", "created_at"], name="archived_rec_doctor_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived medical record {self.pk} of {self.created_at.date()}"
+
+
+class Tariff(models.Model):
+    """
+    Price of a completed appointment, used by ``billing.generate_bills``.
+    The most specific row wins: department and specialization, then
+    department only, then specialization only, then the default row with
+    neither. A blank specialization matches any.
+    """
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True, related_name="tariffs")
+    specialization = models.CharField(max_length=100, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["department", "specialization"], name="tariff_department_key"),
+            models.UniqueConstraint(
+                fields=["specialization"], condition=models.Q(department__isnull=True), name="tariff_default_key"
+            ),
+        ]
+
+    def __str__(self):
+        scope = " / ".join(filter(None, [str(self.department or ""), self.specialization])) or "Default"
+        return f"{scope}: {self.amount}"
+
+
+class ChangeSequence(models.Model):
+    """
+    The single row holding the last change sequence number handed out, and
+    the highest one whose tombstone has been pruned.
+    """
+    value = models.BigIntegerField(default=0)
+    pruned_through = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Change sequence at {self.value}"
+
+
+class Tombstone(models.Model):
+    """A deleted row of a change-tracked model, kept for ``/api/changes/``."""
+    seq = models.BigIntegerField(unique=True)
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deleted_at"], name="tombstone_deleted_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted at change {self.seq}"
+
+
+class PatientBlockKey(models.Model):
+    """
+    One blocking key of a patient (normalized phone, date of birth with a
+    name's Soundex code, or a name trigram), see ``duplicates``. Only
+    patients sharing a key are compared with each other.
+    """
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["key", "patient"], name="block_key_patient_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.patient_id})"
+
+
+class SuspectedDuplicate(models.Model):
+    STATUS_CHOICES = [
+        ("Open", "Open"),
+        ("Dismissed", "Dismissed"),
+    ]
+
+    # patient_id < other_id, so each pair is stored once.
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    reasons = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="Open")
+    detected_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient", "other"], name="suspected_duplicate_pair_key"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "-score"], name="duplicate_status_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"Patients {self.patient_id} and {self.other_id} ({self.score:.2f})"
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by ``manage.py run_workers``. ``kind``
+    names a function registered with ``jobs.task``; see ``jobs.py``.
+    """
+    STATUS_CHOICES = [
+        ("Queued", "Queued"),
+        ("Running", "Running"),
+        ("Succeeded", "Succeeded"),
+        ("Failed", "Failed"),
+    ]
+
+    kind = models.CharField(max_length=100)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="Queued")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    progress_done = models.BigIntegerField(default=0)
+    progress_total = models.BigIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class ImportCheckpoint(models.Model):
+    source = models.CharField(max_length=500, unique=True)
+    rows_done = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.rows_done} rows)"
+
+
+class RevenueRollup(models.Model):
+    """
+    Billing totals per day, department, doctor and payment status, kept
+    current by the signal handlers in ``signals.py``. ``department_id`` is 0
+    for doctors without a department.
+    """
+    day = models.DateField()
+    department_id = models.BigIntegerField(default=0)
+    doctor_id = models.BigIntegerField()
+    payment_status = models.CharField(max_length=20, choices=Billing.PAYMENT_STATUS_CHOICES)
+    count = models.BigIntegerField(default=0)
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "department_id", "doctor_id", "payment_status"],
+                name="revenue_rollup_key",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.payment_status}: {self.total} ({self.count})"
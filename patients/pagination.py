@@ -0,0 +1,193 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.template import loader
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class StandardPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-based pagination over the view's ``cursor_ordering``.
+
+    Each page is fetched with a ``WHERE (a, id) > (last_a, last_id)`` range
+    condition on an indexed column pair, so there is no ``COUNT(*)`` and no
+    ``OFFSET`` and page 5000 costs the same as page 1.
+    """
+    cursor_query_param = 'cursor'
+    page_size = StandardPagination.page_size
+    page_size_query_param = StandardPagination.page_size_query_param
+    max_page_size = StandardPagination.max_page_size
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    def get_page_queryset(self, queryset, request, view):
+        """
+        The ordered, seeked and sliced queryset for the requested page, one
+        row longer than the page so ``set_page`` can tell if there is more.
+        """
+        self.request = request
+        self.ordering = tuple(view.cursor_ordering)
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        self.position, self.reverse = self.decode_cursor(request)
+        ordering = self.ordering if not self.reverse else [self._flip(name) for name in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._seek(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        values = [self._dump(getattr(obj, field.attname)) for field in self.fields]
+        token = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            token += '=' * (-len(token) % 4)
+            data = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            values = data['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self.fields, values)]
+            return position, bool(data.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _seek(self, ordering, position):
+        # (a >= x) AND (a > x OR (a = x AND b > y) ...): the leading range term
+        # is what lets the database walk the index instead of scanning.
+        ops = [('lt' if name.startswith('-') else 'gt') for name in ordering]
+        names = [name.lstrip('-') for name in ordering]
+
+        condition = Q()
+        for i in range(len(names)):
+            term = Q(**{names[j]: position[j] for j in range(i)})
+            term &= Q(**{f'{names[i]}__{ops[i]}': position[i]})
+            condition |= term
+        return Q(**{f'{names[0]}__{ops[0]}e': position[0]}) & condition
+
+    @staticmethod
+    def _flip(name):
+        return name[1:] if name.startswith('-') else '-' + name
+
+    @staticmethod
+    def _dump(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+
+class OptionalCursorPagination(StandardPagination):
+    """
+    Page-number pagination that switches to ``KeysetPagination`` when the
+    client sends ``?cursor=...`` or ``?pagination=cursor``.
+    """
+    cursor_query_param = KeysetPagination.cursor_query_param
+    mode_query_param = 'pagination'
+    keyset_template = 'rest_framework/pagination/previous_and_next.html'
+
+    def use_cursor(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_cursor(request):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_previous_link()
+        return super().get_previous_link()
+
+    def get_html_context(self):
+        if self.keyset is not None:
+            return {'previous_url': self.get_previous_link(), 'next_url': self.get_next_link()}
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.keyset is not None:
+            template = loader.get_template(self.keyset_template)
+            return template.render(self.get_html_context())
+        return super().to_html()
@@ -0,0 +1,296 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Appointment, Billing, Department, Doctor, RevenueRollup
+
+
+GROUP_BY = {
+    'department': ['department_id'],
+    'doctor': ['department_id', 'doctor_id'],
+    'none': [],
+}
+INTERVALS = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def rollup_key(billing, doctor_id=None, department_id=None):
+    """``(day, department_id, doctor_id, payment_status)`` a bill is counted under."""
+    if doctor_id is None:
+        doctor_id, department_id = (
+            Appointment.objects
+            .filter(pk=billing.appointment_id)
+            .values_list('doctor_id', 'doctor__department_id')
+            .get()
+        )
+    return (
+        timezone.localdate(billing.billing_date),
+        department_id or 0,
+        doctor_id,
+        billing.payment_status,
+    )
+
+
+def apply_deltas(deltas):
+    """
+    Add ``{key: (count, amount)}`` to the rollup table: existing rows get
+    increments from one prepared UPDATE run through ``executemany``, missing
+    rows one ``bulk_create``. Rows left with no bills are deleted.
+    """
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    if not deltas:
+        return
+    days = [key[0] for key in deltas]
+    with transaction.atomic():
+        stored = {
+            (row.day, row.department_id, row.doctor_id, row.payment_status): row
+            for row in RevenueRollup.objects.filter(
+                day__range=(min(days), max(days)), doctor_id__in={key[2] for key in deltas}
+            )
+        }
+        changed, missing = [], {}
+        for key, (count, amount) in deltas.items():
+            row = stored.get(key)
+            if row is None:
+                missing[key] = (count, amount)
+            else:
+                changed.append((row.pk, count, amount))
+        _increment(changed)
+        emptied = [pk for pk, count, _ in changed if count < 0]
+        if emptied:
+            RevenueRollup.objects.filter(pk__in=emptied, count=0).delete()
+        try:
+            with transaction.atomic():
+                RevenueRollup.objects.bulk_create([
+                    RevenueRollup(
+                        day=day, department_id=department_id, doctor_id=doctor_id,
+                        payment_status=payment_status, count=count, total=amount,
+                    )
+                    for (day, department_id, doctor_id, payment_status), (count, amount) in missing.items()
+                ], batch_size=500)
+        except IntegrityError:
+            # Another writer created some of these rows first.
+            for key, (count, amount) in missing.items():
+                _apply_one(key, count, amount)
+
+
+def _increment(changed):
+    """``count += n, total += amount`` for ``(pk, n, amount)`` rows."""
+    if not changed:
+        return
+    connection = connections[router.db_for_write(RevenueRollup)]
+    quote = connection.ops.quote_name
+    total = RevenueRollup._meta.get_field('total')
+    sql = 'UPDATE {table} SET {count} = {count} + %s, {total} = {total} + %s WHERE {pk} = %s'.format(
+        table=quote(RevenueRollup._meta.db_table),
+        count=quote(RevenueRollup._meta.get_field('count').column),
+        total=quote(total.column),
+        pk=quote(RevenueRollup._meta.pk.column),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (count, total.get_db_prep_save(amount, connection), pk) for pk, count, amount in changed
+        ])
+
+
+def _apply_one(key, count, amount):
+    day, department_id, doctor_id, payment_status = key
+    lookup = dict(day=day, department_id=department_id, doctor_id=doctor_id, payment_status=payment_status)
+    with transaction.atomic():
+        updated = RevenueRollup.objects.filter(**lookup).update(
+            count=F('count') + count, total=F('total') + amount
+        )
+        if updated:
+            RevenueRollup.objects.filter(count=0, **lookup).delete()
+            return
+        try:
+            with transaction.atomic():
+                RevenueRollup.objects.create(count=count, total=amount, **lookup)
+        except IntegrityError:
+            RevenueRollup.objects.filter(**lookup).update(
+                count=F('count') + count, total=F('total') + amount
+            )
+            RevenueRollup.objects.filter(count=0, **lookup).delete()
+
+
+def add_billings(billings):
+    """Count newly created bills, resolving their doctors with one query."""
+    billings = list(billings)
+    doctors = dict(
+        (pk, (doctor_id, department_id)) for pk, doctor_id, department_id in
+        Appointment.objects
+        .filter(pk__in={b.appointment_id for b in billings})
+        .values_list('pk', 'doctor_id', 'doctor__department_id')
+    )
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for billing in billings:
+        key = rollup_key(billing, *doctors[billing.appointment_id])
+        deltas[key][0] += 1
+        deltas[key][1] += Decimal(billing.amount)
+    apply_deltas(deltas)
+
+
+def move_appointments(appointments):
+    """
+    Re-key the bills of saved appointments whose doctor changed since they
+    were loaded, and so maybe their department, from the old doctor's
+    rollup rows to the new one's.
+    """
+    moves = {}
+    for appointment in appointments:
+        before = getattr(appointment, '_loaded_doctor_id', None)
+        if before is not None and before != appointment.doctor_id:
+            moves[appointment.pk] = before
+        appointment._loaded_doctor_id = appointment.doctor_id
+    if not moves:
+        return
+    bills = list(
+        Billing.objects.filter(appointment_id__in=moves)
+        .values_list('appointment_id', 'billing_date', 'payment_status', 'amount',
+                     'appointment__doctor_id', 'appointment__doctor__department_id')
+    )
+    if not bills:
+        return
+    departments = dict(Doctor.objects.filter(pk__in=set(moves.values())).values_list('pk', 'department_id'))
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for appointment_id, billing_date, payment_status, amount, doctor_id, department_id in bills:
+        day, before = timezone.localdate(billing_date), moves[appointment_id]
+        for key, sign in (
+            ((day, departments.get(before) or 0, before, payment_status), -1),
+            ((day, department_id or 0, doctor_id, payment_status), 1),
+        ):
+            deltas[key][0] += sign
+            deltas[key][1] += sign * Decimal(amount)
+    apply_deltas(deltas)
+
+
+def move_doctors(doctors):
+    """Point the rollup rows of ``doctors`` at their current departments."""
+    by_department = defaultdict(list)
+    for doctor in doctors:
+        by_department[doctor.department_id or 0].append(doctor.pk)
+    for department_id, doctor_ids in by_department.items():
+        RevenueRollup.objects.filter(doctor_id__in=doctor_ids).exclude(department_id=department_id).update(
+            department_id=department_id
+        )
+
+
+def source_totals(start=None, end=None):
+    """Rollup values computed directly from ``Billing``, for backfill and reconcile."""
+    billings = Billing.objects.all()
+    if start:
+        billings = billings.filter(billing_date__date__gte=start)
+    if end:
+        billings = billings.filter(billing_date__date__lte=end)
+    rows = (
+        billings
+        .annotate(
+            day=TruncDate('billing_date'),
+            department_key=Coalesce('appointment__doctor__department_id', Value(0)),
+        )
+        .values('day', 'department_key', 'appointment__doctor_id', 'payment_status')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+    )
+    return {
+        (row['day'], row['department_key'], row['appointment__doctor_id'], row['payment_status']):
+            (row['count'], row['total'])
+        for row in rows
+    }
+
+
+def reconcile(start=None, end=None, dry_run=False):
+    """
+    Recompute rollups from ``Billing`` and repair any rows that drifted.
+    Returns the number of rollup rows that were wrong.
+    """
+    expected = source_totals(start, end)
+    stored_rows = RevenueRollup.objects.all()
+    if start:
+        stored_rows = stored_rows.filter(day__gte=start)
+    if end:
+        stored_rows = stored_rows.filter(day__lte=end)
+    stored = {
+        (row.day, row.department_id, row.doctor_id, row.payment_status): row
+        for row in stored_rows
+    }
+
+    drifted = 0
+    with transaction.atomic():
+        for key, row in stored.items():
+            if key not in expected:
+                drifted += 1
+                if not dry_run:
+                    row.delete()
+        for key, (count, total) in expected.items():
+            row = stored.get(key)
+            if row is not None and row.count == count and row.total == total:
+                continue
+            drifted += 1
+            if dry_run:
+                continue
+            if row is None:
+                day, department_id, doctor_id, payment_status = key
+                RevenueRollup.objects.create(
+                    day=day, department_id=department_id, doctor_id=doctor_id,
+                    payment_status=payment_status, count=count, total=total,
+                )
+            else:
+                row.count, row.total = count, total
+                row.save(update_fields=['count', 'total'])
+    return drifted
+
+
+def report(group_by='department', interval='day', start=None, end=None):
+    """
+    Revenue per period and group, split by payment status, read from the
+    rollup table only. Totals are decimal strings.
+    """
+    rows = RevenueRollup.objects.all()
+    if start:
+        rows = rows.filter(day__gte=start)
+    if end:
+        rows = rows.filter(day__lte=end)
+
+    trunc = INTERVALS[interval]
+    period = trunc('day') if trunc else F('day')
+    dimensions = GROUP_BY[group_by]
+    rows = list(
+        rows
+        .annotate(period=period)
+        .values('period', *dimensions, 'payment_status')
+        .annotate(bills=Sum('count'), revenue=Sum('total'))
+        .order_by('period', *dimensions, 'payment_status')
+    )
+
+    departments = doctors = {}
+    if 'department_id' in dimensions:
+        departments = dict(
+            Department.objects.filter(pk__in={r['department_id'] for r in rows}).values_list('pk', 'name')
+        )
+    if 'doctor_id' in dimensions:
+        doctors = {
+            pk: f"Dr. {first} {last}" for pk, first, last in
+            Doctor.objects.filter(pk__in={r['doctor_id'] for r in rows}).values_list('pk', 'first_name', 'last_name')
+        }
+
+    result = []
+    for row in rows:
+        item = {'period': row['period']}
+        if 'department_id' in dimensions:
+            item['department'] = row['department_id'] or None
+            item['department_name'] = departments.get(row['department_id'])
+        if 'doctor_id' in dimensions:
+            item['doctor'] = row['doctor_id']
+            item['doctor_name'] = doctors.get(row['doctor_id'])
+        item.update(payment_status=row['payment_status'], count=row['bills'],
+                    total=f"{Decimal(row['revenue']):.2f}")
+        result.append(item)
+    return result
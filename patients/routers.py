@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import connections
+
+
+class ArchiveRouter:
+    """
+    Keeps the archive tables in the ``archive`` database when one is
+    configured, and nothing else there. Without that alias it has no
+    opinion and the archive tables live in ``default``.
+    """
+    alias = 'archive'
+    models = {'archivedappointment', 'archivedmedicalrecord'}
+
+    def configured(self):
+        return self.alias in settings.DATABASES
+
+    def db_for_read(self, model, **hints):
+        if self.configured() and model._meta.model_name in self.models:
+            return self.alias
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not self.configured():
+            return None
+        if model_name in self.models:
+            return db == self.alias
+        return False if db == self.alias else None
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to ``default`` and reads to the read-only ``replica`` alias.
+
+    Both aliases open the same SQLite file; in WAL mode readers never block
+    the writer or each other, so keeping reads off the write connection is
+    what lets them run while a write transaction holds the lock. Reads made
+    while ``default`` is inside ``atomic()`` stay on ``default`` so a
+    transaction always sees its own uncommitted writes.
+    """
+    primary = 'default'
+    replica = 'replica'
+
+    def db_for_read(self, model, **hints):
+        if self.replica not in settings.DATABASES or connections[self.primary].in_atomic_block:
+            return self.primary
+        return self.replica
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {self.primary, self.replica}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is the primary's own file; migrating it twice would fail.
+        return db == self.primary
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from .models import Appointment
+
+
+MAX_DURATION = timedelta(minutes=Appointment.MAX_DURATION_MINUTES)
+MAX_SEARCH_WINDOW = timedelta(days=92)
+
+
+def booked_intervals(doctor_ids, start, end):
+    """
+    ``{doctor_id: [(start, end, pk), ...]}`` for every non-cancelled
+    appointment overlapping ``[start, end)``, sorted by start.
+
+    Appointments have a bounded length, so anything overlapping the window
+    must start inside ``(start - MAX_DURATION, end)``. That is a range scan
+    on the ``(doctor, date)`` index rather than a table scan.
+    """
+    rows = (
+        Appointment.objects
+        .filter(doctor_id__in=doctor_ids, date__gt=start - MAX_DURATION, date__lt=end)
+        .exclude(status="Cancelled")
+        .order_by("doctor_id", "date")
+        .values_list("doctor_id", "date", "duration_minutes", "pk")
+    )
+    intervals = defaultdict(list)
+    for doctor_id, begins, minutes, pk in rows:
+        ends = begins + timedelta(minutes=minutes)
+        if ends > start:
+            intervals[doctor_id].append((begins, ends, pk))
+    return intervals
+
+
+def find_conflicts(doctor_id, start, duration, exclude_pk=None):
+    """Primary keys of the doctor's appointments overlapping ``[start, start + duration)``."""
+    end = start + duration
+    return [
+        pk for begins, ends, pk in booked_intervals([doctor_id], start, end)[doctor_id]
+        if pk != exclude_pk and begins < end and ends > start
+    ]
+
+
+def find_batch_conflicts(bookings):
+    """
+    Check a batch of prospective bookings against the database and against
+    each other with one range query.
+
+    ``bookings`` is a list of ``(doctor_id, start, duration, exclude_pk)``
+    tuples, or ``None`` for rows to skip. Returns a list of the same length
+    with the conflicting appointment pk, ``"batch"`` for a clash inside the
+    batch, or ``None``.
+    """
+    active = [b for b in bookings if b is not None]
+    result = [None] * len(bookings)
+    if not active:
+        return result
+
+    window_start = min(start for _, start, _, _ in active)
+    window_end = max(start + duration for _, start, duration, _ in active)
+    stored = booked_intervals({doctor_id for doctor_id, _, _, _ in active}, window_start, window_end)
+    replaced = {pk for *_, pk in active if pk is not None}
+
+    by_doctor = defaultdict(list)
+    for index, booking in enumerate(bookings):
+        if booking is not None:
+            doctor_id, start, duration, _ = booking
+            by_doctor[doctor_id].append((start, start + duration, index))
+
+    for doctor_id, pending in by_doctor.items():
+        existing = [i for i in stored.get(doctor_id, []) if i[2] not in replaced]
+        # Sweep the batch and the stored rows in start order; a row overlaps
+        # if it starts before the furthest end seen so far.
+        events = sorted(
+            [(begins, ends, ("stored", pk)) for begins, ends, pk in existing]
+            + [(begins, ends, ("batch", index)) for begins, ends, index in pending]
+        )
+        reach, owner = None, None
+        for begins, ends, (kind, ref) in events:
+            if reach is not None and begins < reach:
+                if kind == "batch":
+                    result[ref] = owner[1] if owner[0] == "stored" else "batch"
+                if owner[0] == "batch" and result[owner[1]] is None:
+                    result[owner[1]] = ref if kind == "stored" else "batch"
+            if reach is None or ends > reach:
+                reach, owner = ends, (kind, ref)
+    return result
+
+
+def free_slots(doctor_id, start, end, duration):
+    """
+    Gaps of at least ``duration`` in the doctor's calendar between ``start``
+    and ``end``, found with a single sweep over the booked intervals.
+    """
+    gaps = []
+    cursor = start
+    for begins, ends, _ in booked_intervals([doctor_id], start, end)[doctor_id]:
+        if begins - cursor >= duration:
+            gaps.append((cursor, begins))
+        cursor = max(cursor, ends)
+    if end - cursor >= duration:
+        gaps.append((cursor, end))
+    return gaps
@@ -0,0 +1,136 @@
+from django.db import connection
+from django.db.models import Q
+
+from .models import Patient, MedicalRecord
+
+
+class SearchIndex:
+    """
+    An SQLite FTS5 table shadowing some text columns of a model, keyed by
+    the model's primary key as the FTS ``rowid``.
+
+    The table itself is created by migration ``0004_search_index``. Rows are
+    kept in sync by the handlers in ``signals.py`` and can be rebuilt with
+    ``manage.py rebuild_search_index``.
+    """
+
+    def __init__(self, model, fields, tokenizer, min_token_length=1, prefix=False):
+        self.model = model
+        self.fields = fields
+        self.tokenizer = tokenizer
+        self.min_token_length = min_token_length
+        self.prefix = prefix
+
+    @property
+    def table(self):
+        return f"{self.model._meta.db_table}_fts"
+
+    @property
+    def available(self):
+        return connection.vendor == "sqlite"
+
+    def index(self, objects):
+        objects = [obj for obj in objects if obj.pk is not None]
+        if not objects or not self.available:
+            return
+        columns = ", ".join(self.fields)
+        placeholders = ", ".join(["%s"] * (len(self.fields) + 1))
+        with connection.cursor() as cursor:
+            self._delete(cursor, [obj.pk for obj in objects])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {columns}) VALUES ({placeholders})",
+                [[obj.pk] + [getattr(obj, name) or "" for name in self.fields] for obj in objects],
+            )
+
+    def remove(self, pks):
+        if not pks or not self.available:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, pks)
+
+    def create_sql(self):
+        return (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            f"USING fts5({', '.join(self.fields)}, tokenize='{self.tokenizer}')"
+        )
+
+    def rebuild(self):
+        if not self.available:
+            return 0
+        columns = ", ".join(self.fields)
+        source = ", ".join(f"COALESCE({name}, '')" for name in self.fields)
+        with connection.cursor() as cursor:
+            cursor.execute(self.create_sql())
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, {columns}) "
+                f"SELECT {self.model._meta.pk.column}, {source} FROM {self.model._meta.db_table}"
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f"SELECT count(*) FROM {self.table}")
+            return cursor.fetchone()[0]
+
+    def _delete(self, cursor, pks):
+        # Stay well under SQLite's bound-parameter limit.
+        pks = list(pks)
+        for start in range(0, len(pks), 500):
+            chunk = pks[start:start + 500]
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk
+            )
+
+    def match_expression(self, text):
+        terms = []
+        for token in text.split():
+            token = token.strip('"')
+            if len(token) < self.min_token_length:
+                continue
+            quoted = '"' + token.replace('"', '""') + '"'
+            terms.append(quoted + "*" if self.prefix else quoted)
+        return " ".join(terms)
+
+    def search(self, queryset, text):
+        """
+        Filter ``queryset`` to rows matching ``text``, best match first.
+
+        Joins the FTS table so the match, the bm25 ranking and the page limit
+        all run in one query. Falls back to ``icontains`` when FTS5 is not
+        available or every search term is too short for the tokenizer.
+        """
+        text = (text or "").strip()
+        if not text:
+            return queryset
+        expression = self.match_expression(text)
+        if not expression or not self.available:
+            condition = Q()
+            for name in self.fields:
+                condition |= Q(**{f"{name}__icontains": text})
+            return queryset.filter(condition)
+
+        base = self.model._meta.db_table
+        return queryset.extra(
+            tables=[self.table],
+            where=[f"{self.table} MATCH %s", f"{self.table}.rowid = {base}.{self.model._meta.pk.column}"],
+            params=[expression],
+            select={"search_rank": f"{self.table}.rank"},
+            order_by=["search_rank"],
+        )
+
+
+# Trigram tokens let front-desk staff match any fragment of a name, phone
+# number or email (three characters or more). Clinical text is word based,
+# with stemming and prefix matching on each term.
+SEARCH_INDEXES = {
+    Patient: SearchIndex(
+        Patient, ("first_name", "last_name", "phone_number", "email"),
+        tokenizer="trigram", min_token_length=3,
+    ),
+    MedicalRecord: SearchIndex(
+        MedicalRecord, ("diagnosis", "treatment"),
+        tokenizer="porter unicode61 remove_diacritics 2", prefix=True,
+    ),
+}
+
+
+def search(queryset, text):
+    return SEARCH_INDEXES[queryset.model].search(queryset, text)
@@ -1,11 +1,15 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueValidator
 from django.core.validators import RegexValidator
 from django.utils import timezone
-from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing
-from datetime import date
+from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing, Job, SuspectedDuplicate
+from . import jobs
+from .scheduling import find_conflicts
+from .expansion import DynamicFieldsMixin
+from datetime import date, timedelta
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     name = serializers.CharField(
         max_length=100,
         validators=[
@@ -23,7 +27,7 @@ class DepartmentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     phone_regex = RegexValidator(
         regex=r'^\+?1?\d{9,15}$',
         message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed."
@@ -39,9 +43,10 @@ class DoctorSerializer(serializers.ModelSerializer):
         model = Doctor
         fields = ['id', 'first_name', 'last_name', 'specialization', 'phone_number', 'email', 'department']
         read_only_fields = ['id']
+        expandable_fields = {'department': 'DepartmentSerializer'}
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     phone_regex = RegexValidator(
         regex=r'^\+?1?\d{9,15}$',
         message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed."
@@ -59,30 +64,78 @@ class PatientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Patient
-        fields = ['id', 'first_name', 'last_name', 'date_of_birth', 'phone_number', 'email', 'address']
-        read_only_fields = ['id']
+        fields = ['id', 'first_name', 'last_name', 'date_of_birth', 'phone_number', 'email', 'address',
+                  'appointment_count', 'last_visit', 'next_appointment', 'outstanding_balance']
+        read_only_fields = ['id', 'appointment_count', 'last_visit', 'next_appointment', 'outstanding_balance']
+
 
+class SuspectedDuplicateSerializer(serializers.ModelSerializer):
+    patient = PatientSerializer(read_only=True)
+    other = PatientSerializer(read_only=True)
+
+    class Meta:
+        model = SuspectedDuplicate
+        fields = ['id', 'patient', 'other', 'score', 'reasons', 'status', 'detected_at']
+        read_only_fields = fields
 
-class AppointmentSerializer(serializers.ModelSerializer):
+
+class AppointmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     def validate_date(self, value):
         if value < timezone.now():
             raise serializers.ValidationError("Appointment date cannot be in the past")
         return value
 
+    def validate(self, attrs):
+        # Bulk writes check the whole batch at once, see AppointmentViewSet.validate_batch
+        if self.context.get('defer_conflict_check'):
+            return attrs
+        booking = self.get_booking(attrs)
+        if booking is not None:
+            conflicts = find_conflicts(*booking)
+            if conflicts:
+                raise serializers.ValidationError(
+                    f"Doctor already has appointment {conflicts[0]} at this time"
+                )
+        return attrs
+
+    def get_booking(self, attrs):
+        """``(doctor_id, start, duration, own_pk)`` for the slot this write would occupy."""
+        instance = self.instance
+
+        def current(name):
+            if name in attrs:
+                return attrs[name]
+            return getattr(instance, name, None) if instance is not None else None
+
+        doctor, start = current('doctor'), current('date')
+        if doctor is None or start is None or current('status') == "Cancelled":
+            return None
+        minutes = current('duration_minutes') or Appointment._meta.get_field('duration_minutes').default
+        return doctor.pk, start, timedelta(minutes=minutes), getattr(instance, 'pk', None)
+
     class Meta:
         model = Appointment
-        fields = ['id', 'patient', 'doctor', 'date', 'reason', 'status']
+        fields = ['id', 'patient', 'doctor', 'date', 'duration_minutes', 'reason', 'status']
         read_only_fields = ['id']
+        expandable_fields = {
+            'patient': 'PatientSerializer',
+            'doctor': 'DoctorSerializer',
+            'billing': 'BillingSerializer',
+        }
 
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+class MedicalRecordSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MedicalRecord
         fields = ['id', 'patient', 'doctor', 'diagnosis', 'treatment', 'created_at']
         read_only_fields = ['id', 'created_at']
+        expandable_fields = {
+            'patient': 'PatientSerializer',
+            'doctor': 'DoctorSerializer',
+        }
 
 
-class BillingSerializer(serializers.ModelSerializer):
+class BillingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     def validate_amount(self, value):
         if value < 0:
             raise serializers.ValidationError("Amount cannot be negative")
@@ -91,4 +144,43 @@ class BillingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Billing
         fields = ['id', 'patient', 'appointment', 'amount', 'payment_status', 'billing_date']
-        read_only_fields = ['id', 'billing_date']
\ No newline at end of file
+        read_only_fields = ['id', 'billing_date']
+        expandable_fields = {
+            'patient': 'PatientSerializer',
+            'appointment': 'AppointmentSerializer',
+        }
+
+
+class JobSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    def get_download(self, job):
+        if job.status != "Succeeded" or not job.result_file:
+            return None
+        return reverse('job-download', args=[job.pk], request=self.context.get('request'))
+
+    def validate_kind(self, value):
+        if value not in jobs.TASKS:
+            raise serializers.ValidationError(f"Choose from: {', '.join(sorted(jobs.TASKS))}.")
+        return value
+
+    def validate(self, attrs):
+        params = attrs.get('params') or {}
+        if not isinstance(params, dict):
+            raise serializers.ValidationError({'params': ["Must be an object."]})
+        validate = jobs.TASKS[attrs['kind']].validate
+        if validate is not None:
+            try:
+                validate(params)
+            except ValueError as exc:
+                raise serializers.ValidationError({'params': [str(exc)]})
+        return attrs
+
+    def create(self, validated_data):
+        return jobs.enqueue(validated_data['kind'], validated_data.get('params'))
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'params', 'status', 'attempts', 'max_attempts', 'progress_done', 'progress_total',
+                  'message', 'result', 'error', 'download', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = [name for name in fields if name not in ('kind', 'params')]
@@ -0,0 +1,178 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing
+from . import archive, changes, duplicates, rollups, summaries
+from .caching import bump_version
+from .search import SEARCH_INDEXES
+
+
+# Sent by BulkModelMixin inside its transaction, since bulk_create and
+# bulk_update skip post_save. Arguments: ``created`` and ``updated`` lists.
+post_bulk_save = Signal()
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=MedicalRecord)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SEARCH_INDEXES[sender].index([instance])
+
+
+@receiver(post_bulk_save, sender=Patient)
+@receiver(post_bulk_save, sender=MedicalRecord)
+def update_search_index_bulk(sender, created, updated, **kwargs):
+    SEARCH_INDEXES[sender].index(list(created) + list(updated))
+
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=MedicalRecord)
+def remove_from_search_index(sender, instance, **kwargs):
+    SEARCH_INDEXES[sender].remove([instance.pk])
+
+
+@receiver(post_save, sender=Patient)
+def check_for_duplicates(sender, instance, raw=False, **kwargs):
+    if not raw:
+        duplicates.refresh([instance])
+
+
+@receiver(post_bulk_save, sender=Patient)
+def check_for_duplicates_bulk(sender, created, updated, **kwargs):
+    duplicates.refresh(list(created) + list(updated))
+
+
+@receiver(pre_save, sender=Billing)
+def remember_billing_rollup(sender, instance, raw=False, **kwargs):
+    instance._rollup_before = None
+    if raw or instance.pk is None:
+        return
+    before = Billing.objects.filter(pk=instance.pk).first()
+    if before is not None:
+        instance._rollup_before = (rollups.rollup_key(before), Decimal(before.amount))
+
+
+@receiver(post_save, sender=Billing)
+def update_billing_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = {}
+    before = getattr(instance, '_rollup_before', None)
+    if before is not None:
+        key, amount = before
+        deltas[key] = (-1, -amount)
+    key = rollups.rollup_key(instance)
+    count, amount = deltas.get(key, (0, Decimal('0')))
+    deltas[key] = (count + 1, amount + Decimal(instance.amount))
+    rollups.apply_deltas(deltas)
+    instance._rollup_before = None
+
+
+@receiver(pre_delete, sender=Billing)
+def remember_deleted_billing_rollup(sender, instance, **kwargs):
+    instance._rollup_deleted = rollups.rollup_key(instance)
+
+
+@receiver(post_delete, sender=Billing)
+def remove_billing_rollup(sender, instance, **kwargs):
+    key = getattr(instance, '_rollup_deleted', None)
+    if key is not None:
+        rollups.apply_deltas({key: (-1, -Decimal(instance.amount))})
+
+
+@receiver(post_bulk_save, sender=Billing)
+def update_billing_rollup_bulk(sender, created, updated, **kwargs):
+    rollups.add_billings(created)
+    if updated:
+        # Bulk updates do not carry the previous state; recount the affected days.
+        days = [timezone.localdate(b.billing_date) for b in updated]
+        rollups.reconcile(min(days), max(days))
+
+
+@receiver(post_save, sender=Appointment)
+def move_billing_rollup(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.move_appointments([instance])
+
+
+@receiver(post_bulk_save, sender=Appointment)
+def move_billing_rollup_bulk(sender, created, updated, **kwargs):
+    rollups.move_appointments(updated)
+
+
+@receiver(post_save, sender=Doctor)
+def move_doctor_rollup(sender, instance, created=False, raw=False, **kwargs):
+    if not (raw or created):
+        rollups.move_doctors([instance])
+
+
+@receiver(post_bulk_save, sender=Doctor)
+def move_doctor_rollup_bulk(sender, created, updated, **kwargs):
+    rollups.move_doctors(updated)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_save, sender=Billing)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=Billing)
+def update_patient_summary(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    patient_ids = {instance.patient_id, getattr(instance, '_loaded_patient_id', None)}
+    summaries.refresh(patient_ids)
+    instance._loaded_patient_id = instance.patient_id
+
+
+@receiver(post_bulk_save, sender=Appointment)
+@receiver(post_bulk_save, sender=Billing)
+def update_patient_summary_bulk(sender, created, updated, **kwargs):
+    patient_ids = {obj.patient_id for obj in list(created) + list(updated)}
+    patient_ids.update(getattr(obj, '_loaded_patient_id', None) for obj in updated)
+    summaries.refresh(patient_ids)
+
+
+@receiver(post_delete, sender=Patient)
+def delete_archived_rows_of_patient(sender, instance, **kwargs):
+    archive.cascade_delete('patient', instance.pk)
+
+
+@receiver(post_delete, sender=Doctor)
+def delete_archived_rows_of_doctor(sender, instance, **kwargs):
+    archive.cascade_delete('doctor', instance.pk)
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_bulk_save, sender=Department)
+@receiver(post_bulk_save, sender=Doctor)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_version(sender)
+
+
+def record_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        changes.stamp(sender, [instance])
+
+
+def record_bulk_change(sender, created, updated, **kwargs):
+    changes.stamp(sender, list(created) + list(updated))
+
+
+def remember_nulled_references(sender, instance, **kwargs):
+    instance._nulled_references = changes.nulled_references(instance)
+
+
+def record_deletion(sender, instance, **kwargs):
+    changes.record_delete(instance, getattr(instance, '_nulled_references', ()))
+
+
+for model in changes.TRACKED:
+    post_save.connect(record_change, sender=model)
+    post_bulk_save.connect(record_bulk_change, sender=model)
+    pre_delete.connect(remember_nulled_references, sender=model)
+    post_delete.connect(record_deletion, sender=model)
@@ -0,0 +1,149 @@
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from . import changes
+from .models import Appointment, ArchivedAppointment, Billing, Patient
+
+
+def source_values(patient_ids):
+    """
+    ``{patient_id: {field: value}}`` for ``Patient.SUMMARY_FIELDS`` computed
+    from ``Appointment``, ``ArchivedAppointment`` and ``Billing``, with one
+    grouped query each that uses the ``(patient, date)`` indexes.
+    ``next_appointment`` is the earliest Scheduled appointment that has not
+    started yet; ``advance`` moves it on once that time passes.
+    """
+    patient_ids = list(patient_ids)
+    now = timezone.now()
+    values = {
+        pk: {'appointment_count': 0, 'last_visit': None, 'next_appointment': None,
+             'outstanding_balance': Decimal('0')}
+        for pk in patient_ids
+    }
+    if not values:
+        return values
+    # Archived appointments still count; they live in their own table,
+    # possibly in another database, so they are aggregated separately.
+    for model in (Appointment, ArchivedAppointment):
+        appointments = (
+            model.objects
+            .filter(patient_id__in=patient_ids)
+            .values('patient_id')
+            .annotate(
+                count=Count('id'),
+                last=Max('date', filter=Q(status="Completed")),
+                next=Min('date', filter=Q(status="Scheduled", date__gte=now)),
+            )
+            .order_by()
+        )
+        for row in appointments:
+            summary = values[row['patient_id']]
+            summary['appointment_count'] += row['count']
+            summary['last_visit'] = _combine(summary['last_visit'], row['last'], max)
+            summary['next_appointment'] = _combine(summary['next_appointment'], row['next'], min)
+    balances = (
+        Billing.objects
+        .filter(patient_id__in=patient_ids, payment_status="Pending")
+        .values('patient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for row in balances:
+        values[row['patient_id']]['outstanding_balance'] = row['total'] or Decimal('0')
+    return values
+
+
+def _combine(current, value, pick):
+    if current is None or value is None:
+        return value if current is None else current
+    return pick(current, value)
+
+
+def _write(values):
+    """
+    Store ``{patient_id: {field: value}}`` with one prepared UPDATE run
+    through ``executemany``; ``bulk_update``'s ``CASE WHEN`` statements get
+    slow with thousands of rows.
+    """
+    if not values:
+        return
+    # The patients' API representation changes with them.
+    seqs = changes.reserve(len(values))
+    if len(values) == 1:
+        [(pk, fields)] = values.items()
+        Patient.objects.filter(pk=pk).update(change_seq=seqs[0], **fields)
+        return
+    connection = connections[router.db_for_write(Patient)]
+    quote = connection.ops.quote_name
+    fields = [Patient._meta.get_field(name) for name in Patient.SUMMARY_FIELDS]
+    sql = 'UPDATE {} SET {}, {} = %s WHERE {} = %s'.format(
+        quote(Patient._meta.db_table),
+        ', '.join(f'{quote(field.column)} = %s' for field in fields),
+        quote('change_seq'),
+        quote(Patient._meta.pk.column),
+    )
+    params = [
+        [field.get_db_prep_save(row[field.name], connection) for field in fields] + [seq, pk]
+        for seq, (pk, row) in zip(seqs, values.items())
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def refresh(patient_ids, batch_size=2000):
+    """Recompute the summary columns of the given patients in the current transaction."""
+    patient_ids = sorted({pk for pk in patient_ids if pk is not None})
+    with transaction.atomic(using=router.db_for_write(Patient)):
+        for start in range(0, len(patient_ids), batch_size):
+            _write(source_values(patient_ids[start:start + batch_size]))
+
+
+def advance(batch_size=2000):
+    """
+    Refresh the patients whose ``next_appointment`` has passed, found
+    through its index. Returns the number of patients refreshed.
+    """
+    now = timezone.now()
+    advanced = 0
+    while True:
+        patient_ids = list(
+            Patient.objects.filter(next_appointment__lt=now).order_by('next_appointment')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not patient_ids:
+            return advanced
+        refresh(patient_ids)
+        advanced += len(patient_ids)
+
+
+def reconcile(dry_run=False, batch_size=2000):
+    """
+    Compare every patient's summary columns with their source rows and
+    repair the ones that drifted. Returns the number of drifted patients.
+    Passed ``next_appointment`` values are moved on first (except in a dry
+    run, which reports them as drift): that is expected, not drift.
+    """
+    if not dry_run:
+        advance(batch_size)
+    drifted = 0
+    last_pk = 0
+    while True:
+        stored = list(
+            Patient.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values('pk', *Patient.SUMMARY_FIELDS)[:batch_size]
+        )
+        if not stored:
+            return drifted
+        last_pk = stored[-1]['pk']
+        expected = source_values(row['pk'] for row in stored)
+        stale = {
+            row['pk']: expected[row['pk']] for row in stored
+            if any(row[name] != value for name, value in expected[row['pk']].items())
+        }
+        drifted += len(stale)
+        if stale and not dry_run:
+            with transaction.atomic(using=router.db_for_write(Patient)):
+                _write(stale)
@@ -0,0 +1,149 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.request import Request
+
+from . import billing, rollups, summaries
+from .filters import FieldFilterBackend
+from .jobs import task
+from .models import Appointment
+from .scheduling import find_batch_conflicts
+from .signals import post_bulk_save
+
+
+EXPORTS = {
+    'appointments': ('AppointmentViewSet', 'appointment'),
+    'medical-records': ('MedicalRecordViewSet', 'medicalrecord'),
+    'billings': ('BillingViewSet', 'billing'),
+}
+
+
+def _request(query):
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(mutable=True)
+    for name, value in (query or {}).items():
+        request.GET[name] = str(value)
+    request.META['SERVER_NAME'] = 'localhost'
+    request.META['SERVER_PORT'] = '80'
+    return request
+
+
+def _validate_export(params):
+    if params.get('resource') not in EXPORTS:
+        raise ValueError(f"resource must be one of: {', '.join(EXPORTS)}")
+    if params.get('format', 'csv') not in ('csv', 'ndjson'):
+        raise ValueError("format must be csv or ndjson")
+    if not isinstance(params.get('query', {}), dict):
+        raise ValueError("query must be an object of list filters")
+
+
+@task('export', validate=_validate_export)
+def export(progress, resource, format='csv', query=None):
+    """The ``<resource>/export/`` endpoint's output, written to the job's result file."""
+    from . import views
+
+    name, basename = EXPORTS[resource]
+    viewset = getattr(views, name)
+    # The same view the router builds for <resource>/export/
+    view = viewset.as_view({'get': 'export'}, basename=basename, detail=False, **viewset.export.kwargs)
+    response = view(_request({**(query or {}), 'format': format}))
+    if response.status_code != 200:
+        raise ValueError(f"Export failed with status {response.status_code}: {response.rendered_content[:500]!r}")
+    written = 0
+    with open(progress.result_path(f'{resource}.{format}'), 'wb') as handle:
+        for chunk in response.streaming_content:
+            handle.write(chunk)
+            written += len(chunk)
+            progress(written, message=f"{written} bytes written")
+    return {'bytes': written}
+
+
+def _validate_status_update(params):
+    if params.get('status') not in dict(Appointment.STATUS_CHOICES):
+        raise ValueError(f"status must be one of: {', '.join(dict(Appointment.STATUS_CHOICES))}")
+    if not params.get('ids') and not params.get('query'):
+        raise ValueError("Give the appointments to update as ids or query")
+    query = params.get('query') or {}
+    if not isinstance(query, dict):
+        raise ValueError("query must be an object of /api/appointments/ filters")
+    from .views import AppointmentViewSet
+
+    # The filter backend ignores parameters it does not know, which would
+    # turn a misspelled filter into an update of every appointment.
+    accepted = FieldFilterBackend().get_params(AppointmentViewSet)
+    unknown = sorted(set(query) - set(accepted))
+    if unknown:
+        raise ValueError(f"Unsupported query filters: {', '.join(unknown)}; use {', '.join(accepted)}")
+
+
+@task('appointment_status', validate=_validate_status_update)
+def appointment_status(progress, status, ids=None, query=None, chunk_size=1000):
+    """
+    Set ``status`` on the appointments listed in ``ids`` or matching the
+    ``/api/appointments/`` filters in ``query``, one chunk per transaction.
+    Cancelled appointments that would overlap another booking of their
+    doctor are left cancelled and reported in ``skipped``.
+    """
+    from .views import AppointmentViewSet
+
+    queryset = Appointment.objects.exclude(status=status)
+    if ids:
+        queryset = queryset.filter(pk__in=ids)
+    if query:
+        conditions = FieldFilterBackend().get_conditions(Request(_request(query)), queryset, AppointmentViewSet)
+        if not conditions:
+            raise ValueError(f"query {query!r} selects no filters; refusing to update every appointment")
+        queryset = queryset.filter(**conditions)
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    skipped = []
+    for start in range(0, len(pks), chunk_size):
+        with transaction.atomic():
+            chunk = list(Appointment.objects.filter(pk__in=pks[start:start + chunk_size]))
+            if status != "Cancelled":
+                # Only cancelled appointments take up a slot they did not hold.
+                bookings = [
+                    (appointment.doctor_id, appointment.date, timedelta(minutes=appointment.duration_minutes),
+                     appointment.pk)
+                    if appointment.status == "Cancelled" and appointment.doctor_id is not None else None
+                    for appointment in chunk
+                ]
+                conflicts = find_batch_conflicts(bookings)
+                skipped += [appointment.pk for appointment, conflict in zip(chunk, conflicts) if conflict is not None]
+                chunk = [appointment for appointment, conflict in zip(chunk, conflicts) if conflict is None]
+            for appointment in chunk:
+                appointment.status = status
+            Appointment.objects.bulk_update(chunk, ['status'])
+            post_bulk_save.send(sender=Appointment, created=[], updated=chunk)
+        progress(min(start + chunk_size, len(pks)), len(pks))
+    return {'updated': len(pks) - len(skipped), 'skipped': skipped}
+
+
+def _validate_date_range(params):
+    for name in ('start', 'end'):
+        if params.get(name) and parse_date(params[name]) is None:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+@task('reconcile_revenue_rollups', validate=_validate_date_range)
+def reconcile_revenue_rollups(progress, start=None, end=None):
+    bounds = {name: parse_date(value) for name, value in (('start', start), ('end', end)) if value}
+    return {'drifted': rollups.reconcile(**bounds)}
+
+
+@task('reconcile_patient_summaries')
+def reconcile_patient_summaries(progress):
+    return {'drifted': summaries.reconcile()}
+
+
+@task('generate_bills', validate=_validate_date_range)
+def generate_bills(progress, end=None):
+    """``generate_bills`` for completed appointments dated on or before ``end``, or all of them."""
+    until = None
+    if end:
+        until = timezone.make_aware(datetime.combine(parse_date(end) + timedelta(days=1), time()))
+    result = billing.generate_bills(until, progress=progress)
+    return {**result, 'amount': f"{result['amount']:.2f}"}
@@ -1,9 +1,25 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.urls import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+import csv
+import json
+import os
+import tempfile
 from django.utils import timezone
-from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing
+from datetime import timedelta
+from decimal import Decimal
+from . import jobs
+from .models import (
+    Department, Doctor, Patient, Appointment, MedicalRecord, Billing, ImportCheckpoint, RevenueRollup,
+    ArchivedAppointment, ArchivedMedicalRecord, Job, Tariff, Tombstone, PatientBlockKey, SuspectedDuplicate
+)
 
 class APITestSetup(TestCase):
     def setUp(self):
@@ -117,7 +133,7 @@ class AppointmentTests(APITestSetup):
         data = {
             "patient": self.patient.id,
             "doctor": self.doctor.id,
-            "date": timezone.now(),
+            "date": timezone.now() + timedelta(days=1),
             "reason": "Follow-up",
             "status": "Scheduled"
         }
@@ -162,3 +178,1909 @@ class BillingTests(APITestSetup):
         }
         response = self.client.post(reverse('billing-list'), data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class KeysetPaginationTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        base = timezone.now()
+        for i in range(24):
+            MedicalRecord.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                diagnosis=f"Diagnosis {i}",
+                treatment="Rest",
+                created_at=base + timedelta(minutes=i % 6)
+            )
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def test_cursor_mode_walks_every_row_once_in_order(self):
+        ids = self.walk(reverse('medicalrecord-list') + "?pagination=cursor&page_size=7")
+        expected = list(
+            MedicalRecord.objects.order_by("created_at", "id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_previous_link_returns_preceding_page(self):
+        url = reverse('medicalrecord-list') + "?pagination=cursor&page_size=5"
+        first = self.client.get(url).data
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+        self.assertEqual(
+            [row["id"] for row in back["results"]],
+            [row["id"] for row in first["results"]]
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('billing-list') + "?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get(reverse('appointment-list'))
+        self.assertIn("count", response.data)
+        response = self.client.get(reverse('department-list') + "?pagination=cursor")
+        self.assertIn("count", response.data)
+
+
+class BulkWriteTests(APITestSetup):
+    def patient_row(self, i, **overrides):
+        row = {
+            "first_name": f"Patient{i}",
+            "last_name": "Bulk",
+            "date_of_birth": "1980-01-01",
+            "phone_number": f"07000000{i:02d}",
+            "email": f"bulk{i}@example.com",
+            "address": "Nairobi"
+        }
+        row.update(overrides)
+        return row
+
+    def test_bulk_create_patients_with_constant_queries(self):
+        rows = [self.patient_row(i) for i in range(50)]
+        # Three of these reserve and stamp change sequence numbers. The rows
+        # share a name and birth date, so 16 more re-key them and store the
+        # 1225 pairs as suspected duplicates, in batches of 166.
+        with self.assertNumQueries(25):
+            response = self.client.post(reverse('patient-list'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(Patient.objects.filter(last_name="Bulk").count(), 50)
+
+    def test_bulk_create_reports_per_row_errors_and_writes_nothing(self):
+        rows = [
+            self.patient_row(1),
+            self.patient_row(2, email="john@example.com"),
+            self.patient_row(3, email="bulk1@example.com"),
+            self.patient_row(4, phone_number="abc"),
+        ]
+        response = self.client.post(reverse('patient-list'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("email", response.data[0])
+        self.assertIn("email", response.data[1])
+        self.assertIn("email", response.data[2])
+        self.assertIn("phone_number", response.data[3])
+        self.assertFalse(Patient.objects.filter(last_name="Bulk").exists())
+
+    def test_bulk_create_appointments_resolves_foreign_keys_in_one_query(self):
+        future = timezone.now() + timedelta(days=3)
+        rows = [
+            {"patient": self.patient.id, "doctor": self.doctor.id,
+             "date": future + timedelta(hours=i), "reason": "Batch", "status": "Scheduled"}
+            for i in range(20)
+        ]
+        rows.append({"patient": 9999, "doctor": self.doctor.id, "date": future, "reason": "Bad"})
+        response = self.client.post(reverse('appointment-list'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("patient", response.data[20])
+
+        response = self.client.post(reverse('appointment-list'), rows[:20], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Appointment.objects.filter(reason="Batch").count(), 20)
+
+    def test_bulk_patch_and_upsert(self):
+        response = self.client.patch(
+            reverse('doctor-list'),
+            [{"id": self.doctor.id, "specialization": "Surgeon"}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.specialization, "Surgeon")
+
+        rows = [
+            self.patient_row(1, email="john@example.com", first_name="Johnny"),
+            self.patient_row(2),
+        ]
+        response = self.client.post(reverse('patient-list') + "?upsert=true", rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data[0]["id"], self.patient.id)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.first_name, "Johnny")
+        self.assertEqual(Patient.objects.count(), 2)
+
+    def test_upsert_without_a_natural_key_is_rejected(self):
+        row = {"patient": self.patient.id, "doctor": self.doctor.id, "reason": "Batch", "status": "Scheduled",
+               "date": timezone.now() + timedelta(days=3)}
+        response = self.client.post(reverse('appointment-list') + "?upsert=true", [row], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("non_field_errors", response.data)
+        self.assertFalse(Appointment.objects.filter(reason="Batch").exists())
+
+
+class SchedulingTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        self.day = (timezone.now() + timedelta(days=2)).replace(hour=9, minute=0, second=0, microsecond=0)
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=self.day,
+            duration_minutes=60, reason="Booked"
+        )
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=self.day + timedelta(hours=2),
+            reason="Cancelled slot", status="Cancelled"
+        )
+
+    def booking(self, start, **overrides):
+        data = {
+            "patient": self.patient.id,
+            "doctor": self.doctor.id,
+            "date": start,
+            "duration_minutes": 30,
+            "reason": "Consultation",
+            "status": "Scheduled"
+        }
+        data.update(overrides)
+        return data
+
+    def test_overlapping_appointment_is_rejected(self):
+        response = self.client.post(
+            reverse('appointment-list'), self.booking(self.day + timedelta(minutes=45)), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("non_field_errors", response.data)
+
+    def test_adjacent_and_cancelled_slots_are_free(self):
+        for start in (self.day + timedelta(hours=1), self.day + timedelta(hours=2)):
+            response = self.client.post(reverse('appointment-list'), self.booking(start), format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_update_does_not_conflict_with_itself(self):
+        booked = Appointment.objects.get(reason="Booked")
+        response = self.client.patch(
+            reverse('appointment-detail', args=[booked.id]),
+            {"date": self.day + timedelta(minutes=15)}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_create_detects_conflicts_inside_batch(self):
+        start = self.day + timedelta(hours=4)
+        rows = [self.booking(start), self.booking(start + timedelta(minutes=10)), self.booking(self.day)]
+        response = self.client.post(reverse('appointment-list'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("non_field_errors", response.data[0])
+        self.assertIn("non_field_errors", response.data[1])
+        self.assertIn("non_field_errors", response.data[2])
+
+    def test_free_slots(self):
+        url = reverse('doctor-free-slots', args=[self.doctor.id])
+        response = self.client.get(url, {
+            "from": self.day.isoformat(),
+            "to": (self.day + timedelta(hours=3)).isoformat(),
+            "duration": 90
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        slots = response.data["slots"]
+        self.assertEqual(len(slots), 1)
+        self.assertEqual(slots[0]["start"], self.day + timedelta(hours=1))
+        self.assertEqual(slots[0]["end"], self.day + timedelta(hours=3))
+
+    def test_free_slots_rejects_bad_window(self):
+        url = reverse('doctor-free-slots', args=[self.doctor.id])
+        response = self.client.get(url, {"from": "2030-01-02", "to": "2030-01-01"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SearchTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        self.other = Patient.objects.create(
+            first_name="Johanna",
+            last_name="Mwangi",
+            date_of_birth="1985-03-03",
+            phone_number="0722000111",
+            email="jm@example.com",
+            address="Mombasa"
+        )
+        MedicalRecord.objects.create(
+            patient=self.other, doctor=self.doctor,
+            diagnosis="Type 2 diabetes", treatment="Metformin and diet control"
+        )
+
+    def search(self, name, text):
+        response = self.client.get(reverse(name), {"search": text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_patient_search_matches_name_phone_and_email_fragments(self):
+        self.assertEqual(self.search('patient-list', "wangi"), [self.other.id])
+        self.assertEqual(self.search('patient-list', "0001"), [self.other.id])
+        self.assertEqual(self.search('patient-list', "john@exa"), [self.patient.id])
+        self.assertCountEqual(self.search('patient-list', "joh"), [self.patient.id, self.other.id])
+
+    def test_medical_record_search_uses_stemmed_prefixes(self):
+        self.assertEqual(len(self.search('medicalrecord-list', "diabet")), 1)
+        self.assertEqual(len(self.search('medicalrecord-list', "controlled")), 1)
+        self.assertEqual(self.search('medicalrecord-list', "asthma"), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.other.last_name = "Otieno"
+        self.other.save()
+        self.assertEqual(self.search('patient-list', "wangi"), [])
+        self.assertEqual(self.search('patient-list', "tieno"), [self.other.id])
+        self.other.delete()
+        self.assertEqual(self.search('patient-list', "tieno"), [])
+
+    def test_bulk_created_rows_are_indexed(self):
+        rows = [{
+            "first_name": "Wanjiru",
+            "last_name": "Kamau",
+            "date_of_birth": "1970-07-07",
+            "phone_number": "0733444555",
+            "email": "wk@example.com",
+            "address": "Nakuru"
+        }]
+        self.client.post(reverse('patient-list'), rows, format='json')
+        self.assertEqual(len(self.search('patient-list', "wanjiru")), 1)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM patients_patient_fts")
+        self.assertEqual(self.search('patient-list', "wangi"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search('patient-list', "wangi"), [self.other.id])
+
+    def test_loaddata_leaves_the_index_and_change_feed_alone(self):
+        from django.core import serializers
+
+        record = MedicalRecord(
+            pk=9999, patient=self.other, doctor=self.doctor, diagnosis="Leptospirosis", treatment="Doxycycline"
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "records.json")
+        with open(path, "w") as handle:
+            handle.write(serializers.serialize("json", [record]))
+        call_command("loaddata", path, verbosity=0)
+        # Fixture rows keep the change sequence they were dumped with.
+        self.assertEqual(MedicalRecord.objects.get(pk=9999).change_seq, 0)
+        self.assertEqual(self.search('medicalrecord-list', "leptospirosis"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search('medicalrecord-list', "leptospirosis"), [9999])
+
+
+class ExportTests(APITestSetup):
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export_matches_list_output(self):
+        response = self.client.get(reverse('billing-export'), {"format": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(StringIO(self.read(response))))
+        listed = self.client.get(reverse('billing-list')).data["results"]
+        self.assertEqual(len(rows), 1)
+        for key, value in listed[0].items():
+            self.assertEqual(rows[0][key], str(value))
+
+    def test_ndjson_export_streams_in_chunks(self):
+        for i in range(5):
+            MedicalRecord.objects.create(
+                patient=self.patient, doctor=None, diagnosis=f"Malaria {i}", treatment="Artemether"
+            )
+        response = self.client.get(reverse('medicalrecord-export'))
+        self.assertTrue(response.streaming)
+        lines = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(lines), 6)
+        listed = self.client.get(reverse('medicalrecord-list')).data["results"]
+        self.assertEqual(lines[0], dict(listed[0]))
+
+    def test_export_applies_list_filters(self):
+        MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, diagnosis="Malaria", treatment="Artemether"
+        )
+        response = self.client.get(reverse('medicalrecord-export'), {"format": "ndjson", "search": "malaria"})
+        lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["diagnosis"], "Malaria")
+
+    async def test_asgi_export_streams_chunk_by_chunk(self):
+        from unittest import mock
+        from asgiref.sync import sync_to_async
+        from .views import MedicalRecordViewSet
+
+        for i in range(5):
+            await sync_to_async(MedicalRecord.objects.create)(
+                patient=self.patient, doctor=None, diagnosis=f"Malaria {i}", treatment="Artemether"
+            )
+        with mock.patch.object(MedicalRecordViewSet, "export_chunk_size", 2):
+            response = await self.async_client.get(reverse('medicalrecord-export'))
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual([len(chunk.splitlines()) for chunk in chunks], [2, 2, 2])
+        self.assertEqual(len({json.loads(line)["id"] for line in b"".join(chunks).splitlines()}), 6)
+
+
+class ImportCommandTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(content)
+        return path
+
+    def run_import(self, **files):
+        out, err = StringIO(), StringIO()
+        call_command("import_hospital_data", chunk_size=2, stdout=out, stderr=err, **files)
+        return out.getvalue(), err.getvalue()
+
+    def legacy_files(self):
+        return {
+            "departments": self.write("departments.csv", "name,description\nCardiology,Heart\n"),
+            "doctors": self.write(
+                "doctors.ndjson",
+                json.dumps({"first_name": "Alice", "last_name": "Smith", "specialization": "Cardiologist",
+                            "phone_number": "0712345678", "email": "alice@example.com",
+                            "department": "Cardiology"}) + "\n"
+            ),
+            "patients": self.write(
+                "patients.csv",
+                "first_name,last_name,date_of_birth,phone_number,email,address\n"
+                + "".join(f"P{i},Legacy,1970-01-01,07000000{i:02d},p{i}@example.com,Town\n" for i in range(5))
+                + "Bad,Row,not-a-date,0700,bad@example.com,Town\n"
+            ),
+            "appointments": self.write(
+                "appointments.csv",
+                "patient_email,doctor_email,date,reason,status\n"
+                "p0@example.com,alice@example.com,2019-05-01T09:00:00Z,Checkup,Completed\n"
+                "p1@example.com,alice@example.com,2019-05-01T10:00:00Z,Checkup,Completed\n"
+            ),
+            "medical_records": self.write(
+                "records.csv",
+                "patient_email,doctor_email,diagnosis,treatment,created_at\n"
+                "p0@example.com,alice@example.com,Hypertension,Lisinopril,2019-05-01\n"
+            ),
+            "billings": self.write(
+                "billings.csv",
+                "patient_email,doctor_email,appointment_date,amount,payment_status\n"
+                "p0@example.com,alice@example.com,2019-05-01T09:00:00Z,2500.00,Paid\n"
+            ),
+        }
+
+    def test_imports_all_files_and_resolves_natural_keys(self):
+        out, err = self.run_import(**self.legacy_files())
+        self.assertEqual(Patient.objects.count(), 5)
+        self.assertIn("patients row 6: invalid date_of_birth", err)
+        self.assertEqual(Doctor.objects.get().department.name, "Cardiology")
+        billing = Billing.objects.get()
+        self.assertEqual(billing.appointment.patient.email, "p0@example.com")
+        self.assertEqual(MedicalRecord.objects.get().doctor.email, "alice@example.com")
+        self.assertIn("rows/s", out)
+
+    def test_out_of_range_duration_is_rejected_not_fatal(self):
+        files = self.legacy_files()
+        files["appointments"] = self.write(
+            "appointments.csv",
+            "patient_email,doctor_email,date,duration_minutes,reason,status\n"
+            "p0@example.com,alice@example.com,2019-05-01T09:00:00Z,45,Checkup,Completed\n"
+            "p1@example.com,alice@example.com,2019-05-01T10:00:00Z,0,Checkup,Completed\n"
+            "p2@example.com,alice@example.com,2019-05-01T11:00:00Z,-15,Checkup,Completed\n"
+            "p3@example.com,alice@example.com,2019-05-01T12:00:00Z,481,Checkup,Completed\n"
+            "p4@example.com,alice@example.com,2019-05-01T13:00:00Z,,Checkup,Completed\n"
+        )
+        _, err = self.run_import(**files)
+        for row in (2, 3, 4):
+            self.assertIn(f"appointments row {row}: duration_minutes must be between 1 and 480", err)
+        self.assertEqual(sorted(Appointment.objects.values_list("duration_minutes", flat=True)), [30, 45])
+        self.assertEqual(Billing.objects.count(), 1)
+
+    def test_resumes_from_checkpoint_without_duplicating_rows(self):
+        files = self.legacy_files()
+        source = f"patients:{os.path.abspath(files['patients'])}"
+        self.run_import(patients=files["patients"])
+        self.assertEqual(ImportCheckpoint.objects.get(source=source).rows_done, 6)
+
+        # Simulate a crash after the first chunk had been committed.
+        Patient.objects.exclude(email__in=["p0@example.com", "p1@example.com"]).delete()
+        ImportCheckpoint.objects.filter(source=source).update(rows_done=2)
+        out, _ = self.run_import(patients=files["patients"])
+        self.assertIn("resuming after row 2", out)
+        self.assertEqual(Patient.objects.count(), 5)
+
+    def test_rerun_skips_already_imported_natural_keys(self):
+        files = self.legacy_files()
+        self.run_import(patients=files["patients"])
+        _, err = self.run_import(patients=files["patients"], restart=True)
+        self.assertIn("duplicate patient", err)
+        self.assertEqual(Patient.objects.count(), 5)
+
+
+class RevenueRollupTests(APITestSetup):
+    def totals(self):
+        return {
+            (row.payment_status, row.department_id, row.doctor_id): (row.count, row.total)
+            for row in RevenueRollup.objects.all()
+        }
+
+    def new_appointment(self, days):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            date=timezone.now() + timedelta(days=days), reason="Visit"
+        )
+
+    def test_rollup_follows_create_status_change_and_delete(self):
+        key = (self.department.id, self.doctor.id)
+        self.assertEqual(self.totals(), {("Pending",) + key: (1, 5000)})
+
+        extra = Billing.objects.create(
+            patient=self.patient, appointment=self.new_appointment(1), amount=1500
+        )
+        self.assertEqual(self.totals()[("Pending",) + key], (2, 6500))
+
+        extra.payment_status = "Paid"
+        extra.save()
+        self.assertEqual(self.totals()[("Pending",) + key], (1, 5000))
+        self.assertEqual(self.totals()[("Paid",) + key], (1, 1500))
+
+        extra.appointment.delete()
+        self.assertNotIn(("Paid",) + key, self.totals())
+
+    def test_no_drift_after_any_mutation(self):
+        from . import rollups
+
+        surgery = Department.objects.create(name="Surgery", description="Operations")
+        surgeon = Doctor.objects.create(first_name="Bob", last_name="Cut", specialization="Surgeon",
+                                        phone_number="0711111111", email="bob@example.com", department=surgery)
+        extra = Billing.objects.create(patient=self.patient, appointment=self.new_appointment(1), amount=1500)
+
+        def mutations():
+            self.billing.payment_status = "Paid"
+            self.billing.save()
+            yield "status change"
+            self.billing.amount = 4500
+            self.billing.save()
+            yield "amount change"
+            appointment = Appointment.objects.get(pk=self.appointment.pk)
+            appointment.doctor = surgeon
+            appointment.save()
+            yield "appointment moved to another doctor"
+            response = self.client.patch(reverse('appointment-list'),
+                                         [{"id": extra.appointment_id, "doctor": surgeon.id}], format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            yield "bulk appointment move"
+            surgeon.department = self.department
+            surgeon.save()
+            yield "doctor moved to another department"
+            Billing.objects.get(pk=extra.pk).delete()
+            yield "bill deleted"
+            Appointment.objects.get(pk=self.appointment.pk).delete()
+            yield "billed appointment deleted"
+
+        for mutation in mutations():
+            self.assertEqual(rollups.reconcile(dry_run=True), 0, mutation)
+            self.assertFalse(RevenueRollup.objects.filter(count=0).exists(), mutation)
+        self.assertFalse(RevenueRollup.objects.exists())
+
+    def test_reconcile_repairs_drift(self):
+        RevenueRollup.objects.update(total=1)
+        out = StringIO()
+        call_command("reconcile_revenue_rollups", "--dry-run", stdout=out)
+        self.assertIn("1 rollup rows have drifted", out.getvalue())
+        call_command("reconcile_revenue_rollups", stdout=StringIO())
+        self.assertEqual(RevenueRollup.objects.get().total, 5000)
+        out = StringIO()
+        call_command("reconcile_revenue_rollups", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+
+    def test_report_reads_from_rollups(self):
+        Billing.objects.create(
+            patient=self.patient, appointment=self.new_appointment(2), amount=500, payment_status="Paid"
+        )
+        today = timezone.localdate().isoformat()
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('billing-report'),
+                {"group_by": "department", "interval": "month", "from": today, "to": today}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([row["payment_status"] for row in results], ["Paid", "Pending"])
+        self.assertEqual(results[1]["department_name"], "Cardiology")
+        self.assertEqual(results[1]["total"], "5000.00")
+
+    def test_report_rejects_unknown_grouping(self):
+        response = self.client.get(reverse('billing-report'), {"group_by": "ward"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deltas_are_written_in_batches(self):
+        from . import rollups
+
+        def apply(days):
+            deltas = {
+                (timezone.localdate() - timedelta(days=day), self.department.id, self.doctor.id, "Paid"): (1, 10)
+                for day in days
+            }
+            with CaptureQueriesContext(connection) as queries:
+                rollups.apply_deltas(deltas)
+            return len(queries)
+
+        # New keys are inserted together and existing keys updated together.
+        inserted = apply(range(0, 1))
+        self.assertEqual(apply(range(1, 21)), inserted)
+        updated = apply(range(0, 1))
+        self.assertEqual(apply(range(1, 21)), updated)
+        paid = RevenueRollup.objects.filter(payment_status="Paid")
+        self.assertEqual(paid.count(), 21)
+        self.assertEqual({(row.count, row.total) for row in paid}, {(2, 20)})
+
+    def test_existing_rows_are_incremented_with_one_prepared_statement(self):
+        from . import rollups
+
+        deltas = {
+            (timezone.localdate() - timedelta(days=day), self.department.id, self.doctor.id, "Paid"): (1, 10)
+            for day in range(5)
+        }
+        rollups.apply_deltas(deltas)
+        with CaptureQueriesContext(connection) as queries:
+            rollups.apply_deltas(deltas)
+        updates = [query["sql"] for query in queries if "UPDATE" in query["sql"]]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith("5 times: UPDATE"), updates[0])
+        self.assertEqual(RevenueRollup.objects.filter(payment_status="Paid", count=2, total=20).count(), 5)
+
+
+class PatientSummaryTests(APITestSetup):
+    def summary(self, patient=None):
+        patient = Patient.objects.get(pk=(patient or self.patient).pk)
+        return [getattr(patient, name) for name in Patient.SUMMARY_FIELDS]
+
+    def test_summary_follows_appointment_and_billing_writes(self):
+        # The setUp appointment started at setUp, so it is not a next appointment.
+        self.assertEqual(self.summary(), [1, None, None, 5000])
+
+        later = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=timezone.now() + timedelta(days=3), reason="Visit"
+        )
+        self.appointment.status = "Completed"
+        self.appointment.save()
+        self.assertEqual(self.summary(), [2, self.appointment.date, later.date, 5000])
+
+        self.billing.payment_status = "Paid"
+        self.billing.save()
+        Billing.objects.create(patient=self.patient, appointment=later, amount="120.50")
+        self.assertEqual(self.summary()[3], Decimal("120.50"))
+
+        later.delete()
+        self.assertEqual(self.summary(), [1, self.appointment.date, None, 0])
+
+    def test_moving_an_appointment_refreshes_both_patients(self):
+        other = Patient.objects.create(
+            first_name="Jane", last_name="Roe", date_of_birth="1992-02-02",
+            phone_number="0711111111", email="jane@example.com", address="Mombasa"
+        )
+        appointment = Appointment.objects.get(pk=self.appointment.pk)
+        appointment.patient = other
+        appointment.save()
+        self.assertEqual(self.summary()[0], 0)
+        self.assertEqual(self.summary(other)[0], 1)
+
+    def test_patient_update_does_not_overwrite_summary(self):
+        stale = Patient.objects.get(pk=self.patient.pk)
+        Billing.objects.filter(pk=self.billing.pk).delete()
+        response = self.client.patch(
+            reverse('patient-detail', args=[stale.pk]), {"address": "456 Kisumu Rd", "outstanding_balance": "9"},
+            format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stale.first_name = "Johnny"
+        stale.save()
+        self.assertEqual(self.summary()[3], 0)
+
+    def test_list_exposes_orders_and_filters_by_summary(self):
+        Patient.objects.create(
+            first_name="Jane", last_name="Roe", date_of_birth="1992-02-02",
+            phone_number="0711111111", email="jane@example.com", address="Mombasa"
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('patient-list'), {"ordering": "-outstanding_balance"})
+        results = response.data["results"]
+        self.assertEqual([row["email"] for row in results], ["john@example.com", "jane@example.com"])
+        self.assertEqual(results[0]["outstanding_balance"], "5000.00")
+        self.assertEqual(results[0]["appointment_count"], 1)
+        response = self.client.get(reverse('patient-list'), {"outstanding_balance__gt": "0"})
+        self.assertEqual(response.data["count"], 1)
+
+    def test_reconcile_repairs_drift(self):
+        Patient.objects.update(appointment_count=7, outstanding_balance=1)
+        out = StringIO()
+        call_command("reconcile_patient_summaries", "--dry-run", stdout=out)
+        self.assertIn("1 patient summaries have drifted", out.getvalue())
+        call_command("reconcile_patient_summaries", stdout=StringIO())
+        self.assertEqual(self.summary(), [1, None, None, 5000])
+        out = StringIO()
+        call_command("reconcile_patient_summaries", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+
+    def test_summaries_are_written_with_one_prepared_statement(self):
+        from . import summaries
+
+        others = [
+            Patient.objects.create(
+                first_name="Jane", last_name="Roe", date_of_birth="1992-02-02",
+                phone_number=f"07111111{i}", email=f"jane{i}@example.com", address="Mombasa"
+            )
+            for i in range(5)
+        ]
+        Patient.objects.update(appointment_count=7)
+        with CaptureQueriesContext(connection) as queries:
+            summaries.refresh([self.patient.pk] + [other.pk for other in others])
+        updates = [query["sql"] for query in queries if 'UPDATE "patients_patient"' in query["sql"]]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith("6 times: UPDATE"), updates[0])
+        self.assertEqual(self.summary()[0], 1)
+        self.assertEqual(self.summary(others[0])[0], 0)
+
+    def test_migration_backfill_skips_past_appointments(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        backfill = import_module("patients.migrations.0009_patient_summary").backfill_summaries
+        later = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=timezone.now() + timedelta(days=3), reason="Visit"
+        )
+        Patient.objects.update(next_appointment=None)
+        backfill(apps, None)
+        self.assertEqual(self.summary()[2], later.date)
+
+    def test_next_appointment_moves_on_once_it_has_passed(self):
+        from unittest import mock
+
+        soon, later = (
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, reason="Visit",
+                                       date=timezone.now() + timedelta(days=days))
+            for days in (1, 2)
+        )
+        self.assertEqual(self.summary()[2], soon.date)
+        out = StringIO()
+        with mock.patch("django.utils.timezone.now", return_value=soon.date + timedelta(hours=1)):
+            call_command("reconcile_patient_summaries", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+        self.assertEqual(self.summary()[2], later.date)
+
+
+class ArchiveTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now() - timedelta(days=1000)
+        self.old_appointments = [
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, date=self.old + timedelta(days=i),
+                reason=f"Old visit {i} " + "x" * 200, status="Completed"
+            )
+            for i in range(3)
+        ]
+        self.old_record = MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, diagnosis="Old flu", treatment="Rest",
+            created_at=self.old
+        )
+        call_command("archive_records", "--batch-size", "2", stdout=StringIO())
+
+    def test_archiving_is_not_a_deletion_in_the_change_feed(self):
+        self.assertFalse(Tombstone.objects.exists())
+        record_id = self.medical_record.id
+        self.medical_record.delete()
+        self.assertEqual(list(Tombstone.objects.values_list("object_id", flat=True)), [record_id])
+
+    def test_old_rows_move_compressed_and_summaries_are_kept(self):
+        self.assertEqual(list(Appointment.objects.values_list("id", flat=True)), [self.appointment.id])
+        self.assertEqual(ArchivedAppointment.objects.count(), 3)
+        self.assertFalse(MedicalRecord.objects.filter(pk=self.old_record.pk).exists())
+        archived = ArchivedMedicalRecord.objects.get(pk=self.old_record.pk)
+        self.assertEqual((archived.diagnosis, archived.doctor_id), ("Old flu", self.doctor.id))
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT reason FROM {ArchivedAppointment._meta.db_table} LIMIT 1")
+            self.assertLess(len(cursor.fetchone()[0]), 100)
+
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertEqual(patient.appointment_count, 4)
+        self.assertEqual(patient.last_visit, self.old_appointments[-1].date)
+        out = StringIO()
+        call_command("reconcile_patient_summaries", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+
+    def test_lists_read_through_only_when_asked(self):
+        url = reverse('appointment-list')
+        self.assertEqual(self.client.get(url).data["count"], 1)
+        response = self.client.get(url, {"include_archived": "true"})
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [a.id for a in self.old_appointments] + [self.appointment.id]
+        )
+        self.assertEqual(response.data["results"][0]["reason"], self.old_appointments[0].reason)
+        response = self.client.get(url, {"include_archived": "true", "status": "Completed", "ordering": "-date"})
+        self.assertEqual([row["id"] for row in response.data["results"]], [a.id for a in self.old_appointments[::-1]])
+
+        for enabled in (False, True):
+            with self.settings(SERIALIZER_FAST_PATH=enabled):
+                ids, response = [], self.client.get(
+                    url, {"include_archived": "true", "pagination": "cursor", "page_size": 2, "fields": "id"}
+                )
+                while True:
+                    ids.extend(row["id"] for row in response.data["results"])
+                    if not response.data["next"]:
+                        break
+                    response = self.client.get(response.data["next"])
+            self.assertEqual(ids, [a.id for a in self.old_appointments] + [self.appointment.id])
+
+        response = self.client.get(url, {"include_archived": "true", "expand": "patient"})
+        self.assertEqual(response.data["results"][0]["patient"]["email"], "john@example.com")
+
+    def test_detail_export_and_timeline_read_through(self):
+        url = reverse('medicalrecord-detail', args=[self.old_record.pk])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(url, {"include_archived": "1"})
+        self.assertEqual(response.data["diagnosis"], "Old flu")
+        self.assertEqual(
+            self.client.delete(f"{url}?include_archived=1").status_code, status.HTTP_404_NOT_FOUND
+        )
+
+        response = self.client.get(reverse('medicalrecord-export'), {"include_archived": "true"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])["diagnosis"], "Old flu")
+
+        response = self.client.get(reverse('patient-timeline', args=[self.patient.id]), {"page_size": 50})
+        ids = {(entry["type"], entry["id"]) for entry in response.data["results"]}
+        self.assertIn(("medical_record", self.old_record.pk), ids)
+        self.assertIn(("appointment", self.old_appointments[0].pk), ids)
+
+    def test_archive_keeps_foreign_key_semantics(self):
+        self.doctor.delete()
+        self.assertFalse(ArchivedAppointment.objects.exists())
+        self.assertIsNone(ArchivedMedicalRecord.objects.get().doctor_id)
+        self.patient.delete()
+        self.assertFalse(ArchivedMedicalRecord.objects.exists())
+
+    def test_router_isolates_a_separate_archive_database(self):
+        from .routers import ArchiveRouter
+        archive_router = ArchiveRouter()
+        archive_router.configured = lambda: True
+        self.assertEqual(archive_router.db_for_read(ArchivedAppointment), "archive")
+        self.assertIsNone(archive_router.db_for_write(Appointment))
+        self.assertTrue(archive_router.allow_migrate("archive", "patients", "archivedmedicalrecord"))
+        self.assertFalse(archive_router.allow_migrate("default", "patients", "archivedmedicalrecord"))
+        self.assertFalse(archive_router.allow_migrate("archive", "patients", "patient"))
+        self.assertFalse(archive_router.allow_migrate("archive", "patients"))
+        self.assertIsNone(archive_router.allow_migrate("default", "patients", "patient"))
+
+
+class JobTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        self.results_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.results_dir.cleanup)
+        overrides = self.settings(JOB_RESULTS_DIR=self.results_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def run_jobs(self):
+        call_command("run_workers", processes=0, burst=True, stdout=StringIO())
+
+    def test_export_job_runs_and_result_downloads(self):
+        response = self.client.post(
+            reverse('job-list'), {"kind": "export", "params": {"resource": "billings", "format": "csv"}},
+            format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], "Queued")
+        self.assertIsNone(response.data["download"])
+        detail = response["Location"]
+
+        self.run_jobs()
+        job = self.client.get(detail).data
+        self.assertEqual((job["status"], job["attempts"]), ("Succeeded", 1))
+        self.assertGreater(job["result"]["bytes"], 0)
+        download = self.client.get(job["download"])
+        self.assertIn('filename="billings.csv"', download["Content-Disposition"])
+        expected = self.client.get(reverse('billing-export'), {"format": "csv"})
+        self.assertEqual(b"".join(download.streaming_content), b"".join(expected.streaming_content))
+
+    def test_invalid_jobs_are_rejected(self):
+        response = self.client.post(reverse('job-list'), {"kind": "shutdown"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            reverse('job-list'), {"kind": "appointment_status", "params": {"status": "Lost", "ids": [1]}},
+            format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("params", response.data)
+
+    def test_status_update_job_reports_progress(self):
+        for days in (1, 2):
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, date=timezone.now() + timedelta(days=days), reason="x"
+            )
+        job = jobs.enqueue("appointment_status", {"status": "Cancelled", "query": {"doctor": self.doctor.id}})
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.result, {"updated": 3, "skipped": []})
+        self.assertEqual((job.progress_done, job.progress_total), (3, 3))
+        self.assertFalse(Appointment.objects.exclude(status="Cancelled").exists())
+        self.assertIsNone(Patient.objects.get(pk=self.patient.pk).next_appointment)
+
+    def test_status_update_job_does_not_double_book(self):
+        clash, free = (
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, reason="x", status="Cancelled",
+                                       date=self.appointment.date + timedelta(days=days, minutes=10))
+            for days in (0, 1)
+        )
+        job = jobs.enqueue("appointment_status", {"status": "Scheduled", "ids": [clash.pk, free.pk]})
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.result, {"updated": 1, "skipped": [clash.pk]})
+        self.assertEqual(Appointment.objects.get(pk=clash.pk).status, "Cancelled")
+        self.assertEqual(Appointment.objects.get(pk=free.pk).status, "Scheduled")
+
+    def test_status_update_job_needs_known_and_effective_filters(self):
+        response = self.client.post(
+            reverse('job-list'),
+            {"kind": "appointment_status", "params": {"status": "Cancelled", "query": {"doctor_id": 5}}},
+            format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("doctor_id", str(response.data["params"]))
+
+        job = jobs.enqueue("appointment_status", {"status": "Cancelled", "query": {"doctor": ""}})
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertNotEqual(job.status, "Succeeded")
+        self.assertIn("selects no filters", job.error)
+        self.assertFalse(Appointment.objects.filter(status="Cancelled").exists())
+
+    def test_failures_are_retried_with_backoff(self):
+        def flaky(progress):
+            raise RuntimeError("disk full")
+        jobs.task("flaky", max_attempts=2)(flaky)
+        self.addCleanup(jobs.TASKS.pop, "flaky")
+
+        job = jobs.enqueue("flaky")
+        with self.assertLogs("patients.jobs", "WARNING"):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("Queued", 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("RuntimeError: disk full", job.error)
+
+        self.run_jobs()
+        self.assertEqual(Job.objects.get(pk=job.pk).attempts, 1)
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs("patients.jobs", "ERROR"):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("Failed", 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_jobs_of_stopped_workers_are_requeued(self):
+        old = timezone.now() - timedelta(hours=1)
+        retry = Job.objects.create(kind="reconcile_patient_summaries", status="Running", attempts=1, heartbeat_at=old)
+        last = Job.objects.create(
+            kind="reconcile_patient_summaries", status="Running", attempts=3, max_attempts=3, heartbeat_at=old
+        )
+        self.assertEqual(jobs.requeue_stale(), 2)
+        self.assertEqual(Job.objects.get(pk=retry.pk).status, "Queued")
+        self.assertEqual(Job.objects.get(pk=last.pk).status, "Failed")
+        self.run_jobs()
+        self.assertEqual(Job.objects.get(pk=retry.pk).result, {"drifted": 0})
+
+
+class BatchBillingTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        dermatology = Department.objects.create(name="Dermatology")
+        self.surgeon = Doctor.objects.create(
+            first_name="Sam", last_name="Cut", specialization="Surgeon", phone_number="0700000010",
+            email="sam@example.com"
+        )
+        self.dermatologist = Doctor.objects.create(
+            first_name="Dee", last_name="Skin", specialization="Dermatologist", phone_number="0700000011",
+            email="dee@example.com", department=dermatology
+        )
+        Tariff.objects.create(amount=1000)
+        Tariff.objects.create(department=self.department, amount=3000)
+        Tariff.objects.create(department=self.department, specialization="Cardiologist", amount=4500)
+        Tariff.objects.create(specialization="Surgeon", amount=2500)
+
+    def visit(self, doctor, days_ago=1, status="Completed"):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=doctor, date=timezone.now() - timedelta(days=days_ago),
+            reason="Visit", status=status
+        )
+
+    def test_bills_once_priced_by_most_specific_tariff(self):
+        visits = [self.visit(self.doctor), self.visit(self.surgeon), self.visit(self.dermatologist)]
+        scheduled = self.visit(self.doctor, status="Scheduled")
+        out = StringIO()
+        call_command("generate_bills", "--chunk-size", "2", stdout=out)
+        self.assertIn("Billed 3 appointments for 8000.00", out.getvalue())
+        self.assertEqual(
+            [Billing.objects.get(appointment=visit).amount for visit in visits], [4500, 2500, 1000]
+        )
+        bill = Billing.objects.get(appointment=visits[0])
+        self.assertEqual(bill.payment_status, "Pending")
+        self.assertEqual(bill.billing_date, visits[0].date + timedelta(minutes=visits[0].duration_minutes))
+        self.assertFalse(Billing.objects.filter(appointment=scheduled).exists())
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).outstanding_balance, 5000 + 8000)
+        call_command("reconcile_revenue_rollups", "--dry-run", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+
+        out = StringIO()
+        call_command("generate_bills", stdout=out)
+        self.assertIn("Billed 0 appointments", out.getvalue())
+        self.assertEqual(Billing.objects.count(), 4)
+
+    def test_query_count_does_not_grow_with_appointments(self):
+        from . import billing
+
+        counts = []
+        for size in (2, 8):
+            for _ in range(size):
+                self.visit(self.doctor)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(billing.generate_bills()["billed"], size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unpriced_appointments_stay_unbilled(self):
+        Tariff.objects.filter(department=None, specialization="").delete()
+        visit = self.visit(self.dermatologist)
+        out = StringIO()
+        call_command("generate_bills", stdout=out)
+        self.assertIn("1 completed appointments have no matching tariff", out.getvalue())
+        self.assertFalse(Billing.objects.filter(appointment=visit).exists())
+
+    def test_api_action_with_dry_run_and_cutoff(self):
+        self.visit(self.doctor, days_ago=10)
+        recent = self.visit(self.surgeon, days_ago=1)
+        url = reverse('billing-generate')
+        response = self.client.post(url, {"dry_run": True}, format="json")
+        self.assertEqual(response.data, {"billed": 2, "amount": "7000.00", "unpriced": 0})
+        self.assertEqual(Billing.objects.count(), 1)
+
+        through = (timezone.localdate() - timedelta(days=5)).isoformat()
+        response = self.client.post(url, {"through": through}, format="json")
+        self.assertEqual(response.data["billed"], 1)
+        self.assertFalse(Billing.objects.filter(appointment=recent).exists())
+        response = self.client.post(url, {"through": "soon"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchTests(APITestSetup):
+    def walk_in(self, amount=1500):
+        return [
+            {"method": "POST", "path": "/api/patients/", "ref": "patient", "body": {
+                "first_name": "Walk", "last_name": "In", "date_of_birth": "1985-05-05",
+                "phone_number": "0711111111", "email": "walkin@example.com", "address": "1 Clinic Rd",
+            }},
+            {"method": "POST", "path": "/api/appointments/", "ref": "visit", "body": {
+                "patient": {"$ref": "patient.id"}, "doctor": self.doctor.id,
+                "date": (timezone.now() + timedelta(days=1)).isoformat(), "reason": "Walk-in", "status": "Scheduled",
+            }},
+            {"method": "POST", "path": "/api/medical-records/", "body": {
+                "patient": {"$ref": "patient.id"}, "doctor": self.doctor.id,
+                "diagnosis": "Sprain", "treatment": "Rest",
+            }},
+            {"method": "POST", "path": "/api/billings/", "body": {
+                "patient": {"$ref": "patient.id"}, "appointment": {"$ref": "visit.id"},
+                "amount": amount, "payment_status": "Pending",
+            }},
+            {"method": "GET", "path": "/api/patients/{patient.id}/"},
+        ]
+
+    def test_dependent_operations_run_in_one_request(self):
+        response = self.client.post(reverse('batch'), {"operations": self.walk_in()}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([result["status"] for result in results], [201, 201, 201, 201, 200])
+        patient = Patient.objects.get(email="walkin@example.com")
+        self.assertEqual(results[4]["body"]["id"], patient.id)
+        self.assertEqual(results[4]["body"]["outstanding_balance"], "1500.00")
+        self.assertEqual(Billing.objects.get(patient=patient).appointment_id, results[1]["body"]["id"])
+
+    def test_failed_operation_rolls_back_the_batch(self):
+        counts = [model.objects.count() for model in (Patient, Appointment, MedicalRecord, Billing)]
+        response = self.client.post(reverse('batch'), {"operations": self.walk_in(amount="lots")}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["failed"], 3)
+        self.assertIn("amount", response.data["results"][3]["body"])
+        self.assertEqual([model.objects.count() for model in (Patient, Appointment, MedicalRecord, Billing)], counts)
+
+    def test_rejects_bad_operations_and_references(self):
+        url = reverse('batch')
+        response = self.client.post(url, {"operations": [{"method": "TRACE", "path": "/api/patients/"}]},
+                                    format="json")
+        self.assertIn("method", response.data["operations"][0])
+        response = self.client.post(url, {"operations": [
+            {"method": "POST", "path": "/api/batch/", "body": {}},
+            {"path": "/api/patients/"},
+        ]}, format="json")
+        self.assertEqual(response.data["results"][0]["status"], 404)
+        response = self.client.post(url, {"operations": [{"path": "/api/patients/{later.id}/"}]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Unknown ref", response.data["results"][0]["body"]["detail"])
+
+    def test_reads_inside_a_batch_are_not_cached(self):
+        operations = [
+            {"method": "POST", "path": "/api/departments/", "body": {"name": "Oncology"}},
+            {"path": "/api/departments/"},
+            {"method": "POST", "path": "/api/departments/", "body": {}},
+        ]
+        self.client.post(reverse('batch'), {"operations": operations}, format="json")
+        response = self.client.get(reverse('department-list'))
+        self.assertNotIn("Oncology", [row["name"] for row in response.data["results"]])
+
+
+class ChangeFeedTests(APITestSetup):
+    def sync(self, since, **params):
+        response = self.client.get(reverse('changes'), {"since": since, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_full_sync_then_only_changes(self):
+        full = self.sync(0)
+        self.assertFalse(full["more"])
+        self.assertEqual(full["changes"]["patients"]["updated"][0]["id"], self.patient.id)
+        self.assertEqual(full["changes"]["billings"]["updated"][0]["amount"], "5000.00")
+        self.assertEqual(self.sync(full["through"])["changes"], {})
+
+        self.client.patch(reverse('patient-detail', args=[self.patient.id]), {"address": "9 Mombasa Rd"}, format="json")
+        record_id = self.medical_record.id
+        self.medical_record.delete()
+        delta = self.sync(full["through"])
+        self.assertEqual(set(delta["changes"]), {"patients", "medical-records"})
+        self.assertEqual(delta["changes"]["patients"]["updated"][0]["address"], "9 Mombasa Rd")
+        self.assertEqual(delta["changes"]["medical-records"], {"updated": [], "deleted": [record_id]})
+
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=timezone.now(), reason="Again")
+        delta = self.sync(delta["through"], models="patients")
+        # The new appointment changed the patient's summary columns.
+        self.assertEqual(delta["changes"]["patients"]["updated"][0]["appointment_count"], 2)
+
+    def test_pages_never_split_and_each_row_appears_once(self):
+        since = self.sync(0)["through"]
+        departments = [Department.objects.create(name=f"Ward {i}") for i in range(5)]
+        departments[0].description = "Renamed"
+        departments[0].save()
+        seen, more = [], True
+        while more:
+            page = self.sync(since, models="departments", limit=2)
+            seen += [row["id"] for row in page["changes"].get("departments", {}).get("updated", [])]
+            since, more = page["through"], page["more"]
+        self.assertCountEqual(seen, [department.id for department in departments])
+
+    def test_nulled_references_and_bulk_writes_are_changes(self):
+        since = self.sync(0)["through"]
+        department_id = self.department.id
+        self.department.delete()
+        surgery = Department.objects.create(name="Surgery")
+        response = self.client.post(reverse('doctor-list'), [{
+            "first_name": "Bo", "last_name": "Lee", "specialization": "GP",
+            "phone_number": "0700000099", "email": "bo@example.com", "department": surgery.id,
+        }], format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        changes = self.sync(since)["changes"]
+        self.assertEqual(changes["departments"]["deleted"], [department_id])
+        doctors = {row["id"]: row for row in changes["doctors"]["updated"]}
+        self.assertIsNone(doctors[self.doctor.id]["department"])
+        self.assertEqual(len(doctors), 2)
+
+    def test_cost_does_not_depend_on_table_size(self):
+        since = self.sync(0)["through"]
+        Patient.objects.bulk_create(
+            Patient(first_name="P", last_name=str(i), date_of_birth="1990-01-01", phone_number="0700000000",
+                    email=f"p{i}@example.com", address="-")
+            for i in range(200)
+        )
+        since = self.sync(since)["through"]
+        self.patient.save()
+        # Sequence counter, changed rows and tombstones.
+        with self.assertNumQueries(3):
+            changes = self.sync(since, models="patients")["changes"]
+        self.assertEqual([row["id"] for row in changes["patients"]["updated"]], [self.patient.id])
+
+    def test_pruned_history_requires_full_sync(self):
+        since = self.sync(0)["through"]
+        self.medical_record.delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=100))
+        out = StringIO()
+        call_command("prune_tombstones", stdout=out)
+        self.assertIn("Pruned 1 tombstones", out.getvalue())
+        response = self.client.get(reverse('changes'), {"since": since})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertNotIn("medical-records", self.sync(0)["changes"])
+
+    @override_settings(CHANGES_POLL_SECONDS=0.01, CHANGES_STREAM_SECONDS=0)
+    def test_long_poll_and_event_stream(self):
+        since = self.sync(0)["through"]
+        waited = self.sync(since, wait=0.05)
+        self.assertEqual((waited["changes"], waited["through"]), ({}, since))
+
+        self.patient.save()
+        response = self.client.get(reverse('changes'), HTTP_ACCEPT="text/event-stream", HTTP_LAST_EVENT_ID=str(since))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        event = body.split("\n\n")[1].split("\n")
+        self.assertEqual(event[:2], [f"id: {since + 1}", "event: changes"])
+        self.assertEqual(json.loads(event[2][len("data: "):])["changes"]["patients"]["updated"][0]["id"],
+                         self.patient.id)
+
+        response = self.client.get(reverse('changes'), {"since": "soon"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CHANGES_POLL_SECONDS=0.01, CHANGES_STREAM_SECONDS=5)
+    async def test_asgi_waits_on_the_event_loop(self):
+        from asgiref.sync import sync_to_async
+
+        since = (await self.async_client.get(reverse('changes'), {"since": 0})).json()["through"]
+        response = await self.async_client.get(reverse('changes'), {"since": since, "wait": 0.05})
+        body = json.loads(b"".join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual((body["changes"], body["through"]), ({}, since))
+
+        response = await self.async_client.get(
+            reverse('changes'), headers={"accept": "text/event-stream", "last-event-id": str(since)}
+        )
+        # Events arrive while the stream is open, not when it ends.
+        events = aiter(response.streaming_content)
+        self.assertTrue((await anext(events)).startswith(b"retry: "))
+        await sync_to_async(self.patient.save)()
+        event = (await anext(events)).decode().split("\n")
+        self.assertEqual(event[:2], [f"id: {since + 1}", "event: changes"])
+        await events.aclose()
+
+
+class DuplicatePatientTests(APITestSetup):
+    def create_duplicate(self, **overrides):
+        row = {
+            "first_name": "Doe",
+            "last_name": "Jon",
+            "date_of_birth": "1990-01-01",
+            "phone_number": "+254798765432",
+            "email": "j.doe@example.org",
+            "address": "123 Nairobi Street",
+        }
+        row.update(overrides)
+        return Patient.objects.create(**row)
+
+    def test_variants_are_detected_on_create_and_strangers_are_not(self):
+        stranger = {
+            "first_name": "Mary", "last_name": "Wanjiku", "date_of_birth": "1975-06-30",
+            "phone_number": "0711111111", "email": "mary@example.com", "address": "7 Kisumu Rd",
+        }
+        self.client.post(reverse('patient-list'), stranger, format="json")
+        row = {
+            "first_name": "Doe", "last_name": "Jon", "date_of_birth": "1990-01-01",
+            "phone_number": "+254798765432", "email": "j.doe@example.org", "address": "123 Nairobi Street",
+        }
+        # Seven of these re-key the new patient and score its candidates.
+        with self.assertNumQueries(15):
+            response = self.client.post(reverse('patient-list'), row, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(reverse('suspectedduplicate-list'))
+        self.assertEqual(response.data["count"], 1)
+        pair = response.data["results"][0]
+        self.assertEqual(pair["patient"]["id"], self.patient.id)
+        self.assertGreaterEqual(pair["score"], 0.9)
+        self.assertIn("phone_number", pair["reasons"])
+        self.assertIn("date_of_birth", pair["reasons"])
+        response = self.client.get(reverse('suspectedduplicate-list'), {"patient": self.patient.id})
+        self.assertEqual(response.data["count"], 1)
+
+        # An edit that makes them different people drops the pair.
+        duplicate = Patient.objects.get(pk=pair["other"]["id"])
+        duplicate.first_name, duplicate.last_name, duplicate.phone_number = "Peter", "Otieno", "0722222222"
+        duplicate.date_of_birth = "2001-12-12"
+        duplicate.save()
+        self.assertFalse(SuspectedDuplicate.objects.exists())
+
+    def test_dismissed_pairs_stay_dismissed(self):
+        duplicate = self.create_duplicate()
+        pair = SuspectedDuplicate.objects.get()
+        response = self.client.post(reverse('suspectedduplicate-dismiss', args=[pair.id]))
+        self.assertEqual(response.data["status"], "Dismissed")
+
+        duplicate.address = "123 Nairobi St"
+        duplicate.save()
+        self.assertEqual(SuspectedDuplicate.objects.get().status, "Dismissed")
+        self.assertEqual(self.client.get(reverse('suspectedduplicate-list')).data["count"], 0)
+        response = self.client.get(reverse('suspectedduplicate-list'), {"status": "Dismissed"})
+        self.assertEqual(response.data["count"], 1)
+
+    def test_merge_moves_history_to_the_kept_patient(self):
+        duplicate = self.create_duplicate()
+        appointment = Appointment.objects.create(patient=duplicate, doctor=self.doctor, date=timezone.now(),
+                                                 reason="Follow-up")
+        Billing.objects.create(patient=duplicate, appointment=appointment, amount=1500, payment_status="Pending")
+        MedicalRecord.objects.create(patient=duplicate, doctor=self.doctor, diagnosis="Flu", treatment="Rest")
+        pair = SuspectedDuplicate.objects.get()
+
+        response = self.client.post(reverse('suspectedduplicate-merge', args=[pair.id]), {"keep": self.doctor.id + 99},
+                                    format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('suspectedduplicate-merge', args=[pair.id]), {"keep": self.patient.id},
+                                    format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["moved"], {"appointment": 1, "medicalrecord": 1, "billing": 1,
+                                                  "archivedappointment": 0, "archivedmedicalrecord": 0})
+        self.assertEqual((response.data["kept"], response.data["removed"]), (self.patient.id, duplicate.id))
+
+        self.assertFalse(Patient.objects.filter(pk=duplicate.id).exists())
+        self.assertFalse(SuspectedDuplicate.objects.exists())
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.appointment_count, 2)
+        self.assertEqual(self.patient.outstanding_balance, Decimal("6500.00"))
+        self.assertEqual(MedicalRecord.objects.filter(patient=self.patient).count(), 2)
+
+    def test_command_rebuilds_keys_and_skips_oversized_blocks(self):
+        from . import duplicates
+
+        duplicate = self.create_duplicate()
+        self.assertEqual(duplicates.detect([self.patient.pk, duplicate.pk]), {(self.patient.pk, duplicate.pk)})
+        PatientBlockKey.objects.all().delete()
+        SuspectedDuplicate.objects.all().delete()
+
+        out = StringIO()
+        call_command("find_duplicate_patients", stdout=out)
+        self.assertIn("Found 0 suspected duplicate pairs", out.getvalue())
+        out = StringIO()
+        call_command("find_duplicate_patients", rebuild=True, top=5, stdout=out)
+        self.assertIn("Found 1 suspected duplicate pairs", out.getvalue())
+        self.assertIn(f"#{self.patient.id} John Doe", out.getvalue())
+        # The two patients land in different chunks; the pair is still one pair.
+        out = StringIO()
+        call_command("find_duplicate_patients", batch_size=1, stdout=out)
+        self.assertIn("Found 1 suspected duplicate pairs", out.getvalue())
+
+        # Every key of these two is shared by two patients: too common at a limit of one.
+        SuspectedDuplicate.objects.all().delete()
+        with override_settings(DUPLICATE_MAX_BLOCK_SIZE=1):
+            out = StringIO()
+            call_command("find_duplicate_patients", stdout=out)
+        self.assertIn("Found 0 suspected duplicate pairs", out.getvalue())
+
+
+class UtilizationAnalyticsTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Monday 3 March 2025, UTC: 09:00-09:30 and 09:45-10:15 completed, 11:00 never
+        # attended, 10:00 cancelled. Idle gaps of 15 and 45 minutes.
+        monday = timezone.make_aware(timezone.datetime(2025, 3, 3, 9, 0))
+        for offset, status_name in ((0, "Completed"), (45, "Completed"), (120, "Scheduled"), (60, "Cancelled")):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, reason="Clinic", status=status_name,
+                                       date=monday + timedelta(minutes=offset))
+        ArchivedAppointment.objects.create(id=10_000, patient=self.patient, doctor=self.doctor, reason="Old",
+                                           status="Completed", date=monday + timedelta(days=1, hours=14))
+
+    def utilization(self, **params):
+        response = self.client.get(reverse('analytics-utilization'), {"from": "2025-03-01", "to": "2025-03-09", **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def test_rates_gaps_and_heatmap_per_doctor(self):
+        data = self.utilization()
+        [row] = data["results"]
+        self.assertEqual((row["doctor"], row["doctor_name"]), (self.doctor.id, "Dr. Alice Smith"))
+        self.assertEqual(
+            [row[name] for name in ("appointments", "completed", "scheduled", "cancelled", "no_show")],
+            [5, 3, 0, 1, 1],
+        )
+        self.assertEqual(row["cancellation_rate"], 0.2)
+        self.assertEqual(row["no_show_rate"], 0.25)
+        self.assertEqual(row["booked_minutes"], 120)
+        self.assertEqual(row["median_gap_minutes"], 30.0)
+        self.assertEqual(row["heatmap"][0][9], 2)
+        self.assertEqual(row["heatmap"][0][11], 1)
+        self.assertEqual(row["heatmap"][1][23], 1)
+        self.assertEqual(sum(map(sum, row["heatmap"])), 4)
+
+        [department] = self.utilization(group_by="department")["results"]
+        self.assertEqual(department["department_name"], "Cardiology")
+        [total] = self.utilization(group_by="none")["results"]
+        self.assertNotIn("doctor", total)
+        self.assertEqual(total["appointments"], 5)
+
+    @override_settings(TIME_ZONE="Africa/Nairobi")
+    def test_heatmap_uses_local_hours(self):
+        heatmap = self.utilization()["results"][0]["heatmap"]
+        self.assertEqual((heatmap[0][12], heatmap[0][9]), (2, 0))
+
+    def test_pure_python_path_matches(self):
+        from unittest import mock
+        from . import analytics
+
+        day = timezone.localdate()
+        with mock.patch.object(analytics, "np", None):
+            expected = analytics.compute(day - timedelta(days=400), day, "doctor")
+        self.assertEqual(analytics.compute(day - timedelta(days=400), day, "doctor"), expected)
+
+    @override_settings(ANALYTICS_MAX_STALENESS_SECONDS=0)
+    def test_cached_per_window_until_a_change(self):
+        first = self.utilization()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.utilization()["computed_at"], first["computed_at"])
+        Appointment.objects.filter(status="Scheduled", date__year=2025).get().delete()
+        self.assertEqual(self.utilization()["results"][0]["no_show"], 0)
+        self.assertEqual(self.utilization(to="2025-03-08")["results"][0]["appointments"], 4)
+
+    def test_rejects_bad_parameters(self):
+        for params in ({"group_by": "ward"}, {"from": "2025-03-10"}, {"to": "2025-02-30"}):
+            response = self.client.get(reverse('analytics-utilization'), {"to": "2025-03-09", **params})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class AdminTests(APITestSetup):
+    CHANGELISTS = ["patient", "appointment", "medicalrecord", "billing"]
+
+    def setUp(self):
+        super().setUp()
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "secret"))
+
+    def add_rows(self, count):
+        for number in range(count):
+            patient = Patient.objects.create(first_name=f"Extra{number}", last_name="Patient",
+                                             date_of_birth="1985-05-05", phone_number=f"07000{number:05d}",
+                                             email=f"extra{number}@example.com")
+            appointment = Appointment.objects.create(patient=patient, doctor=self.doctor, reason="Checkup",
+                                                     status="Completed", date=self.appointment.date)
+            MedicalRecord.objects.create(patient=patient, doctor=self.doctor, diagnosis="Flu", treatment="Rest")
+            Billing.objects.create(patient=patient, appointment=appointment, amount=100)
+
+    def changelist_queries(self):
+        counts = {}
+        for name in self.CHANGELISTS:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f"admin:patients_{name}_changelist"))
+            self.assertEqual(response.status_code, 200)
+            counts[name] = len(queries)
+        return counts
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        before = self.changelist_queries()
+        self.add_rows(30)
+        self.assertEqual(self.changelist_queries(), before)
+
+    def test_unfiltered_count_is_estimated(self):
+        from unittest import mock
+        from .admin import EstimatedCountPaginator
+
+        self.add_rows(5)
+        url = reverse("admin:patients_appointment_changelist")
+        with mock.patch.object(EstimatedCountPaginator, "exact_count_limit", 0):
+            # No table statistics yet: counted exactly.
+            self.assertEqual(self.client.get(url).context["cl"].result_count, 6)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            Appointment.objects.filter(patient__first_name="Extra2").delete()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.context["cl"].result_count, 6)  # As of ANALYZE
+            self.assertFalse([query for query in queries if "COUNT(" in query["sql"]])
+            response = self.client.get(url, {"status__exact": "Completed"})
+            self.assertEqual(response.context["cl"].result_count, 4)
+
+    def test_date_hierarchy_matches_distinct_dates(self):
+        from .admin import IndexedDatesQuerySet
+
+        for moment in ("2023-06-15 08:00", "2023-06-15 17:00", "2023-11-02 10:00", "2024-01-31 23:30"):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, reason="Checkup", status="Completed",
+                                       date=timezone.make_aware(timezone.datetime.fromisoformat(moment)))
+        indexed = IndexedDatesQuerySet(Appointment)
+        for kind in ("year", "month", "day"):
+            self.assertEqual(indexed.datetimes("date", kind), list(Appointment.objects.datetimes("date", kind)))
+            self.assertEqual(indexed.filter(date__year=2023).datetimes("date", kind, order="DESC"),
+                             list(Appointment.objects.filter(date__year=2023).datetimes("date", kind, order="DESC")))
+        response = self.client.get(reverse("admin:patients_appointment_changelist"))
+        self.assertContains(response, "?date__year=2023")
+
+    def test_forms_do_not_load_every_patient(self):
+        Patient.objects.create(first_name="Zedekiah", last_name="Other", date_of_birth="1970-01-01",
+                               email="zed@example.com")
+        response = self.client.get(reverse("admin:patients_appointment_change", args=[self.appointment.pk]))
+        self.assertContains(response, "admin-autocomplete")
+        self.assertNotContains(response, "Zedekiah")
+        response = self.client.get(reverse("admin:patients_billing_change", args=[self.billing.pk]))
+        self.assertContains(response, "vForeignKeyRawIdAdminField")
+        self.assertNotContains(response, "Zedekiah")
+
+    def test_search_uses_the_search_index(self):
+        response = self.client.get(reverse("admin:patients_patient_changelist"), {"q": "John"})
+        self.assertEqual(list(response.context["cl"].result_list), [self.patient])
+        response = self.client.get(reverse("admin:patients_medicalrecord_changelist"), {"q": "Healthy"})
+        self.assertEqual(list(response.context["cl"].result_list), [self.medical_record])
+
+
+class ResponseCacheTests(APITestSetup):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
+    def test_second_read_is_served_from_cache(self):
+        url = reverse('department-list')
+        first = self.client.get(url, HTTP_ACCEPT="application/json")
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            second = self.client.get(url, HTTP_ACCEPT="application/json")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_matching_etag_returns_not_modified(self):
+        url = reverse('doctor-detail', args=[self.doctor.id])
+        etag = self.client.get(url, HTTP_ACCEPT="application/json")["ETag"]
+        response = self.client.get(url, HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+    def test_writes_invalidate_cached_responses(self):
+        url = reverse('doctor-list')
+        etag = self.client.get(url, HTTP_ACCEPT="application/json")["ETag"]
+        self.department.delete()
+        response = self.client.get(url, HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIsNone(response.json()["results"][0]["department"])
+
+    def test_browsable_api_is_not_cached_and_stats_are_counted(self):
+        self.client.get(reverse('department-list'), HTTP_ACCEPT="text/html")
+        self.client.get(reverse('department-list'), HTTP_ACCEPT="application/json")
+        self.client.get(reverse('department-list'), HTTP_ACCEPT="application/json")
+        stats = self.client.get(reverse('department-cache-stats')).data
+        self.assertEqual(stats, {"hit": 1, "miss": 1, "not_modified": 0})
+
+
+class ExpansionTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        for i in range(8):
+            patient = Patient.objects.create(
+                first_name=f"Exp{i}", last_name="Patient", date_of_birth="1990-01-01",
+                phone_number=f"07100000{i:02d}", email=f"exp{i}@example.com", address="Kisumu"
+            )
+            appointment = Appointment.objects.create(
+                patient=patient, doctor=self.doctor, reason="Expand",
+                date=timezone.now() + timedelta(days=i + 1)
+            )
+            if i % 2:
+                Billing.objects.create(patient=patient, appointment=appointment, amount=100)
+
+    def test_expand_costs_constant_queries(self):
+        url = reverse('appointment-list')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"expand": "patient,doctor.department,billing", "page_size": 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data["results"]
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(rows[0]["doctor"]["department"]["name"], "Cardiology")
+        self.assertEqual(rows[0]["patient"]["email"], "john@example.com")
+        self.assertEqual(rows[0]["billing"]["amount"], "5000.00")
+        self.assertTrue(any(row["billing"] is None for row in rows))
+
+    def test_sparse_fields_limit_output_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('medicalrecord-list'), {"fields": "id,diagnosis,patient.first_name", "expand": "patient"}
+            )
+        row = response.data["results"][0]
+        self.assertEqual(set(row), {"id", "diagnosis", "patient"})
+        self.assertEqual(row["patient"], {"first_name": "John"})
+        self.assertNotIn('"treatment"', queries.captured_queries[-1]["sql"])
+
+    def test_unshaped_requests_are_unchanged(self):
+        response = self.client.get(reverse('billing-detail', args=[self.billing.id]), {"expand": "unknown"})
+        self.assertEqual(response.data["patient"], self.patient.id)
+        response = self.client.get(reverse('doctor-detail', args=[self.doctor.id]), {"expand": "department"})
+        self.assertEqual(response.data["department"]["id"], self.department.id)
+
+
+class TimelineTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        base = timezone.now() + timedelta(days=1)
+        for i in range(6):
+            appointment = Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, reason=f"Visit {i}",
+                date=base + timedelta(days=i)
+            )
+            MedicalRecord.objects.create(
+                patient=self.patient, doctor=self.doctor, diagnosis=f"Note {i}", treatment="-",
+                created_at=base + timedelta(days=i, hours=1)
+            )
+            Billing.objects.create(
+                patient=self.patient, appointment=appointment, amount=10 * i,
+                billing_date=base + timedelta(days=i)
+            )
+
+    def walk(self, params):
+        url = reverse('patient-timeline', args=[self.patient.id])
+        entries, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            entries.extend(response.data["results"])
+            if not response.data["next"]:
+                return entries
+            response = self.client.get(response.data["next"])
+
+    def test_timeline_merges_sources_newest_first_across_pages(self):
+        entries = self.walk({"page_size": 4})
+        self.assertEqual(len(entries), 3 * 6 + 3)
+        keys = [(entry["date"], entry["type"]) for entry in entries]
+        self.assertEqual([entry["date"] for entry in entries], sorted([k[0] for k in keys], reverse=True))
+        self.assertEqual(len({(entry["type"], entry["id"]) for entry in entries}), len(entries))
+        self.assertEqual(entries[0]["type"], "medical_record")
+        self.assertEqual(entries[0]["data"]["diagnosis"], "Note 5")
+
+    def test_type_filter(self):
+        entries = self.walk({"types": "billing", "page_size": 5})
+        self.assertEqual({entry["type"] for entry in entries}, {"billing"})
+        self.assertEqual(len(entries), 7)
+
+    def test_page_reads_a_bounded_number_of_rows(self):
+        url = reverse('patient-timeline', args=[self.patient.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {"page_size": 2})
+        self.assertTrue(all("LIMIT 3" in q["sql"] for q in queries.captured_queries[1:4]))
+
+    def test_rejects_unknown_type_and_bad_cursor(self):
+        url = reverse('patient-timeline', args=[self.patient.id])
+        self.assertEqual(self.client.get(url, {"types": "lab"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"cursor": "zzz"}).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FilteringTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        self.other_doctor = Doctor.objects.create(
+            first_name="Bob", last_name="Jones", specialization="Neurologist",
+            phone_number="0700000001", email="bob@example.com"
+        )
+        self.later = Appointment.objects.create(
+            patient=self.patient, doctor=self.other_doctor,
+            date=timezone.now() + timedelta(days=3), reason="Scan", status="Completed"
+        )
+        Billing.objects.create(
+            patient=self.patient, appointment=self.later, amount=200, payment_status="Paid",
+            billing_date=timezone.now() - timedelta(days=40)
+        )
+
+    def ids(self, name, params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_filters_narrow_each_list(self):
+        self.assertEqual(self.ids('appointment-list', {"doctor": self.doctor.id}), [self.appointment.id])
+        self.assertEqual(self.ids('appointment-list', {"status": "Completed"}), [self.later.id])
+        self.assertEqual(
+            self.ids('appointment-list', {"date__gte": (timezone.now() + timedelta(days=1)).date()}),
+            [self.later.id]
+        )
+        old = (timezone.now() - timedelta(days=30)).isoformat()
+        self.assertEqual(len(self.ids('billing-list', {"billing_date__lt": old})), 1)
+        self.assertEqual(self.ids('billing-list', {"payment_status": "Pending", "amount__gte": 1000}), [self.billing.id])
+        self.assertEqual(self.ids('medicalrecord-list', {"doctor": self.other_doctor.id}), [])
+        self.assertEqual(self.ids('doctor-list', {"department": self.department.id}), [self.doctor.id])
+        self.assertEqual(self.ids('doctor-list', {"specialization": "Neurologist"}), [self.other_doctor.id])
+
+    def test_ordering(self):
+        self.assertEqual(
+            self.ids('appointment-list', {"ordering": "-date"}), [self.later.id, self.appointment.id]
+        )
+        self.assertEqual(self.ids('billing-list', {"ordering": "amount"})[0], self.later.billing.id)
+
+    def test_invalid_values_are_rejected(self):
+        response = self.client.get(reverse('billing-list'), {"amount__gte": "lots", "payment_status": "Owed"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"amount__gte", "payment_status"})
+        response = self.client.get(reverse('appointment-list'), {"date__lt": "soon"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_every_declared_filter_uses_an_index(self):
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from .filters import FieldFilterBackend
+        from .views import AppointmentViewSet, BillingViewSet, DoctorViewSet, MedicalRecordViewSet, PatientViewSet
+
+        samples = {
+            "exact": {"doctor": "1", "patient": "1", "department": "1", "status": "Scheduled",
+                      "payment_status": "Pending", "specialization": "Cardiologist"},
+            "in": {"status": "Scheduled,Completed", "payment_status": "Pending,Paid", "department": "1,2"},
+            "range": {"date": "2025-01-01", "created_at": "2025-01-01", "billing_date": "2025-01-01",
+                      "amount": "100", "last_visit": "2025-01-01", "next_appointment": "2025-01-01",
+                      "outstanding_balance": "100"},
+        }
+        factory = APIRequestFactory()
+        for view in (AppointmentViewSet, BillingViewSet, DoctorViewSet, MedicalRecordViewSet, PatientViewSet):
+            model = view.queryset.model
+            for name, lookups in view.filterset_fields.items():
+                for lookup in lookups:
+                    if lookup == "exact":
+                        param, value = name, samples["exact"][name]
+                    else:
+                        param = f"{name}__{lookup}"
+                        value = samples["in" if lookup == "in" else "range"][name]
+                    request = Request(factory.get("/", {param: value}))
+                    queryset = FieldFilterBackend().filter_queryset(request, model.objects.all(), view)
+                    sql, params = queryset.query.sql_with_params()
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                        plan = [row[-1] for row in cursor.fetchall()]
+                    with self.subTest(model=model.__name__, param=param):
+                        self.assertTrue(plan and all(step.startswith("SEARCH") for step in plan), plan)
+
+
+class AsyncReadPathTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            MedicalRecord.objects.create(
+                patient=self.patient, doctor=self.doctor, diagnosis=f"Flu {i}", treatment="Rest"
+            )
+
+    async def fetch(self, url, params=None):
+        response = await self.async_client.get(url, params or {})
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        return response, json.loads(body)
+
+    async def test_list_streams_same_rows_as_sync_cursor_mode(self):
+        expected = await self.sync_cursor_rows(reverse('medicalrecord-list'))
+        rows, url = [], reverse('async-medicalrecord-list') + "?page_size=2"
+        while url:
+            response, body = await self.fetch(url)
+            self.assertEqual(response["Content-Type"], "application/json")
+            rows.extend(body["results"])
+            url = body["next"]
+        self.assertEqual(rows, expected)
+
+        back = json.loads(b"".join([chunk async for chunk in (
+            await self.async_client.get(body["previous"])
+        ).streaming_content]))
+        self.assertEqual([row["id"] for row in back["results"]], [row["id"] for row in rows[-4:-2]])
+
+    async def sync_cursor_rows(self, url):
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(
+            lambda: self.client.get(url, {"pagination": "cursor", "page_size": 100}).json()["results"]
+        )()
+
+    async def test_filters_and_fields(self):
+        _, body = await self.fetch(
+            reverse('async-appointment-list'), {"doctor": self.doctor.id, "fields": "id,status"}
+        )
+        self.assertEqual(body["results"], [{"id": self.appointment.id, "status": "Scheduled"}])
+        response = await self.async_client.get(reverse('async-appointment-list'), {"status": "Lost"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_detail(self):
+        response = await self.async_client.get(reverse('async-patient-detail', args=[self.patient.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["email"], "john@example.com")
+        response = await self.async_client.get(reverse('async-patient-detail', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.post(reverse('async-patient-list'), {})
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def seed(self, **options):
+        call_command(
+            "seed_hospital", patients=40, doctors=6, departments=3, appointments_per_patient=3,
+            today="2025-03-01", stdout=StringIO(), **options
+        )
+
+    def snapshot(self):
+        return (
+            list(Patient.objects.order_by("email").values_list("email", "date_of_birth", "phone_number")),
+            list(Appointment.objects.order_by("doctor__email", "date").values_list(
+                "doctor__email", "patient__email", "date", "status"
+            )),
+            list(Billing.objects.order_by("billing_date", "amount").values_list("billing_date", "amount")),
+        )
+
+    def test_seed_is_reproducible_and_consistent(self):
+        self.seed(seed=7)
+        first = self.snapshot()
+        self.assertEqual(Patient.objects.count(), 40)
+        self.assertEqual(Appointment.objects.count(), 120)
+        self.assertEqual(MedicalRecord.objects.count(), Appointment.objects.filter(status="Completed").count())
+        self.assertEqual(Billing.objects.count(), MedicalRecord.objects.count())
+        self.assertFalse(Appointment.objects.filter(status="Scheduled", date__lt=timezone.make_aware(timezone.datetime(2025, 3, 1))).exists())
+        from . import rollups
+        self.assertEqual(rollups.reconcile(dry_run=True), 0)
+
+        from .scheduling import find_batch_conflicts
+        bookings = [
+            (a.doctor_id, a.date, timedelta(minutes=a.duration_minutes), a.pk)
+            for a in Appointment.objects.exclude(status="Cancelled")
+        ]
+        self.assertEqual([c for c in find_batch_conflicts(bookings) if c is not None], [])
+
+        for model in (Billing, MedicalRecord, Appointment, Patient, Doctor, Department):
+            model.objects.all().delete()
+        self.seed(seed=7)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_benchmark_writes_results_and_fails_on_regression(self):
+        self.seed(seed=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "results.json")
+            call_command("benchmark_api", iterations=3, warmup=1, output=output, stdout=StringIO())
+            with open(output) as handle:
+                results = json.load(handle)["endpoints"]
+            # List and detail of the six models, plus the (empty) job and duplicate lists
+            self.assertEqual(len(results), 14)
+            self.assertGreater(results["appointment-list"]["queries"], 0)
+            self.assertGreater(results["patient-list"]["queries"], 0)
+
+            for row in results.values():
+                row["p95_ms"] = 0.0001
+            baseline = os.path.join(tmp, "baseline.json")
+            with open(baseline, "w") as handle:
+                json.dump({"endpoints": results}, handle)
+            with self.assertRaisesMessage(CommandError, "regressed"):
+                call_command(
+                    "benchmark_api", iterations=3, warmup=0, output=output, baseline=baseline,
+                    endpoint=["patient-list"], stdout=StringIO()
+                )
+
+
+class BenchmarkQueryCountTests(TestCase):
+    databases = {"default", "replica"}
+
+    def test_queries_are_counted_on_every_alias(self):
+        from .management.commands.benchmark_api import count_queries
+
+        with count_queries() as queries:
+            for alias in ("default", "replica"):
+                with connections[alias].cursor() as cursor:
+                    cursor.execute("SELECT 1")
+        self.assertEqual(queries.count, 2)
+
+
+class InstrumentationTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        from .instrumentation import registry
+        registry.reset()
+
+    def test_server_timing_header_counts_queries(self):
+        response = self.client.get(reverse('appointment-list'))
+        timing = dict(
+            (part.split(";")[0].strip(), part) for part in response["Server-Timing"].split(",")
+        )
+        self.assertEqual(set(timing), {"total", "db", "serialize"})
+        self.assertIn('desc="2 queries"', timing["db"])
+
+    def test_async_views_are_instrumented_too(self):
+        response = self.client.get(reverse('async-patient-detail', args=[self.patient.id]))
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+    def test_metrics_endpoint_exposes_histograms_per_view(self):
+        self.client.get(reverse('patient-list'))
+        self.client.get(reverse('patient-list'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_count{view="patient-list"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{view="patient-list",le="2"} 2', body)
+
+    def test_requests_over_budget_are_logged_with_slowest_statements(self):
+        with self.settings(REQUEST_QUERY_BUDGET=1):
+            with self.assertLogs('patients.instrumentation', level='WARNING') as logs:
+                self.client.get(reverse('billing-list'))
+        self.assertIn("billing-list", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+class DatabaseConfigurationTests(TestCase):
+    def test_pragmas_and_transaction_mode_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_router_reads_from_replica_outside_transactions(self):
+        from unittest import mock
+        from .routers import PrimaryReplicaRouter
+
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_write(Patient), "default")
+        # Tests run inside a transaction, so reads stay on the primary.
+        self.assertEqual(router.db_for_read(Patient), "default")
+        with mock.patch.object(connection, "in_atomic_block", False):
+            self.assertEqual(router.db_for_read(Patient), "replica")
+        self.assertFalse(router.allow_migrate("replica", "patients"))
+
+    def test_no_persistent_connections_under_asgi(self):
+        import subprocess
+        import sys
+        from django.conf import settings
+
+        script = (
+            "import hospital_patient_management.asgi; from django.conf import settings; "
+            "print(sorted({alias['CONN_MAX_AGE'] for alias in settings.DATABASES.values()}))"
+        )
+        env = {name: value for name, value in os.environ.items() if name != "HOSPITAL_ASGI"}
+        result = subprocess.run(
+            [sys.executable, "-c", script], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "[0]")
+        self.assertEqual(connection.settings_dict["CONN_MAX_AGE"], 600)
+
+
+class FastPathParityTests(APITestSetup):
+    def setUp(self):
+        super().setUp()
+        Doctor.objects.create(
+            first_name="Zoë", last_name="Ngũgĩ", specialization="Surgeon", phone_number="0700000002",
+            email="zoe@example.com"
+        )
+        patient = Patient.objects.create(
+            first_name="Ḿary", last_name="O'Neil \"Jr\"", date_of_birth="1985-06-30",
+            phone_number="0700000003", email="mary@example.com", address="Line one\u2028line two\n\ttab"
+        )
+        appointment = Appointment.objects.create(
+            patient=patient, doctor=self.doctor, date=timezone.now() + timedelta(days=2, microseconds=7),
+            reason="", status="Cancelled"
+        )
+        MedicalRecord.objects.create(patient=patient, doctor=None, diagnosis="Flu ☃", treatment="")
+        Billing.objects.create(patient=patient, appointment=appointment, amount="12.50", payment_status="Paid")
+
+    def assertSameBytes(self, url, params=None):
+        outputs = []
+        for enabled in (False, True):
+            cache.clear()
+            with self.settings(SERIALIZER_FAST_PATH=enabled):
+                response = self.client.get(url, params or {})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            outputs.append(response.content)
+        self.assertEqual(outputs[0], outputs[1], url)
+
+    def test_every_list_endpoint_renders_identical_bytes(self):
+        for name in ('department-list', 'doctor-list', 'patient-list', 'appointment-list',
+                     'medicalrecord-list', 'billing-list'):
+            self.assertSameBytes(reverse(name))
+            self.assertSameBytes(reverse(name), {"page_size": 1})
+
+    def test_parity_with_cursor_fields_search_and_ordering(self):
+        self.assertSameBytes(reverse('appointment-list'), {"pagination": "cursor", "page_size": 1})
+        self.assertSameBytes(reverse('billing-list'), {"fields": "amount,billing_date", "ordering": "-amount"})
+        self.assertSameBytes(reverse('patient-list'), {"search": "mary"})
+        self.assertSameBytes(reverse('medicalrecord-list'), {"search": "flu", "pagination": "cursor"})
+
+    def test_expand_falls_back_to_serializers(self):
+        response = self.client.get(reverse('appointment-list'), {"expand": "doctor"})
+        self.assertEqual(response.data["results"][0]["doctor"]["email"], "alice@example.com")
@@ -0,0 +1,105 @@
+import base64
+import heapq
+import json
+from itertools import islice
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .archive import ARCHIVES
+from .models import Appointment, MedicalRecord, Billing
+from .serializers import AppointmentSerializer, MedicalRecordSerializer, BillingSerializer
+
+
+class Source:
+    def __init__(self, name, rank, model, date_field, serializer_class):
+        self.name = name
+        self.rank = rank
+        self.model = model
+        self.date_field = date_field
+        self.serializer_class = serializer_class
+
+    def rows(self, patient_id, position, limit):
+        """
+        Up to ``limit`` of the patient's rows strictly after ``position`` in
+        timeline order (newest first, ties broken by source rank then id),
+        read with one seek on the ``(patient, date)`` index of the live
+        table and, for archived sources, one on the archive table.
+        """
+        streams = [self._seek(self.model.objects.all(), patient_id, position, limit)]
+        if self.model in ARCHIVES:
+            archived = self._seek(ARCHIVES[self.model].objects.all(), patient_id, position, limit)
+            streams.append(obj.to_live() for obj in archived)
+        key = lambda obj: (getattr(obj, self.date_field), obj.pk)  # noqa: E731
+        for obj in islice(heapq.merge(*streams, key=key, reverse=True), limit):
+            yield (getattr(obj, self.date_field), self.rank, obj.pk, self, obj)
+
+    def _seek(self, queryset, patient_id, position, limit):
+        queryset = queryset.filter(patient_id=patient_id)
+        if position is not None:
+            when, rank, pk = position
+            before = Q(**{f'{self.date_field}__lt': when})
+            if self.rank < rank:
+                queryset = queryset.filter(**{f'{self.date_field}__lte': when})
+            elif self.rank > rank:
+                queryset = queryset.filter(before)
+            else:
+                queryset = queryset.filter(before | Q(**{self.date_field: when, 'pk__lt': pk}))
+        return queryset.order_by(f'-{self.date_field}', '-pk')[:limit]
+
+
+SOURCES = {
+    source.name: source for source in (
+        Source('appointment', 2, Appointment, 'date', AppointmentSerializer),
+        Source('medical_record', 1, MedicalRecord, 'created_at', MedicalRecordSerializer),
+        Source('billing', 0, Billing, 'billing_date', BillingSerializer),
+    )
+}
+
+
+def merged_page(patient_id, types, position, page_size):
+    """
+    The next ``page_size + 1`` timeline entries. Each source is asked for at
+    most that many rows, so a page never reads more than
+    ``len(types) * (page_size + 1)`` rows however long the chart is.
+    """
+    streams = [SOURCES[name].rows(patient_id, position, page_size + 1) for name in types]
+    key = lambda entry: (entry[0], entry[1], entry[2])  # noqa: E731
+    return list(islice(heapq.merge(*streams, key=key, reverse=True), page_size + 1))
+
+
+def encode_position(entry):
+    when, rank, pk = entry[:3]
+    token = json.dumps([when.isoformat(), rank, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+
+def decode_position(token):
+    """``(datetime, rank, pk)`` from a cursor token; raises ``ValueError`` if malformed."""
+    try:
+        token += '=' * (-len(token) % 4)
+        when, rank, pk = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        when = parse_datetime(when)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if when is None or not isinstance(rank, int) or not isinstance(pk, int):
+        raise ValueError('Invalid cursor')
+    return when, rank, pk
+
+
+def serialize(entries, context):
+    """Serialize page entries with each source's own serializer, one batch per source."""
+    by_source = {}
+    for entry in entries:
+        by_source.setdefault(entry[3].name, []).append(entry)
+    rows = {}
+    for name, items in by_source.items():
+        serializer = SOURCES[name].serializer_class([entry[4] for entry in items], many=True, context=context)
+        for entry, row in zip(items, serializer.data):
+            rows[(name, entry[2])] = row
+
+    results = []
+    for when, rank, pk, source, obj in entries:
+        row = rows[(source.name, pk)]
+        results.append({'type': source.name, 'id': pk, 'date': row[source.date_field], 'data': row})
+    return results
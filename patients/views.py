@@ -1,37 +1,314 @@
-from rest_framework import viewsets
-from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing
+import os
+from datetime import datetime, time, timedelta
+from django.db.models import Q
+from django.http import FileResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from .models import Department, Doctor, Patient, Appointment, MedicalRecord, Billing, Job, SuspectedDuplicate
 from .serializers import (
     DepartmentSerializer, DoctorSerializer, PatientSerializer,
-    AppointmentSerializer, MedicalRecordSerializer, BillingSerializer
+    AppointmentSerializer, MedicalRecordSerializer, BillingSerializer, JobSerializer,
+    SuspectedDuplicateSerializer
 )
+from .pagination import KeysetPagination, OptionalCursorPagination
+from .bulk import BulkModelMixin
+from .scheduling import MAX_SEARCH_WINDOW, find_batch_conflicts, free_slots
+from .search import search
+from .export import ExportMixin
+from . import billing, duplicates, rollups
+from .caching import CachedResponseMixin
+from .expansion import ShapedQuerysetMixin
+from .fastpath import FastListMixin
+from . import timeline
+from .filters import RANGE_LOOKUPS, FieldFilterBackend
+from .archive import ArchiveReadThroughMixin
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+def parse_query_datetime(request, name, default=None):
+    value = request.query_params.get(name)
+    if not value:
+        if default is None:
+            raise ValidationError({name: ["This parameter is required."]})
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        parsed = datetime.combine(day, time.min) if day is not None else None
+    if parsed is None:
+        raise ValidationError({name: ["Enter a valid date or datetime."]})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class DepartmentViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     
 
-class DoctorViewSet(viewsets.ModelViewSet):
+class DoctorViewSet(CachedResponseMixin, FastListMixin, ShapedQuerysetMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
+    # Deleting a department nulls doctor.department without post_save
+    cache_depends_on = (Department,)
+    filter_backends = [FieldFilterBackend, OrderingFilter]
+    filterset_fields = {
+        'department': ['exact', 'in'],
+        'specialization': ['exact'],
+    }
+    ordering_fields = ['id', 'specialization']
+
+    @action(detail=True, methods=['get'], url_path='free-slots')
+    def free_slots(self, request, pk=None):
+        doctor = self.get_object()
+        start = parse_query_datetime(request, 'from', default=timezone.now())
+        end = parse_query_datetime(request, 'to', default=start + timedelta(days=7))
+        try:
+            minutes = int(request.query_params.get('duration', 30))
+        except ValueError:
+            raise ValidationError({'duration': ["A valid integer is required."]})
+        if minutes <= 0:
+            raise ValidationError({'duration': ["Ensure this value is greater than 0."]})
+        if end <= start:
+            raise ValidationError({'to': ["Must be after 'from'."]})
+        if end - start > MAX_SEARCH_WINDOW:
+            raise ValidationError({'to': [f"Search window cannot exceed {MAX_SEARCH_WINDOW.days} days."]})
 
+        gaps = free_slots(doctor.pk, start, end, timedelta(minutes=minutes))
+        return Response({
+            'doctor': doctor.pk,
+            'from': start,
+            'to': end,
+            'duration': minutes,
+            'slots': [{'start': begins, 'end': ends} for begins, ends in gaps],
+        })
 
-class PatientViewSet(viewsets.ModelViewSet):
+
+class PatientViewSet(FastListMixin, BulkModelMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
+    filter_backends = [FieldFilterBackend, OrderingFilter]
+    filterset_fields = {
+        'last_visit': RANGE_LOOKUPS,
+        'next_appointment': RANGE_LOOKUPS,
+        'outstanding_balance': RANGE_LOOKUPS,
+    }
+    ordering_fields = ['id', 'outstanding_balance', 'next_appointment', 'last_visit']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = search(queryset, self.request.query_params.get('search'))
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        patient = self.get_object()
+        types = request.query_params.get('types')
+        types = [name.strip() for name in types.split(',') if name.strip()] if types else list(timeline.SOURCES)
+        unknown = [name for name in types if name not in timeline.SOURCES]
+        if unknown or not types:
+            raise ValidationError({'types': [f"Choose from: {', '.join(timeline.SOURCES)}."]})
 
+        position = None
+        if request.query_params.get('cursor'):
+            try:
+                position = timeline.decode_position(request.query_params['cursor'])
+            except ValueError:
+                raise NotFound(KeysetPagination.invalid_cursor_message)
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+        page_size = KeysetPagination().get_page_size(request)
+        entries = timeline.merged_page(patient.pk, types, position, page_size)
+        next_link = None
+        if len(entries) > page_size:
+            entries = entries[:page_size]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', timeline.encode_position(entries[-1])
+            )
+        return Response({
+            'next': next_link,
+            'results': timeline.serialize(entries, self.get_serializer_context()),
+        })
+
+
+class AppointmentViewSet(FastListMixin, ArchiveReadThroughMixin, ShapedQuerysetMixin, BulkModelMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    bulk_upsert_key = None
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('date', 'id')
+    filter_backends = [FieldFilterBackend, OrderingFilter]
+    filterset_fields = {
+        'doctor': ['exact'],
+        'patient': ['exact'],
+        'status': ['exact', 'in'],
+        'date': RANGE_LOOKUPS,
+    }
+    ordering_fields = ['date', 'id']
+
+    def validate_batch(self, serializer, validated, instances, errors):
+        bookings = []
+        for data, instance in zip(validated, instances):
+            serializer.instance = instance
+            bookings.append(serializer.get_booking(data) if data is not None else None)
+        serializer.instance = None
 
+        for index, conflict in enumerate(find_batch_conflicts(bookings)):
+            if conflict is None:
+                continue
+            if conflict == "batch":
+                message = "Overlaps another appointment for the same doctor in this batch"
+            else:
+                message = f"Doctor already has appointment {conflict} at this time"
+            errors[index] = {**errors[index], api_settings.NON_FIELD_ERRORS_KEY: [message]}
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+
+class MedicalRecordViewSet(FastListMixin, ArchiveReadThroughMixin, ShapedQuerysetMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = MedicalRecord.objects.all()
     serializer_class = MedicalRecordSerializer
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('created_at', 'id')
+    filter_backends = [FieldFilterBackend, OrderingFilter]
+    filterset_fields = {
+        'patient': ['exact'],
+        'doctor': ['exact'],
+        'created_at': RANGE_LOOKUPS,
+    }
+    ordering_fields = ['created_at', 'id']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'export'):
+            queryset = search(queryset, self.request.query_params.get('search'))
+        return queryset
 
 
-class BillingViewSet(viewsets.ModelViewSet):
+class BillingViewSet(FastListMixin, ShapedQuerysetMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Billing.objects.all()
     serializer_class = BillingSerializer
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('billing_date', 'id')
+    filter_backends = [FieldFilterBackend, OrderingFilter]
+    filterset_fields = {
+        'payment_status': ['exact', 'in'],
+        'billing_date': RANGE_LOOKUPS,
+        'amount': RANGE_LOOKUPS,
+    }
+    ordering_fields = ['billing_date', 'amount', 'id']
+
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """Bill completed appointments without a bill, as ``manage.py generate_bills``."""
+        through = request.data.get('through')
+        until = None
+        if through:
+            day = parse_date(str(through))
+            if day is None:
+                raise ValidationError({'through': ["Enter a valid date."]})
+            until = timezone.make_aware(datetime.combine(day + timedelta(days=1), time()))
+        result = billing.generate_bills(until, dry_run=bool(request.data.get('dry_run')))
+        return Response({**result, 'amount': f"{result['amount']:.2f}"})
+
+    @action(detail=False, methods=['get'])
+    def report(self, request):
+        group_by = request.query_params.get('group_by', 'department')
+        interval = request.query_params.get('interval', 'day')
+        if group_by not in rollups.GROUP_BY:
+            raise ValidationError({'group_by': [f"Choose one of: {', '.join(rollups.GROUP_BY)}."]})
+        if interval not in rollups.INTERVALS:
+            raise ValidationError({'interval': [f"Choose one of: {', '.join(rollups.INTERVALS)}."]})
+        bounds = {}
+        for param, name in (('from', 'start'), ('to', 'end')):
+            if request.query_params.get(param):
+                bounds[name] = parse_date(request.query_params[param])
+                if bounds[name] is None:
+                    raise ValidationError({param: ["Enter a valid date."]})
+        return Response({
+            'group_by': group_by,
+            'interval': interval,
+            'results': rollups.report(group_by, interval, **bounds),
+        })
+
+
+class JobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    ``POST`` ``{"kind": ..., "params": {...}}`` queues a background job for
+    ``manage.py run_workers``; poll ``/api/jobs/{id}/`` for its status and
+    progress, and fetch file results from ``download``.
+    """
+    queryset = Job.objects.order_by('-id')
+    serializer_class = JobSerializer
+    filter_backends = [FieldFilterBackend]
+    filterset_fields = {
+        'status': ['exact', 'in'],
+    }
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        response['Location'] = reverse('job-detail', args=[response.data['id']], request=request)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != "Succeeded" or not job.result_file or not os.path.exists(job.result_file):
+            raise NotFound("This job has no result file.")
+        filename = os.path.basename(job.result_file).split('-', 1)[-1]
+        return FileResponse(open(job.result_file, 'rb'), as_attachment=True, filename=filename)
+
+
+class DuplicateViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Suspected duplicate patients, best match first; open ones unless
+    ``?status=`` says otherwise, and ``?patient=<id>`` for one patient's.
+    ``POST .../dismiss/`` marks a pair as not a duplicate for good;
+    ``POST .../merge/`` with ``{"keep": <id>}`` (default: the older patient)
+    moves the other patient's appointments, records and bills over and
+    deletes it.
+    """
+    queryset = SuspectedDuplicate.objects.select_related('patient', 'other').order_by('-score', 'id')
+    serializer_class = SuspectedDuplicateSerializer
+    filter_backends = [FieldFilterBackend]
+    filterset_fields = {
+        'status': ['exact', 'in'],
+        'score': RANGE_LOOKUPS,
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            if not any(name.startswith('status') for name in self.request.query_params):
+                queryset = queryset.filter(status="Open")
+            patient = self.request.query_params.get('patient')
+            if patient:
+                if not patient.isdigit():
+                    raise ValidationError({'patient': ["Enter a patient id."]})
+                queryset = queryset.filter(Q(patient_id=patient) | Q(other_id=patient))
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def dismiss(self, request, pk=None):
+        pair = self.get_object()
+        pair.status = "Dismissed"
+        pair.save(update_fields=['status'])
+        return Response(self.get_serializer(pair).data)
 
+    @action(detail=True, methods=['post'])
+    def merge(self, request, pk=None):
+        pair = self.get_object()
+        keep = request.data.get('keep', pair.patient_id)
+        if str(keep) not in (str(pair.patient_id), str(pair.other_id)):
+            raise ValidationError({'keep': ["Must be one of the pair's patient ids."]})
+        keep, duplicate = (pair.patient, pair.other) if str(keep) == str(pair.patient_id) else (pair.other, pair.patient)
+        removed = duplicate.pk
+        moved = duplicates.merge(keep, duplicate)
+        return Response({'kept': keep.pk, 'removed': removed, 'moved': moved})